@@ -0,0 +1,37 @@
+from django.contrib import admin
+
+from chartforge.models import Chart, ChartTemplate
+
+
+@admin.register(ChartTemplate)
+class ChartTemplateAdmin(admin.ModelAdmin):
+    list_display = ('name', 'chart_class')
+    search_fields = ('name',)
+
+    def get_queryset(self, request):
+        # the configs are only needed on the change form
+        queryset = super().get_queryset(request)
+        if request.resolver_match and request.resolver_match.url_name.endswith('changelist'):
+            queryset = queryset.defer(
+                'chart_config', 'example_data', 'chart_config_blob', 'example_data_blob')
+        return queryset
+
+
+@admin.register(Chart)
+class ChartAdmin(admin.ModelAdmin):
+    list_display = ('name', 'slug', 'chart_type', 'publish', 'author')
+    list_filter = ('publish',)
+    list_select_related = ('chart_type', 'author')
+    search_fields = ('name', 'slug')
+    prepopulated_fields = {'slug': ('name',)}
+    raw_id_fields = ('chart_type', 'author')
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if request.resolver_match and request.resolver_match.url_name.endswith('changelist'):
+            queryset = queryset.defer(
+                'config', 'config_blob',
+                'chart_type__chart_config', 'chart_type__example_data',
+                'chart_type__chart_config_blob', 'chart_type__example_data_blob')
+        return queryset
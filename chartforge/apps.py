@@ -1,6 +1,7 @@
 from importlib import import_module
 from django.apps import AppConfig
 
+from chartforge.registry import charts_registry
 from chartforge.settings import ChartForgeSettings
 
 
@@ -34,9 +35,41 @@ class ChartForgeConfig(AppConfig):
                 }
             }
 
+        With the ``lazy_load`` setting the modules are queued in the registry
+        instead, and imported the first time one of their charts is looked up.
+
+        When the ``manifest`` setting points to a file written by the
+        ``chartforge_manifest`` command, only the modules listed in it are
+        loaded and nothing is probed.
+
+        With the ``instrumentation`` and ``statsd`` settings, metrics are
+        sent to statsd.
         """
         self.settings = ChartForgeSettings()
 
+        if self.settings.instrumentation and self.settings.statsd:
+            from chartforge.instrumentation import StatsdExporter
+            StatsdExporter(**self.settings.statsd).connect()
+
+        if self.settings.manifest:
+            from chartforge.manifest import load_manifest, read_manifest
+            manifest = read_manifest(self.settings.manifest)
+            if manifest is not None:
+                load_manifest(manifest, lazy=self.settings.lazy_load)
+                return
+
+        if self.settings.lazy_load:
+            for entry in self.settings.chart_apps:
+                charts_registry.add_lazy(entry, entry)
+                charts_registry.add_lazy(entry, '%s.charts' % entry, required=False)
+            return
+
+        self.import_chart_apps()
+
+    def import_chart_apps(self):
+        """
+        Import every entry in the chart_apps setting and its charts module.
+        """
         for entry in self.settings.chart_apps:
             # import entry, which should evaluate all the @chartforge() charts
             import_module(entry)
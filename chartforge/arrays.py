@@ -0,0 +1,153 @@
+"""
+Support for NumPy arrays and columnar series data in chart configs. NumPy is
+optional, without it ``ColumnarSeries`` falls back to plain lists.
+"""
+import json
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def is_array(obj):
+    """
+    Check if ``obj`` is a NumPy array or scalar.
+
+    :rtype: bool
+    """
+    return numpy is not None and isinstance(obj, (numpy.ndarray, numpy.generic))
+
+
+def _prepare(arr):
+    """
+    Convert an array into something Highcharts understands: datetimes become
+    milliseconds since the epoch.
+    """
+    arr = numpy.asarray(arr)
+    if arr.dtype.kind == 'M':
+        missing = numpy.isnat(arr)
+        arr = arr.astype('datetime64[ms]').astype('int64')
+        if missing.any():
+            arr = arr.astype(object)
+            arr[missing] = None
+    return arr
+
+
+def _is_nan_value(value):
+    return isinstance(value, float) and value != value
+
+
+_is_nan = numpy.frompyfunc(_is_nan_value, 1, 1) if numpy is not None else None
+
+
+def to_list(arr):
+    """
+    Convert an array to nested lists. NaN and NaT values become None, which
+    Highcharts renders as gaps.
+
+    :param arr: A NumPy array or scalar
+    :rtype: list
+    """
+    arr = _prepare(arr)
+    if arr.dtype.kind in 'fc':
+        missing = numpy.isnan(arr)
+    elif arr.dtype.kind == 'O':
+        # mixed columns, like datetimes with gaps next to floats
+        missing = _is_nan(arr).astype(bool)
+    else:
+        return arr.tolist()
+    if missing.any():
+        arr = arr.astype(object)
+        arr[missing] = None
+    return arr.tolist()
+
+
+def encode_array(arr):
+    """
+    Encode an array to a JSON string. Numeric arrays are written by orjson
+    directly from the array buffer when it's installed, otherwise the array
+    is converted with ``tolist()`` and encoded by the C json encoder.
+
+    :param arr: A NumPy array
+    :rtype: str
+    """
+    arr = _prepare(arr)
+    if orjson is not None and arr.dtype.kind in 'biuf':
+        # orjson only takes native byte order and has no float16
+        if arr.dtype.kind == 'f' and arr.dtype.itemsize < 4:
+            arr = arr.astype('float32')
+        elif not arr.dtype.isnative:
+            arr = arr.astype(arr.dtype.newbyteorder('='))
+        return orjson.dumps(
+            numpy.ascontiguousarray(arr),
+            option=orjson.OPT_SERIALIZE_NUMPY).decode('utf-8')
+    return json.dumps(to_list(arr))
+
+
+class ColumnarSeries:
+    """
+    Series data stored as columns instead of a list of points. Serialized in
+    Highcharts' compact array format, one column gives ``[y, ...]`` and more
+    columns give ``[[x, y], ...]`` (or ``[[x, open, high, low, close], ...]``
+    for OHLC series).
+
+        ColumnarSeries(timestamps, values)
+
+    """
+    def __init__(self, *columns):
+        assert columns, 'At least one column is required'
+        if numpy is not None:
+            columns = tuple(_prepare(c) for c in columns)
+        lengths = set(len(c) for c in columns)
+        assert len(lengths) == 1, 'All columns must be the same length'
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.columns[0])
+
+    def to_array(self):
+        """
+        Get the points as a single NumPy array. Columns of different kinds,
+        like category strings and numbers, give an object array.
+
+        :rtype: numpy.ndarray
+        """
+        assert numpy is not None, 'NumPy is required for to_array()'
+        if len(self.columns) == 1:
+            return self.columns[0]
+        if all(c.dtype.kind in 'biuf' for c in self.columns):
+            return numpy.column_stack(self.columns)
+        # column_stack would cast everything to one type, like numbers next
+        # to category strings becoming strings, so keep each value as it is
+        arr = numpy.empty((len(self), len(self.columns)), dtype=object)
+        for i, column in enumerate(self.columns):
+            arr[:, i] = column.astype(object)
+        return arr
+
+    def tolist(self):
+        """
+        Get the points as nested lists.
+
+        :rtype: list
+        """
+        if numpy is not None:
+            return to_list(self.to_array())
+        if len(self.columns) == 1:
+            return list(self.columns[0])
+        return [list(point) for point in zip(*self.columns)]
+
+    def encode(self):
+        """
+        Encode the points to a JSON string.
+
+        :rtype: str
+        """
+        if numpy is not None:
+            return encode_array(self.to_array())
+        return json.dumps(self.tolist())
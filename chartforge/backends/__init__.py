@@ -1,4 +1,4 @@
-from .base import BackendBase, BackendManager
+from .base import AsyncBackendBase, BackendBase, BackendManager, get_backend_manager
 from .dynamic_chart import DynamicChartBackend
 from .chart_model import ChartModelBackend
 from .static_chart import StaticChartBackend
@@ -6,9 +6,11 @@ from .static_chart import StaticChartBackend
 
 # Make the paths shorter when listing these in backends setting
 __all__ = [
+    'AsyncBackendBase',
     'BackendBase',
     'BackendManager',
     'DynamicChartBackend',
     'ChartModelBackend',
-    'StaticChartBackend'
+    'StaticChartBackend',
+    'get_backend_manager'
 ]
@@ -1,6 +1,21 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from functools import partial
 from importlib import import_module
 from chartforge.settings import ChartForgeSettings
 from chartforge.base import Chart, ChartTemplate, RenderType, ExportType
+from chartforge.decimation import prepare_chart
+from chartforge.export import export_chart
+from chartforge.instrumentation import enabled as instrumentation_enabled, instrument
+from chartforge.render import get_render_pool, render_chart
+from chartforge.utils import call_in_thread, run_sync
+
+
+logger = logging.getLogger('chartforge')
 
 
 class BackendBase:
@@ -9,8 +24,12 @@ class BackendBase:
 
     Override any method to enable it's functionality. All backend classes
     should be included in the ``backends`` setting.
+
+    Set ``timeout`` to override the ``backend_timeout`` setting for slow
+    backends.
     """
     verbose_name = None
+    timeout = None
 
     def __init__(self):
         if self.verbose_name is None:
@@ -54,6 +73,17 @@ class BackendBase:
         return None
     get_chart.disabled = True
 
+    def get_chart_version(self, slug=None):
+        """
+        Get a cheap value that changes whenever a chart is saved, without
+        loading its config. Used for the ETags of chart data views.
+
+        :param str slug: The chart's slug identifier
+        :return: A str, or None when the chart doesn't exist
+        """
+        return None
+    get_chart_version.disabled = True
+
     def save_chart(self, chart):
         """
         Save a chart instance to remote or local persistent storage.
@@ -85,6 +115,207 @@ class BackendBase:
         return None
     export_chart.disabled = True
 
+    def get_charts_by_slugs(self, slugs):
+        """
+        Get many charts by slug. Calls ``get_chart()`` for each slug unless
+        overridden with a native batch lookup.
+
+        :param list[str] slugs: The chart slugs
+        :return: dict of slug to Chart, missing slugs are left out
+        """
+        charts = {}
+        for slug in slugs:
+            chart = self.get_chart(slug)
+            if chart is not None:
+                charts[slug] = chart
+        return charts
+    get_charts_by_slugs.disabled = True
+
+    def save_charts(self, charts):
+        """
+        Save many charts. Calls ``save_chart()`` for each chart unless
+        overridden with a native batch save.
+
+        :param list[Chart] charts: The charts to save
+        """
+        for chart in charts:
+            self.save_chart(chart)
+    save_charts.disabled = True
+
+    def render_charts(self, charts, render_type=None):
+        """
+        Render many charts. Calls ``render_chart()`` for each chart unless
+        overridden.
+
+        :param list[Chart] charts: The charts to render
+        :param RenderType render_type: The render type
+        :rtype: list[bytes]
+        """
+        return [self.render_chart(chart, render_type) for chart in charts]
+    render_charts.disabled = True
+
+    def export_charts(self, charts, export_type=None):
+        """
+        Export many charts. Calls ``export_chart()`` for each chart unless
+        overridden.
+
+        :param list[Chart] charts: The charts to export
+        :param ExportType export_type: The export type
+        :rtype: list[bytes]
+        """
+        return [self.export_chart(chart, export_type) for chart in charts]
+    export_charts.disabled = True
+
+
+# Batch methods and the single item method their default calls
+BATCH_METHODS = {
+    'get_charts_by_slugs': 'get_chart',
+    'save_charts': 'save_chart',
+    'render_charts': 'render_chart',
+    'export_charts': 'export_chart'
+}
+
+
+class AsyncBackendBase(BackendBase):
+    """
+    Abstract base class for backends with a native asyncio api. Override the
+    ``a`` prefixed methods, like ``aget_charts()``, to enable them.
+
+    The sync methods run the async ones on a new event loop, so these
+    backends also work from sync code and sync backend managers.
+    """
+    async def aget_chart_templates(self):
+        return []
+    aget_chart_templates.disabled = True
+
+    async def aget_chart_template(self, full_name=None):
+        return None
+    aget_chart_template.disabled = True
+
+    async def aget_charts(self):
+        return []
+    aget_charts.disabled = True
+
+    async def aget_chart(self, slug=None):
+        return None
+    aget_chart.disabled = True
+
+    async def aget_chart_version(self, slug=None):
+        return None
+    aget_chart_version.disabled = True
+
+    async def asave_chart(self, chart):
+        pass
+    asave_chart.disabled = True
+
+    async def arender_chart(self, chart, render_type=None):
+        return None
+    arender_chart.disabled = True
+
+    async def aexport_chart(self, chart, export_type=None):
+        return None
+    aexport_chart.disabled = True
+
+    async def aget_charts_by_slugs(self, slugs):
+        results = await asyncio.gather(*[self.aget_chart(slug) for slug in slugs])
+        return dict((slug, chart) for slug, chart in zip(slugs, results) if chart is not None)
+    aget_charts_by_slugs.disabled = True
+
+    async def asave_charts(self, charts):
+        await asyncio.gather(*[self.asave_chart(chart) for chart in charts])
+    asave_charts.disabled = True
+
+    async def arender_charts(self, charts, render_type=None):
+        return await asyncio.gather(*[self.arender_chart(c, render_type) for c in charts])
+    arender_charts.disabled = True
+
+    async def aexport_charts(self, charts, export_type=None):
+        return await asyncio.gather(*[self.aexport_chart(c, export_type) for c in charts])
+    aexport_charts.disabled = True
+
+    def get_chart_templates(self):
+        return run_sync(self.aget_chart_templates())
+
+    def get_chart_template(self, full_name=None):
+        return run_sync(self.aget_chart_template(full_name))
+
+    def get_charts(self):
+        return run_sync(self.aget_charts())
+
+    def get_chart(self, slug=None):
+        return run_sync(self.aget_chart(slug))
+
+    def get_chart_version(self, slug=None):
+        return run_sync(self.aget_chart_version(slug))
+
+    def save_chart(self, chart):
+        return run_sync(self.asave_chart(chart))
+
+    def render_chart(self, chart, render_type=None):
+        return run_sync(self.arender_chart(chart, render_type))
+
+    def export_chart(self, chart, export_type=None):
+        return run_sync(self.aexport_chart(chart, export_type))
+
+    def get_charts_by_slugs(self, slugs):
+        return run_sync(self.aget_charts_by_slugs(slugs))
+
+    def save_charts(self, charts):
+        return run_sync(self.asave_charts(charts))
+
+    def render_charts(self, charts, render_type=None):
+        return run_sync(self.arender_charts(charts, render_type))
+
+    def export_charts(self, charts, export_type=None):
+        return run_sync(self.aexport_charts(charts, export_type))
+
+
+def is_enabled(backend, method_name):
+    """
+    Check if a backend overrides a method of the backend api. For async
+    backends the ``a`` prefixed method is checked. Batch methods are enabled
+    when either the batch method or the single item method they fall back to
+    is overridden.
+
+    :param BackendBase backend: The backend
+    :param str method_name: The method name, like 'get_charts'
+    :rtype: bool
+    """
+    prefix = 'a' if isinstance(backend, AsyncBackendBase) else ''
+    if not getattr(getattr(backend, prefix + method_name), 'disabled', False):
+        return True
+    if method_name in BATCH_METHODS:
+        return is_enabled(backend, BATCH_METHODS[method_name])
+    return False
+
+
+def is_async(backend):
+    """
+    Check if a backend has a native async api.
+
+    :param BackendBase backend: The backend
+    :rtype: bool
+    """
+    return isinstance(backend, AsyncBackendBase)
+
+
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def get_executor(max_workers):
+    """
+    Get the thread pool shared by all the backend managers.
+
+    :param int max_workers: The size of the pool
+    :rtype: ThreadPoolExecutor
+    """
+    with _executors_lock:
+        executor = _executors.get(max_workers)
+        if executor is None:
+            executor = _executors[max_workers] = ThreadPoolExecutor(max_workers)
+        return executor
+
 
 def load_backends_from_settings():
     """
@@ -101,14 +332,316 @@ def load_backends_from_settings():
     return backends
 
 
+_manager = None
+
+
+def get_backend_manager():
+    """
+    Get a ``BackendManager`` shared by the whole process, so the backends
+    are only loaded once.
+
+    :rtype: BackendManager
+    """
+    global _manager
+    if _manager is None:
+        _manager = BackendManager()
+    return _manager
+
+
 class BackendManager(BackendBase):
     """
     Primary interface for using backends. Has the same API as ``BackendBase``
     but underneath it delegates to functionality to the installed backends.
+
+    Listing and lookup calls are made on every backend at once from a thread
+    pool. A backend that fails or doesn't answer within its timeout is logged
+    and left out, and results are merged in the order of the ``backends``
+    setting.
+
+    Threads can't be stopped, so a sync call that timed out keeps its pool
+    thread until it returns. While ``max_stuck_calls`` calls to a backend are
+    running past their timeout, that backend is skipped, so one hung backend
+    can't take over the whole pool.
+
+    Every method also has an ``a`` prefixed async version. Async backends are
+    awaited directly and sync backends are called from the thread pool, so
+    sync and async backends can be mixed freely.
     """
-    def __init__(self):
+    max_stuck_calls = 1
+
+    def __init__(self, backends=None):
         """
         Load all backends.
+
+        :param list backends: Backend instances to use instead of the
+            ``backends`` setting
         """
-        self.loaded_backends = load_backends_from_settings()
+        self.settings = ChartForgeSettings()
+        self.loaded_backends = load_backends_from_settings() if backends is None else list(backends)
+        self._running = {}
+        self._running_lock = threading.Lock()
         super().__init__()
+
+    @property
+    def executor(self):
+        return get_executor(self.settings.backend_workers)
+
+    def get_backends(self, method_name):
+        """
+        Get the loaded backends that implement a method.
+
+        :param str method_name: The method name, like 'get_charts'
+        :rtype: list[BackendBase]
+        """
+        return [b for b in self.loaded_backends if is_enabled(b, method_name)]
+
+    def _get_timeout(self, backend):
+        return self.settings.backend_timeout if backend.timeout is None else backend.timeout
+
+    def _method(self, backend, method_name):
+        if not instrumentation_enabled():
+            return getattr(backend, method_name)
+        return instrument(
+            getattr(backend, method_name), 'backend.%s' % method_name, backend.verbose_name)
+
+    def _is_stuck(self, backend):
+        timeout = self._get_timeout(backend)
+        now = time.time()
+        with self._running_lock:
+            started = list(self._running.get(backend, {}).values())
+        return sum(1 for t in started if now - t > timeout) >= self.max_stuck_calls
+
+    def _available(self, method_name):
+        backends = []
+        for backend in self.get_backends(method_name):
+            if not is_async(backend) and self._is_stuck(backend):
+                logger.warning(
+                    '%s.%s skipped, earlier calls are still running past their timeout',
+                    backend.verbose_name, method_name)
+            else:
+                backends.append(backend)
+        return backends
+
+    def _run(self, backend, method_name, args, kwargs):
+        token = object()
+        with self._running_lock:
+            self._running.setdefault(backend, {})[token] = time.time()
+        try:
+            return call_in_thread(self._method(backend, method_name), *args, **kwargs)
+        finally:
+            with self._running_lock:
+                del self._running[backend][token]
+
+    def submit(self, backend, method_name, *args, **kwargs):
+        """
+        Call a sync backend method in the thread pool.
+
+        :param BackendBase backend: The backend
+        :param str method_name: The method name, like 'get_charts'
+        :rtype: concurrent.futures.Future
+        """
+        return self.executor.submit(self._run, backend, method_name, args, kwargs)
+
+    def fan_out(self, method_name, *args, **kwargs):
+        """
+        Call a method on every backend that implements it, concurrently.
+
+        :param str method_name: The method name, like 'get_charts'
+        :return: list of (backend, result) tuples in settings order
+        """
+        start = time.time()
+        futures = [
+            (backend, self.submit(backend, method_name, *args, **kwargs))
+            for backend in self._available(method_name)
+        ]
+        results = []
+        for backend, future in futures:
+            remaining = max(0, start + self._get_timeout(backend) - time.time())
+            try:
+                results.append((backend, future.result(remaining)))
+            except FutureTimeoutError:
+                future.cancel()
+                logger.warning('%s.%s timed out', backend.verbose_name, method_name)
+            except Exception:
+                logger.exception('%s.%s failed', backend.verbose_name, method_name)
+        return results
+
+    def acall(self, backend, method_name, *args, **kwargs):
+        """
+        Call a backend method from async code. Awaits the native method of
+        async backends and runs sync backends in the thread pool.
+
+        :param BackendBase backend: The backend
+        :param str method_name: The sync method name, like 'get_charts'
+        :return: awaitable
+        """
+        if is_async(backend):
+            return self._method(backend, 'a%s' % method_name)(*args, **kwargs)
+        return asyncio.wrap_future(
+            self.submit(backend, method_name, *args, **kwargs), loop=asyncio.get_running_loop())
+
+    async def afan_out(self, method_name, *args, **kwargs):
+        """
+        Asyncio version of ``fan_out()``.
+
+        :param str method_name: The method name, like 'get_charts'
+        :return: list of (backend, result) tuples in settings order
+        """
+        backends = self._available(method_name)
+        tasks = [
+            asyncio.wait_for(
+                self.acall(backend, method_name, *args, **kwargs),
+                self._get_timeout(backend))
+            for backend in backends
+        ]
+        results = []
+        for backend, result in zip(backends, await asyncio.gather(*tasks, return_exceptions=True)):
+            if isinstance(result, asyncio.TimeoutError):
+                logger.warning('%s.%s timed out', backend.verbose_name, method_name)
+            elif isinstance(result, Exception):
+                logger.error('%s.%s failed: %r', backend.verbose_name, method_name, result)
+            else:
+                results.append((backend, result))
+        return results
+
+    def _merge(self, results):
+        return [item for _, items in results for item in items]
+
+    def _first(self, results):
+        for _, result in results:
+            if result is not None:
+                return result
+        return None
+
+    def prepare_chart(self, chart):
+        """
+        Decimate a chart's series before rendering or exporting it, see
+        ``chartforge.decimation.prepare_chart()``.
+
+        :param Chart chart: The chart
+        :rtype: Chart
+        """
+        return prepare_chart(chart)
+
+    def get_chart_templates(self):
+        return self._merge(self.fan_out('get_chart_templates'))
+
+    def get_chart_template(self, full_name=None):
+        return self._first(self.fan_out('get_chart_template', full_name))
+
+    def get_charts(self):
+        return self._merge(self.fan_out('get_charts'))
+
+    def get_chart(self, slug=None):
+        return self._first(self.fan_out('get_chart', slug))
+
+    def get_chart_version(self, slug=None):
+        return self._first(self.fan_out('get_chart_version', slug))
+
+    def save_chart(self, chart):
+        """
+        Save the chart with the first backend that supports saving.
+        """
+        for backend in self.get_backends('save_chart'):
+            return backend.save_chart(chart)
+
+    def render_chart(self, chart, render_type=None):
+        """
+        Render the chart with the first backend that supports rendering, or
+        the local render pool when none do. Series are decimated first when
+        the ``max_points`` setting is set.
+        """
+        chart = self.prepare_chart(chart)
+        for backend in self.get_backends('render_chart'):
+            return backend.render_chart(chart, render_type)
+        return render_chart(chart, render_type)
+
+    def export_chart(self, chart, export_type=None):
+        """
+        Export the chart with the first backend that supports exporting, or
+        the precompiled export wrappers when none do. Series are decimated
+        first when the ``max_points`` setting is set.
+        """
+        chart = self.prepare_chart(chart)
+        for backend in self.get_backends('export_chart'):
+            return backend.export_chart(chart, export_type)
+        return export_chart(chart, export_type).content
+
+    def _merge_by_slug(self, slugs, results):
+        # earlier backends in the backends setting take precedence
+        found = {}
+        for _, charts in reversed(results):
+            found.update(charts)
+        return OrderedDict((slug, found[slug]) for slug in slugs if slug in found)
+
+    def get_charts_by_slugs(self, slugs):
+        slugs = list(slugs)
+        return self._merge_by_slug(slugs, self.fan_out('get_charts_by_slugs', slugs))
+
+    def save_charts(self, charts):
+        """
+        Save the charts with the first backend that supports saving.
+        """
+        for backend in self.get_backends('save_charts'):
+            return backend.save_charts(charts)
+
+    def render_charts(self, charts, render_type=None):
+        """
+        Render the charts with the first backend that supports rendering, or
+        in batches with the local render pool when none do.
+        """
+        charts = [self.prepare_chart(chart) for chart in charts]
+        for backend in self.get_backends('render_charts'):
+            return backend.render_charts(charts, render_type)
+        return get_render_pool().render_many(
+            [(chart.config, render_type) for chart in charts])
+
+    def export_charts(self, charts, export_type=None):
+        """
+        Export the charts with the first backend that supports exporting.
+        """
+        charts = [self.prepare_chart(chart) for chart in charts]
+        for backend in self.get_backends('export_charts'):
+            return backend.export_charts(charts, export_type)
+        return [export_chart(chart, export_type).content for chart in charts]
+
+    async def aget_chart_templates(self):
+        return self._merge(await self.afan_out('get_chart_templates'))
+
+    async def aget_chart_template(self, full_name=None):
+        return self._first(await self.afan_out('get_chart_template', full_name))
+
+    async def aget_charts(self):
+        return self._merge(await self.afan_out('get_charts'))
+
+    async def aget_chart(self, slug=None):
+        return self._first(await self.afan_out('get_chart', slug))
+
+    async def aget_chart_version(self, slug=None):
+        return self._first(await self.afan_out('get_chart_version', slug))
+
+    async def asave_chart(self, chart):
+        for backend in self.get_backends('save_chart'):
+            return await self.acall(backend, 'save_chart', chart)
+
+    async def arender_chart(self, chart, render_type=None):
+        chart = self.prepare_chart(chart)
+        for backend in self.get_backends('render_chart'):
+            return await self.acall(backend, 'render_chart', chart, render_type)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, partial(render_chart, chart, render_type))
+
+    async def aexport_chart(self, chart, export_type=None):
+        chart = self.prepare_chart(chart)
+        for backend in self.get_backends('export_chart'):
+            return await self.acall(backend, 'export_chart', chart, export_type)
+        return export_chart(chart, export_type).content
+
+    async def aget_charts_by_slugs(self, slugs):
+        slugs = list(slugs)
+        return self._merge_by_slug(slugs, await self.afan_out('get_charts_by_slugs', slugs))
+
+    async def asave_charts(self, charts):
+        for backend in self.get_backends('save_charts'):
+            return await self.acall(backend, 'save_charts', charts)
@@ -1,7 +1,156 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from chartforge.base import Chart, ChartTemplate
+from chartforge.codec import dumps, loads
+from chartforge.models import Chart as ChartModel, ChartTemplate as ChartTemplateModel
+from chartforge.storage import default_codec
 from .base import BackendBase
 
 
 class ChartModelBackend(BackendBase):
     """
+    Stores charts in the ``chartforge.models.Chart`` model. Batch methods
+    use one query per ``batch_size`` charts instead of one per chart.
+
+    Only the columns that are needed are loaded. Use ``list_charts()`` and
+    ``list_chart_templates()`` for listings, they never load configs and
+    page with keyset cursors so deep pages cost the same as the first one.
 
+    With the ``config_storage`` setting configs are written to the encoded
+    ``config_blob`` field instead of the ``config`` text field. Either one
+    is read, and chart templates are read from their encoded fields too.
     """
+    batch_size = 500
+    page_size = 100
+
+    def _to_chart(self, obj):
+        if obj.config_blob is not None:
+            return Chart(obj.slug, obj.config_blob)
+        return Chart(obj.slug, loads(obj.config))
+
+    def _to_template(self, obj):
+        return ChartTemplate(obj.name, obj.get_chart_config(), obj.name, obj.get_example_data())
+
+    def _config_fields(self, chart):
+        if default_codec() is None:
+            return {'config': dumps(chart.config), 'config_blob': None}
+        return {'config': '', 'config_blob': chart.config}
+
+    def _batches(self, items):
+        for i in range(0, len(items), self.batch_size):
+            yield items[i:i + self.batch_size]
+
+    def _charts(self):
+        return ChartModel.objects.only('pk', 'slug', 'config', 'config_blob')
+
+    def get_chart_templates(self):
+        return [self._to_template(obj) for obj in ChartTemplateModel.objects.order_by('name', 'pk')]
+
+    def get_chart_template(self, full_name=None):
+        obj = ChartTemplateModel.objects.filter(name=full_name).order_by('pk').first()
+        return None if obj is None else self._to_template(obj)
+
+    def get_charts(self):
+        return [self._to_chart(obj) for obj in self._charts().order_by('slug').iterator()]
+
+    def get_chart(self, slug=None):
+        try:
+            return self._to_chart(self._charts().get(slug=slug))
+        except ChartModel.DoesNotExist:
+            return None
+
+    def get_chart_version(self, slug=None):
+        row = ChartModel.objects.filter(slug=slug).values_list('version', 'updated').first()
+        if row is None:
+            return None
+        return '%d-%s' % (row[0], row[1].isoformat())
+
+    def _page(self, queryset, key, after, limit):
+        limit = limit or self.page_size
+        if after is not None:
+            queryset = queryset.filter(**{'%s__gt' % key: after})
+        rows = list(queryset.order_by(key)[:limit + 1])
+        next_cursor = rows[limit - 1][key] if len(rows) > limit else None
+        return rows[:limit], next_cursor
+
+    def list_charts(self, after=None, limit=None, published=None):
+        """
+        List charts without their configs, with the chart type and author
+        joined in the same query.
+
+        :param str after: Cursor from the previous page, the last slug
+        :param int limit: Page size, defaults to ``page_size``
+        :param bool published: Only list published or unpublished charts
+        :return: (list of dicts, cursor for the next page or None)
+        """
+        author_field = 'author__%s' % get_user_model().USERNAME_FIELD
+        queryset = ChartModel.objects.values(
+            'slug', 'name', 'publish', 'chart_type__name', author_field)
+        if published is not None:
+            queryset = queryset.filter(publish=published)
+        rows, cursor = self._page(queryset, 'slug', after, limit)
+        for row in rows:
+            row['chart_type'] = row.pop('chart_type__name')
+            row['author'] = row.pop(author_field)
+        return rows, cursor
+
+    def list_chart_templates(self, after=None, limit=None):
+        """
+        List chart templates without their configs and example data.
+
+        :param int after: Cursor from the previous page, the last id
+        :param int limit: Page size, defaults to ``page_size``
+        :return: (list of dicts, cursor for the next page or None)
+        """
+        queryset = ChartTemplateModel.objects.values('id', 'name', 'chart_class')
+        return self._page(queryset, 'id', after, limit)
+
+    def save_chart(self, chart):
+        fields = self._config_fields(chart)
+        obj, created = ChartModel.objects.get_or_create(
+            slug=chart.slug, defaults=dict(fields, name=chart.slug))
+        if not created:
+            for name, value in fields.items():
+                setattr(obj, name, value)
+            obj.save(update_fields=list(fields))
+
+    def get_charts_by_slugs(self, slugs):
+        slugs = list(slugs)
+        found = {}
+        for batch in self._batches(slugs):
+            for obj in self._charts().filter(slug__in=batch):
+                found[obj.slug] = self._to_chart(obj)
+        return dict((slug, found[slug]) for slug in slugs if slug in found)
+
+    def save_charts(self, charts):
+        configs = dict((chart.slug, self._config_fields(chart)) for chart in charts)
+        slugs = list(configs)
+        with transaction.atomic():
+            existing = {}
+            for batch in self._batches(slugs):
+                for obj in ChartModel.objects.filter(slug__in=batch).only('pk', 'slug', 'version'):
+                    existing[obj.slug] = obj
+
+            # the batch queries skip save(), so version and updated are set here
+            ChartModel.objects.bulk_create([
+                ChartModel(slug=slug, name=slug, version=1, **configs[slug])
+                for slug in slugs if slug not in existing
+            ], batch_size=self.batch_size)
+
+            now = timezone.now()
+            for obj in existing.values():
+                for name, value in configs[obj.slug].items():
+                    setattr(obj, name, value)
+                obj.version += 1
+                obj.updated = now
+            if hasattr(ChartModel.objects, 'bulk_update'):
+                ChartModel.objects.bulk_update(
+                    list(existing.values()), ['config', 'config_blob', 'version', 'updated'],
+                    batch_size=self.batch_size)
+            else:
+                for obj in existing.values():
+                    ChartModel.objects.filter(pk=obj.pk).update(
+                        version=F('version') + 1, updated=now, **configs[obj.slug])
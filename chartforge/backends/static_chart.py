@@ -1,7 +1,252 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from chartforge.base import ChartTemplate
+from chartforge.codec import loads
+from chartforge.settings import ChartForgeSettings
 from .base import BackendBase
 
 
+logger = logging.getLogger('chartforge')
+
+INDEX_VERSION = 1
+
+
 class StaticChartBackend(BackendBase):
     """
+    Serves chart templates from the files in the ``chart_templates``
+    directories.
+
+    Every ``.json`` file is one template, named after its path relative to
+    the directory without the extension. ``.jsonl`` bundles hold one
+    template per line as ``{"name": ..., "config": ..., "verbose_name": ...}``.
+
+    The directories are scanned once into an index of name, path, mtime and
+    byte range, which is saved to the ``static_index`` file when set so later
+    processes skip the scan. A template's bytes are only read and parsed the
+    first time it's requested, and only the parsed template is kept.
+
+    Every ``static_poll_interval`` seconds the directory mtimes are checked,
+    which catches files that were added, removed or replaced by a rename.
+    Every file's own mtime is only checked every
+    ``static_file_poll_interval`` seconds, for files edited in place. Only
+    changed files are indexed again.
 
+    Files that aren't valid templates, like Django templates in the same
+    directory, are logged and skipped until they change.
     """
+    def __init__(self):
+        super().__init__()
+        settings = ChartForgeSettings()
+        self.directories = [os.path.abspath(d) for d in settings.chart_templates]
+        self.index_path = settings.static_index
+        self.poll_interval = settings.static_poll_interval
+        self.file_poll_interval = settings.static_file_poll_interval
+        self._lock = threading.RLock()
+        self._entries = None
+        self._files = {}
+        self._dirs = {}
+        self._parsed = {}
+        self._checked = 0
+        self._files_checked = 0
+
+    # Index
+
+    def _mtime(self, path):
+        try:
+            return os.stat(path).st_mtime
+        except OSError:
+            return None
+
+    def _name(self, directory, path):
+        rel = os.path.relpath(path, directory)
+        return os.path.splitext(rel)[0].replace(os.sep, '/')
+
+    def _index_file(self, directory, path):
+        """
+        Get the index entries for a file as ``(name, path, mtime, offset,
+        length)`` tuples.
+        """
+        stat = os.stat(path)
+        if not stat.st_size:
+            return []
+        if path.endswith('.json'):
+            return [(self._name(directory, path), path, stat.st_mtime, 0, stat.st_size)]
+
+        entries = []
+        offset = 0
+        with open(path, 'rb') as f:
+            for line in f:
+                if line.strip():
+                    name = loads(line)['name']
+                    entries.append((name, path, stat.st_mtime, offset, len(line)))
+                offset += len(line)
+        return entries
+
+    def _scan_dir(self, directory, root):
+        """
+        Index the template files in ``root`` and its subdirectories.
+        """
+        self._dirs[root] = (directory, self._mtime(root))
+        for name in sorted(os.listdir(root)):
+            path = os.path.join(root, name)
+            if os.path.isdir(path):
+                if path not in self._dirs:
+                    self._scan_dir(directory, path)
+            elif name.endswith(('.json', '.jsonl')) and path not in self._files:
+                self._add_file(directory, path)
+
+    def _add_file(self, directory, path):
+        try:
+            entries = self._index_file(directory, path)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning('Skipping chart template bundle %s: %s', path, e)
+            return
+        self._files[path] = (directory, self._mtime(path))
+        for entry in entries:
+            self._entries[entry[0]] = entry
+
+    def _remove_file(self, path):
+        self._files.pop(path, None)
+        for name in [n for n, e in self._entries.items() if e[1] == path]:
+            del self._entries[name]
+            self._parsed.pop(name, None)
+
+    def _load_index(self):
+        if not self.index_path:
+            return False
+        try:
+            with open(self.index_path) as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return False
+        if data.get('version') != INDEX_VERSION or data.get('directories') != self.directories:
+            return False
+        self._entries = dict((e[0], tuple(e)) for e in data['entries'])
+        self._files = dict((p, tuple(v)) for p, v in data['files'].items())
+        self._dirs = dict((p, tuple(v)) for p, v in data['dirs'].items())
+        return True
+
+    def _save_index(self):
+        if not self.index_path:
+            return
+        tmp_path = '%s.%d.tmp' % (self.index_path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'version': INDEX_VERSION,
+                'directories': self.directories,
+                'entries': list(self._entries.values()),
+                'files': self._files,
+                'dirs': self._dirs
+            }, f)
+        os.replace(tmp_path, self.index_path)
+
+    def _check_file(self, path):
+        directory, mtime = self._files[path]
+        current = self._mtime(path)
+        if current == mtime:
+            return False
+        self._remove_file(path)
+        if current is not None:
+            self._add_file(directory, path)
+        return True
+
+    def _refresh(self, check_files):
+        """
+        Pick up files added to, removed from or replaced in directories whose
+        mtime changed. With ``check_files`` every file's mtime is checked too,
+        which catches files edited in place.
+        """
+        changed = False
+        for root, (directory, mtime) in list(self._dirs.items()):
+            current = self._mtime(root)
+            if current == mtime:
+                continue
+            changed = True
+            files = [p for p in self._files if os.path.dirname(p) == root]
+            if current is None:
+                del self._dirs[root]
+                for path in files:
+                    self._remove_file(path)
+            else:
+                for path in files:
+                    self._check_file(path)
+                self._scan_dir(directory, root)
+
+        if check_files:
+            for path in list(self._files):
+                changed = self._check_file(path) or changed
+        return changed
+
+    def _get_entries(self):
+        with self._lock:
+            now = time.time()
+            if self._entries is None:
+                self._entries = {}
+                if self._load_index():
+                    if self._refresh(True):
+                        self._save_index()
+                else:
+                    for directory in self.directories:
+                        if os.path.isdir(directory):
+                            self._scan_dir(directory, directory)
+                    self._save_index()
+                self._checked = self._files_checked = now
+            elif now - self._checked > self.poll_interval:
+                check_files = self.file_poll_interval is not None and \
+                    now - self._files_checked > self.file_poll_interval
+                if self._refresh(check_files):
+                    self._save_index()
+                self._checked = now
+                if check_files:
+                    self._files_checked = now
+            return self._entries
+
+    # Parsing
+
+    def _read(self, path, offset, length):
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def _parse(self, entry):
+        """
+        Get the template of an index entry, or None when its file can't be
+        read or parsed. Failures are kept like templates, so a bad file is
+        only logged again once it changes.
+        """
+        name, path, mtime, offset, length = entry
+        parsed = self._parsed.get(name)
+        if parsed is not None and parsed[0] == mtime:
+            return parsed[1]
+
+        try:
+            data = loads(self._read(path, offset, length))
+            if path.endswith('.json'):
+                title = data.get('title') if isinstance(data, dict) else None
+                verbose_name = title.get('text') if isinstance(title, dict) else None
+                template = ChartTemplate(name, data, verbose_name)
+            else:
+                template = ChartTemplate(
+                    name, data['config'], data.get('verbose_name'), data.get('editing_data'))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.warning('Skipping chart template %s in %s: %s', name, path, e)
+            template = None
+        self._parsed[name] = (mtime, template)
+        return template
+
+    # Backend api
+
+    def get_chart_templates(self):
+        with self._lock:
+            entries = self._get_entries()
+            templates = [self._parse(entries[name]) for name in sorted(entries)]
+            return [t for t in templates if t is not None]
+
+    def get_chart_template(self, full_name=None):
+        with self._lock:
+            entry = self._get_entries().get(full_name)
+            return None if entry is None else self._parse(entry)
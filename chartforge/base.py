@@ -1,4 +1,104 @@
 import json
+import math
+from itertools import islice
+
+from chartforge.arrays import ColumnarSeries, encode_array, is_array
+from chartforge.codec import dumps, loads
+from chartforge.instrumentation import chart_type, record_payload, timed
+from chartforge.merge import merge
+
+
+_SCALARS = (str, int, float, bool, type(None))
+
+
+def _is_plain(value):
+    """
+    Check if a value can be handed to ``json.dumps()`` directly, either a
+    scalar or a flat point like ``[x, y]``.
+    """
+    if isinstance(value, _SCALARS):
+        return True
+    if isinstance(value, (list, tuple)):
+        return all(isinstance(v, _SCALARS) for v in value)
+    return False
+
+
+def _iterencode_array(items, batch_size):
+    yield '['
+    first = True
+    it = iter(items)
+    while True:
+        batch = list(islice(it, batch_size))
+        if not batch:
+            break
+        if all(map(_is_plain, batch)):
+            # encode the whole batch in one go with the C encoder
+            if not first:
+                yield ','
+            yield dumps(batch)[1:-1]
+            first = False
+            continue
+        for item in batch:
+            if not first:
+                yield ','
+            yield from _iterencode(item, batch_size)
+            first = False
+    yield ']'
+
+
+def _iterencode(obj, batch_size):
+    if isinstance(obj, float) and not math.isfinite(obj):
+        # like the codecs, JSON has no NaN
+        yield 'null'
+    elif isinstance(obj, _SCALARS):
+        yield json.dumps(obj)
+    elif isinstance(obj, dict):
+        yield '{'
+        first = True
+        for key, value in obj.items():
+            if not first:
+                yield ','
+            yield json.dumps(str(key))
+            yield ':'
+            yield from _iterencode(value, batch_size)
+            first = False
+        yield '}'
+    elif is_array(obj):
+        yield encode_array(obj)
+    elif isinstance(obj, ColumnarSeries):
+        yield obj.encode()
+    elif callable(getattr(obj, 'iterator', None)):
+        # querysets, iterate without filling the result cache
+        yield from _iterencode_array(obj.iterator(), batch_size)
+    elif hasattr(obj, '__iter__'):
+        yield from _iterencode_array(obj, batch_size)
+    else:
+        yield dumps(obj)
+
+
+def iterencode(obj, chunk_size=65536, batch_size=1024):
+    """
+    Encode ``obj`` to JSON, yielding string chunks of about ``chunk_size``
+    characters. Lists, generators and querysets are encoded lazily, so series
+    data can be streamed straight from an iterator without building the whole
+    document in memory.
+
+    :param obj: The object to encode
+    :param int chunk_size: Approximate size of each chunk
+    :param int batch_size: Number of array items encoded at a time
+    :return: generator of str
+    """
+    buf = []
+    size = 0
+    for piece in _iterencode(obj, batch_size):
+        buf.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield ''.join(buf)
+            buf = []
+            size = 0
+    if buf:
+        yield ''.join(buf)
 
 
 class RenderType:
@@ -35,10 +135,28 @@ class Chart:
 
         :return: str
         """
-        return json.dumps({
+        name = chart_type(self.config)
+        with timed('serialize', name):
+            data = dumps({
+                'slug': self.slug,
+                'config': self.config
+            })
+        record_payload('serialize', name, len(data))
+        return data
+
+    def iter_serialize(self, chunk_size=65536):
+        """
+        Serialize to JSON encoded string chunks. Series data can be any
+        iterable, including generators and querysets, and is consumed lazily.
+        NumPy arrays and ``ColumnarSeries`` are encoded a whole array at a time.
+
+        :param int chunk_size: Approximate size of each chunk
+        :return: generator of str
+        """
+        return iterencode({
             'slug': self.slug,
             'config': self.config
-        })
+        }, chunk_size)
 
     @classmethod
     def parse(cls, data):
@@ -48,29 +166,45 @@ class Chart:
         :param data: JSON encoded chart config
         :return: Chart()
         """
-        return cls(**json.loads(data))
+        return cls(**loads(data))
 
 
 class ChartTemplate:
     """
     Holds a chart config template and related data.
+
+    Charts rendered from a template share every part of the template config
+    their own config doesn't change, so treat the chart configs as read only.
     """
     def __init__(self, name, template_config, verbose_name=None, editing_data=None):
         self.name = name
-        self.config = config
+        self.config = template_config
         self.verbose_name = verbose_name
         self.editing_data = editing_data
 
-    def render_to_chart(self, config):
+    def merge(self, config, one_to_one=False):
+        """
+        Deep merge ``config`` into this template, see
+        ``chartforge.merge.merge()``.
+
+        :param config: The chart config data to apply to the template
+        :param bool one_to_one: Drop template series and axes that ``config``
+            has no match for, instead of keeping them like Highcharts'
+            ``update()``
+        :return: dict
+        """
+        return merge(self.config, config, one_to_one)
+
+    def render_to_chart(self, config, slug=None):
         """
         Merge together this template with the passed in ``config`` data and
         create a Chart() instance.
 
         :param config: The chart config data to apply to the template
+        :param slug: The chart's slug
         :return: Chart()
         """
-        # TODO: merge configs
-        return Chart(config)
+        return Chart(slug, self.merge(config))
 
     def serialize(self):
         """
@@ -78,7 +212,7 @@ class ChartTemplate:
 
         :return: str
         """
-        return json.dumps({
+        return dumps({
             'name': self.name,
             'config': self.config,
             'verbose_name': self.verbose_name,
@@ -93,4 +227,6 @@ class ChartTemplate:
         :param data: JSON encoded template data
         :return: ChartTemplate()
         """
-        return cls(**json.loads(data))
+        kwargs = loads(data)
+        kwargs['template_config'] = kwargs.pop('config')
+        return cls(**kwargs)
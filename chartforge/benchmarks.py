@@ -0,0 +1,358 @@
+"""
+Benchmarks for the chart pipeline, run with the ``chartforge_benchmark``
+management command.
+
+Every benchmark runs against synthetic data in three sizes. Results can be
+saved as JSON and compared against a stored baseline to catch regressions.
+"""
+import datetime
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+from contextlib import contextmanager
+
+from django.template.backends.django import DjangoTemplates
+
+import chartforge
+from chartforge import dynamic
+from chartforge.backends.base import BackendBase, BackendManager
+from chartforge.base import Chart, ChartTemplate, ExportType, RenderType
+from chartforge.cache import TemplateCache
+from chartforge.codec import dumps
+from chartforge.registry import ChartRegistry
+from chartforge.render import Image
+
+
+SIZES = {
+    # (series, points per series, registered charts)
+    'small': (2, 100, 10),
+    'medium': (4, 10000, 200),
+    'huge': (4, 1000000, 5000)
+}
+
+BENCHMARKS = []
+
+
+def benchmark(name):
+    """
+    Register a benchmark. The decorated function takes the size tuple and
+    returns a callable with no arguments that runs one iteration.
+    """
+    def wrapper(setup):
+        BENCHMARKS.append((name, setup))
+        return setup
+    return wrapper
+
+
+def make_config(series_count, points, seed=0):
+    """
+    Build a synthetic time series chart config.
+
+    :rtype: dict
+    """
+    rng = random.Random(seed)
+    start = 1500000000000
+    series = []
+    for i in range(series_count):
+        value = 100.0
+        data = []
+        for j in range(points):
+            value += rng.uniform(-1, 1)
+            data.append([start + j * 60000, round(value, 3)])
+        series.append({'name': 'Series %d' % i, 'data': data})
+    return {
+        'chart': {'type': 'line'},
+        'title': {'text': 'Benchmark'},
+        'xAxis': {'type': 'datetime'},
+        'yAxis': {'title': {'text': 'Value'}},
+        'series': series
+    }
+
+
+@contextmanager
+def isolated_registry():
+    """
+    Swap in an empty registry so benchmark charts aren't left registered.
+    """
+    registry = ChartRegistry()
+    original = dynamic.charts_registry
+    dynamic.charts_registry = registry
+    try:
+        yield registry
+    finally:
+        dynamic.charts_registry = original
+
+
+@benchmark('registry.lookup')
+def bench_registry_lookup(size):
+    _, _, chart_count = size
+    registry = ChartRegistry()
+    with isolated_registry():
+        classes = [type('Chart%d' % i, (dynamic.DynamicChart,), {}) for i in range(chart_count)]
+    for i, cls in enumerate(classes):
+        registry.register('bench.app%d.charts' % (i % 10), cls.__name__, cls)
+    names = [('bench.app%d' % (i % 10), 'Chart%d' % i) for i in range(chart_count)]
+
+    def run():
+        for app_name, chart_name in names:
+            registry.lookup(app_name, chart_name)
+    return run
+
+
+@benchmark('dynamic_chart.create')
+def bench_dynamic_chart(size):
+    counter = [0]
+
+    def run():
+        with isolated_registry():
+            counter[0] += 1
+
+            def chart_func(chart):
+                return {}
+            chart_func.__name__ = 'chart_%d' % counter[0]
+            dynamic.dynamic_chart(template={'series': []})(chart_func)
+    return run
+
+
+BENCH_TEMPLATE = (
+    '{"chart": {"type": "line"}, "title": {"text": "{{ title }}"}, '
+    '"xAxis": {"type": "datetime"}, "yAxis": {"title": {"text": "Value"}}, '
+    '"series": {{ series|safe }}}'
+)
+
+
+@benchmark('dynamic_chart.render_template')
+def bench_render_template(size):
+    series, points, _ = size
+    engine = DjangoTemplates({'NAME': 'bench', 'DIRS': [], 'APP_DIRS': False, 'OPTIONS': {}})
+    template = engine.from_string(BENCH_TEMPLATE)
+    chart_class = type('BenchChart', (dynamic.DynamicChart,), {
+        'template_name': 'bench.json',
+        '_template_cache': TemplateCache('bench.json', template)
+    })
+    chart = chart_class()
+    context = {
+        'title': 'Benchmark',
+        'series': dumps(make_config(series, min(points, 10000))['series'])
+    }
+
+    def run():
+        chart.render_template(**context)
+    return run
+
+
+@benchmark('chart.serialize')
+def bench_serialize(size):
+    series, points, _ = size
+    chart = Chart('bench', make_config(series, points))
+
+    def run():
+        chart.serialize()
+    return run
+
+
+@benchmark('chart.iter_serialize')
+def bench_iter_serialize(size):
+    series, points, _ = size
+    chart = Chart('bench', make_config(series, points))
+
+    def run():
+        for _ in chart.iter_serialize():
+            pass
+    return run
+
+
+@benchmark('chart.parse')
+def bench_parse(size):
+    series, points, _ = size
+    data = Chart('bench', make_config(series, points)).serialize()
+
+    def run():
+        Chart.parse(data)
+    return run
+
+
+@benchmark('chart_template.merge')
+def bench_merge(size):
+    series, _, chart_count = size
+    template = ChartTemplate('bench', make_config(series, 10))
+    # merging never walks the data lists, so more charts are merged for the
+    # bigger sizes instead of longer series
+    data = make_config(series, 10)['series']
+    configs = [
+        {'title': {'text': 'Chart %d' % i}, 'series': [dict(s, name='Chart %d' % i) for s in data]}
+        for i in range(min(chart_count, 1000))
+    ]
+
+    def run():
+        for i, config in enumerate(configs):
+            template.render_to_chart(config, 'bench-%d' % i)
+    return run
+
+
+class MemoryBackend(BackendBase):
+    """
+    Backend keeping charts in a dict, to measure backend manager overhead.
+    """
+    def __init__(self):
+        super().__init__()
+        self.charts = {}
+
+    def get_charts(self):
+        return list(self.charts.values())
+
+    def get_chart(self, slug=None):
+        return self.charts.get(slug)
+
+    def save_chart(self, chart):
+        self.charts[chart.slug] = chart
+
+
+class MemoryBackendManager(BackendManager):
+    """
+    Backend manager over two memory backends instead of the configured ones.
+    """
+    def __init__(self):
+        super().__init__([MemoryBackend(), MemoryBackend()])
+
+
+@benchmark('backend.save_get')
+def bench_backend(size):
+    _, _, chart_count = size
+    manager = MemoryBackendManager()
+    charts = [Chart('chart-%d' % i, {'series': []}) for i in range(chart_count)]
+
+    def run():
+        manager.save_charts(charts)
+        manager.get_charts_by_slugs([chart.slug for chart in charts])
+    return run
+
+
+def _render_benchmark(size, render_type):
+    # through the backend manager like requests, so decimation and the render
+    # pool are measured too
+    series, points, _ = size
+    manager = MemoryBackendManager()
+    chart = Chart('bench', make_config(series, min(points, 10000)))
+
+    def run():
+        manager.render_chart(chart, render_type)
+    return run
+
+
+@benchmark('backend.render_svg')
+def bench_render_svg(size):
+    return _render_benchmark(size, RenderType.SVG)
+
+
+@benchmark('backend.render_png')
+def bench_render_png(size):
+    if Image is None:
+        # Pillow isn't installed
+        return None
+    return _render_benchmark(size, RenderType.PNG)
+
+
+@benchmark('backend.export')
+def bench_export(size):
+    series, points, _ = size
+    manager = MemoryBackendManager()
+    chart = Chart('bench', make_config(series, points))
+
+    def run():
+        manager.export_chart(chart, ExportType.PLAIN_JS)
+    return run
+
+
+def _time(run, min_time):
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            run()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1000000:
+            return number, elapsed / number
+        number *= 10 if elapsed < min_time / 10 else 2
+
+
+def run_benchmarks(sizes=('small',), names=None, repeat=5, min_time=0.2, log=None):
+    """
+    Run the benchmarks.
+
+    :param sizes: Size names from ``SIZES``
+    :param names: Benchmark names to run, or prefixes like 'chart.', all when None
+    :param int repeat: Timed runs per benchmark, the best is kept
+    :param float min_time: Minimum seconds per timed run
+    :param log: Callable for progress messages
+    :return: dict of results, JSON serializable
+    """
+    results = []
+    for size_name in sizes:
+        size = SIZES[size_name]
+        for name, setup in BENCHMARKS:
+            if names and not any(name == n or name.startswith(n) for n in names):
+                continue
+            run = setup(size)
+            if run is None:
+                if log:
+                    log('%s [%s]: skipped' % (name, size_name))
+                continue
+            number, _ = _time(run, min_time)
+            times = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                for _ in range(number):
+                    run()
+                times.append((time.perf_counter() - start) / number)
+            result = {
+                'name': name,
+                'size': size_name,
+                'number': number,
+                'best': min(times),
+                'mean': statistics.mean(times),
+                'stdev': statistics.stdev(times) if len(times) > 1 else 0.0
+            }
+            results.append(result)
+            if log:
+                log('%s [%s]: %.6fs best, %.6fs mean' % (
+                    name, size_name, result['best'], result['mean']))
+    return {
+        'version': chartforge.__version__,
+        'python': sys.version.split()[0],
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'results': results
+    }
+
+
+def compare(results, baseline):
+    """
+    Compare results against a baseline.
+
+    :param dict results: From ``run_benchmarks()``
+    :param dict baseline: A previously saved result
+    :return: list of (name, size, baseline best, best, ratio) for every
+        benchmark in both
+    """
+    previous = dict(((r['name'], r['size']), r['best']) for r in baseline['results'])
+    rows = []
+    for result in results['results']:
+        key = (result['name'], result['size'])
+        if key in previous and previous[key] > 0:
+            rows.append(key + (previous[key], result['best'], result['best'] / previous[key]))
+    return rows
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_results(results, path):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
@@ -0,0 +1,661 @@
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.template.base import TextNode
+from django.template.context import RenderContext, make_context
+from django.template.defaulttags import CommentNode, LoadNode
+from django.template.loader import get_template
+
+from chartforge.codec import json_default
+from chartforge.instrumentation import record_cache
+from chartforge.settings import ChartForgeSettings
+
+
+_MISSING = object()
+
+
+def copy_json(obj):
+    """
+    Copy a parsed JSON tree. Only dicts and lists are copied, scalars are
+    immutable and can be shared. Much faster than ``copy.deepcopy()`` since it
+    doesn't need to track memo ids.
+
+    :param obj: A JSON compatible object
+    :return: A copy of obj
+    """
+    if isinstance(obj, dict):
+        return {k: copy_json(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [copy_json(v) for v in obj]
+    return obj
+
+
+# stand in for template nodes while the JSON around them is parsed, either
+# as a whole JSON value or inside a JSON string
+_VALUE = '\ufdd0'
+_TEXT = '\ufdd1'
+
+
+class _Slot:
+    """
+    A template node that renders a whole JSON value, or list items when it's
+    in a list.
+    """
+    __slots__ = ('index',)
+
+    def __init__(self, index):
+        self.index = index
+
+
+class _Text:
+    """
+    A JSON string with template nodes in it. ``parts`` are strings and the
+    indexes of the nodes.
+    """
+    __slots__ = ('parts',)
+
+    def __init__(self, parts):
+        self.parts = parts
+
+
+def _compile_json(obj):
+    if isinstance(obj, str):
+        if obj.startswith(_VALUE):
+            return _Slot(int(obj.strip(_VALUE)))
+        if _TEXT in obj:
+            parts = obj.split(_TEXT)
+            return _Text([int(p) if i % 2 else p for i, p in enumerate(parts) if p or i % 2])
+        return obj
+    if isinstance(obj, dict):
+        if any(_VALUE in k or _TEXT in k for k in obj):
+            raise ValueError('Template nodes in keys are not supported')
+        return {k: _compile_json(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_compile_json(v) for v in obj]
+    return obj
+
+
+def _fill_json(obj, rendered, parse):
+    if isinstance(obj, dict):
+        return {k: _fill_json(v, rendered, parse) for k, v in obj.items()}
+    if isinstance(obj, list):
+        result = []
+        for v in obj:
+            if isinstance(v, _Slot):
+                result.extend(parse('[%s]' % rendered[v.index]))
+            else:
+                result.append(_fill_json(v, rendered, parse))
+        return result
+    if isinstance(obj, _Slot):
+        return parse(rendered[obj.index])
+    if isinstance(obj, _Text):
+        return ''.join(
+            p if isinstance(p, str) else parse('"%s"' % rendered[p]) for p in obj.parts)
+    return obj
+
+
+class TemplateCache:
+    """
+    Caches the compiled template and parsed JSON for a chart template file.
+
+    The template's static text is parsed once, with placeholders for the
+    nodes that depend on the context, like variables and tags. Each render
+    only renders those nodes and parses their output, then fills them into a
+    copy of the parsed JSON. Nodes must be whole JSON values, list items or
+    inside strings. Other templates, and renders whose output doesn't fit the
+    JSON around it, are rendered and parsed in full. Everything is thrown out
+    when the template file's mtime changes.
+
+    An already loaded ``template`` can be passed instead of loading
+    ``template_name``, it's never reloaded.
+    """
+    def __init__(self, template_name, template=None):
+        self.template_name = template_name
+        self._lock = threading.Lock()
+        self._template = template
+        self._path = None
+        self._mtime = None
+        self._compiled = _MISSING
+
+    def _get_mtime(self):
+        if self._path is None:
+            return None
+        try:
+            return os.path.getmtime(self._path)
+        except OSError:
+            return None
+
+    def _load(self):
+        template = None
+        if self._template is not None and self._path is not None:
+            # the cached template loader would return the old template
+            try:
+                with open(self._path, encoding='utf-8') as f:
+                    template = self._template.backend.from_string(f.read())
+            except (IOError, OSError):
+                pass
+        if template is None:
+            template = get_template(self.template_name)
+            origin = getattr(getattr(template, 'template', None), 'origin', None)
+            self._path = getattr(origin, 'name', None)
+        self._mtime = self._get_mtime()
+        self._template = template
+        self._compiled = _MISSING
+
+    def get_template(self):
+        """
+        Get the compiled template, reloading it if the file changed.
+        """
+        with self._lock:
+            if self._template is None or self._get_mtime() != self._mtime:
+                self._load()
+            return self._template
+
+    def _compile(self, parse):
+        """
+        Parse the static text of the template with placeholders for the other
+        nodes.
+
+        :return: (parsed JSON, list of nodes), or None when the template can't
+            be split
+        """
+        nodelist = getattr(getattr(self._template, 'template', None), 'nodelist', None)
+        if nodelist is None or not hasattr(RenderContext, 'push_state'):
+            # not a django template, or django < 1.11
+            return None
+
+        source = []
+        nodes = []
+        in_string = escaped = False
+        for node in nodelist:
+            if isinstance(node, TextNode):
+                for c in node.s:
+                    if escaped:
+                        escaped = False
+                    elif c == '\\':
+                        escaped = in_string
+                    elif c == '"':
+                        in_string = not in_string
+                source.append(node.s)
+            elif not isinstance(node, (CommentNode, LoadNode)):
+                if in_string:
+                    source.append('%s%d%s' % (_TEXT, len(nodes), _TEXT))
+                else:
+                    source.append('"%s%d%s"' % (_VALUE, len(nodes), _VALUE))
+                nodes.append(node)
+        try:
+            return _compile_json(parse(''.join(source))), nodes
+        except ValueError:
+            return None
+
+    def _render_nodes(self, nodes, context):
+        template = self._template
+        context = make_context(context, autoescape=template.backend.engine.autoescape)
+        with context.render_context.push_state(template.template), \
+                context.bind_template(template.template):
+            context.template_name = template.template.name
+            return [str(node.render_annotated(context)) for node in nodes]
+
+    def render(self, context, parse):
+        """
+        Render the template with ``context`` and parse the result with
+        ``parse``. Returns a fresh copy that the caller is free to modify.
+
+        :param dict context: The template context
+        :param parse: Callable used to parse the rendered string
+        :return: dict
+        """
+        with self._lock:
+            if self._template is None or self._get_mtime() != self._mtime:
+                self._load()
+            if self._compiled is _MISSING:
+                self._compiled = self._compile(parse)
+            template = self._template
+            compiled = self._compiled
+
+        if compiled is None:
+            return parse(template.render(context))
+        tree, nodes = compiled
+        if not nodes:
+            return copy_json(tree)
+        try:
+            return _fill_json(tree, self._render_nodes(nodes, context), parse)
+        except ValueError:
+            # the output isn't valid JSON on its own, like a node rendering
+            # half of an object
+            return parse(template.render(context))
+
+
+class LocalCache:
+    """
+    Small thread safe in-process LRU cache with per-entry expiry. Used as the
+    front tier in front of the django cache.
+    """
+    def __init__(self, max_entries, timeout):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            expires, value = entry
+            if expires < time.time():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        timeout = self.timeout if timeout is None else min(timeout, self.timeout)
+        if timeout <= 0 or self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (time.time() + timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class ResultCache:
+    """
+    Two tier cache for chart data. Results are kept in a ``LocalCache`` and
+    in the django cache set by the ``cache_alias`` setting.
+
+    Only one thread per process, or one task per event loop with
+    ``aget_or_compute()``, computes a given key, the others wait for its
+    result. Between processes a lock key is added to the django cache so
+    only one worker runs the computation while the others poll for the result.
+
+    ``invalidate_all()`` bumps a generation counter that is part of every
+    shared key. Each process keeps the counter for ``local_cache_timeout``
+    seconds, so a hit costs one round trip, and other processes may still
+    serve their old results for that long.
+    """
+    lock_stripes = 64
+    poll_interval = 0.05
+
+    def __init__(self, prefix, timeout, key_func=None, lock_timeout=None):
+        """
+        :param str prefix: Prefix for all keys, usually the chart key
+        :param int timeout: Seconds to keep results for
+        :param key_func: Callable taking the kwargs and returning a key, or a
+            string formatted with the kwargs
+        :param int lock_timeout: Seconds to wait for another worker to finish
+            computing a key, defaults to ``timeout``
+        """
+        self.prefix = prefix
+        self.timeout = timeout
+        self.key_func = key_func
+        self.lock_timeout = min(timeout, 60) if lock_timeout is None else lock_timeout
+        self._locks = [threading.Lock() for _ in range(self.lock_stripes)]
+        self._local = None
+        self._settings = None
+        self._generation = None
+        self._generation_expires = 0
+        self._pending = {}
+
+    @property
+    def settings(self):
+        if self._settings is None:
+            self._settings = ChartForgeSettings()
+        return self._settings
+
+    @property
+    def backend(self):
+        return caches[self.settings.cache_alias]
+
+    @property
+    def local(self):
+        if self._local is None:
+            self._local = LocalCache(
+                self.settings.local_cache_size,
+                self.settings.local_cache_timeout)
+        return self._local
+
+    def _digest(self, kwargs):
+        if self.key_func is None:
+            part = repr(sorted(kwargs.items()))
+        elif isinstance(self.key_func, str):
+            part = self.key_func.format(**kwargs)
+        else:
+            part = str(self.key_func(**kwargs))
+        return hashlib.md5(part.encode('utf-8')).hexdigest()
+
+    def _generation_key(self):
+        return 'chartforge:data:%s:generation' % self.prefix
+
+    def _get_generation(self):
+        now = time.time()
+        if self._generation is None or self._generation_expires < now:
+            self._generation = self.backend.get(self._generation_key(), 0)
+            self._generation_expires = now + self.settings.local_cache_timeout
+        return self._generation
+
+    def _key(self, digest):
+        generation = self._get_generation()
+        return 'chartforge:data:%s:%s:%s' % (self.prefix, generation, digest)
+
+    def get(self, kwargs, default=None):
+        """
+        Get a cached result without computing it.
+
+        :param dict kwargs: The kwargs the result was computed with
+        :param default: Returned on a cache miss
+        """
+        digest = self._digest(kwargs)
+        value = self.local.get(digest, _MISSING)
+        if value is _MISSING:
+            value = self.backend.get(self._key(digest), _MISSING)
+            if value is _MISSING:
+                record_cache(self.prefix, False)
+                return default
+            self.local.set(digest, value, self.timeout)
+        record_cache(self.prefix, True)
+        return copy_json(value)
+
+    def set(self, kwargs, value):
+        """
+        Store a result in both tiers.
+
+        :param dict kwargs: The kwargs the result was computed with
+        :param value: The result
+        """
+        digest = self._digest(kwargs)
+        self.backend.set(self._key(digest), value, self.timeout)
+        self.local.set(digest, value, self.timeout)
+
+    def get_or_compute(self, kwargs, compute):
+        """
+        Get the cached result for ``kwargs``, calling ``compute()`` to create
+        it on a miss.
+
+        :param dict kwargs: The kwargs used to build the key
+        :param compute: Callable with no arguments that computes the result
+        :return: A copy of the cached result
+        """
+        digest = self._digest(kwargs)
+        value = self.local.get(digest, _MISSING)
+        if value is not _MISSING:
+            record_cache(self.prefix, True)
+            return copy_json(value)
+
+        with self._locks[hash(digest) % self.lock_stripes]:
+            value = self.local.get(digest, _MISSING)
+            hit = value is not _MISSING
+            if not hit:
+                key = self._key(digest)
+                value = self.backend.get(key, _MISSING)
+                hit = value is not _MISSING
+                if not hit:
+                    value = self._compute_shared(key, compute)
+                self.local.set(digest, value, self.timeout)
+        record_cache(self.prefix, hit)
+        return copy_json(value)
+
+    async def aget_or_compute(self, kwargs, compute):
+        """
+        Async version of ``get_or_compute()``. Concurrent calls for the same
+        key on one event loop share a single computation, and the lock key in
+        the django cache is the same one the sync version uses.
+
+        :param dict kwargs: The kwargs used to build the key
+        :param compute: Coroutine function with no arguments that computes the
+            result
+        :return: A copy of the cached result
+        """
+        digest = self._digest(kwargs)
+        value = self.local.get(digest, _MISSING)
+        if value is not _MISSING:
+            record_cache(self.prefix, True)
+            return copy_json(value)
+
+        pending_key = (asyncio.get_running_loop(), digest)
+        task = self._pending.get(pending_key)
+        if task is None:
+            task = asyncio.ensure_future(self._acompute(digest, compute))
+            self._pending[pending_key] = task
+            task.add_done_callback(lambda t: self._pending.pop(pending_key, None))
+        return copy_json(await asyncio.shield(task))
+
+    async def _acompute(self, digest, compute):
+        key = self._key(digest)
+        value = self.backend.get(key, _MISSING)
+        hit = value is not _MISSING
+        if not hit:
+            value = await self._acompute_shared(key, compute)
+        self.local.set(digest, value, self.timeout)
+        record_cache(self.prefix, hit)
+        return value
+
+    async def _acompute_shared(self, key, compute):
+        backend = self.backend
+        lock_key = '%s:lock' % key
+        if backend.add(lock_key, 1, self.lock_timeout):
+            try:
+                value = await compute()
+                backend.set(key, value, self.timeout)
+            finally:
+                backend.delete(lock_key)
+            return value
+
+        deadline = time.time() + self.lock_timeout
+        while time.time() < deadline:
+            await asyncio.sleep(self.poll_interval)
+            value = backend.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+
+        value = await compute()
+        backend.set(key, value, self.timeout)
+        return value
+
+    def _compute_shared(self, key, compute):
+        backend = self.backend
+        lock_key = '%s:lock' % key
+        if backend.add(lock_key, 1, self.lock_timeout):
+            try:
+                value = compute()
+                backend.set(key, value, self.timeout)
+            finally:
+                backend.delete(lock_key)
+            return value
+
+        deadline = time.time() + self.lock_timeout
+        while time.time() < deadline:
+            time.sleep(self.poll_interval)
+            value = backend.get(key, _MISSING)
+            if value is not _MISSING:
+                return value
+
+        # the other worker is taking too long or died, compute it anyway
+        value = compute()
+        backend.set(key, value, self.timeout)
+        return value
+
+    def invalidate(self, kwargs):
+        """
+        Remove the cached result for ``kwargs``.
+        """
+        digest = self._digest(kwargs)
+        self.local.delete(digest)
+        self.backend.delete(self._key(digest))
+
+    def invalidate_all(self):
+        """
+        Invalidate every cached result by bumping the key generation.
+        """
+        self.local.clear()
+        backend = self.backend
+        try:
+            self._generation = backend.incr(self._generation_key())
+        except ValueError:
+            backend.set(self._generation_key(), 1, None)
+            self._generation = 1
+        self._generation_expires = time.time() + self.settings.local_cache_timeout
+
+
+def config_digest(config, *parts):
+    """
+    Get a stable hash of a chart config and any extra ``parts``. The config
+    is canonicalized first, so key order doesn't change the hash.
+
+    :param config: The chart config
+    :return: str
+    """
+    # always the standard library, so digests don't change with json_codec
+    canonical = json.dumps(
+        [config] + [str(p) for p in parts],
+        sort_keys=True, separators=(',', ':'), default=json_default)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class RenderCache:
+    """
+    Content addressed cache for rendered chart images. Keys are a hash of
+    the chart config, render type and size, so identical charts share one
+    rendering no matter which slug or request they come from.
+
+    With the ``render_cache_dir`` setting images are stored as files and the
+    least recently used are removed when the directory grows past
+    ``render_cache_max_size`` bytes. Otherwise they're stored in the django
+    cache, which does its own eviction.
+    """
+    def __init__(self, location=None, max_size=None, timeout=None):
+        settings = ChartForgeSettings()
+        self.location = location or settings.render_cache_dir
+        self.max_size = settings.render_cache_max_size if max_size is None else max_size
+        self.timeout = settings.render_cache_timeout if timeout is None else timeout
+        self.alias = settings.cache_alias
+        self._lock = threading.Lock()
+        self._size = None
+
+    def key(self, chart, render_type, width=None, height=None):
+        """
+        Get the cache key, which is also used as the ETag.
+
+        :param Chart chart: The chart
+        :param RenderType render_type: The render type
+        :return: str
+        """
+        return config_digest(chart.config, render_type, width, height)
+
+    def _path(self, key):
+        return os.path.join(self.location, key[:2], key)
+
+    def get(self, key):
+        """
+        Get a cached rendering.
+
+        :param str key: The cache key
+        :return: (bytes, last modified timestamp) or None
+        """
+        if self.location is None:
+            return caches[self.alias].get('chartforge:render:%s' % key)
+
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            last_modified = os.path.getmtime(path)
+            # the access time marks recent use for eviction
+            os.utime(path, (time.time(), last_modified))
+        except (IOError, OSError):
+            return None
+        return data, last_modified
+
+    def set(self, key, data):
+        """
+        Store a rendering.
+
+        :param str key: The cache key
+        :param bytes data: The rendered bytes
+        :return: The last modified timestamp
+        """
+        last_modified = time.time()
+        if self.location is None:
+            caches[self.alias].set(
+                'chartforge:render:%s' % key, (data, last_modified), self.timeout)
+            return last_modified
+
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # a unique name, as processes sharing the directory can have the same
+        # thread ids
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, _, size in self._scan())
+            else:
+                self._size += len(data)
+            if self._size > self.max_size:
+                self._evict()
+        return last_modified
+
+    def _scan(self):
+        for root, _, files in os.walk(self.location):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_atime, stat.st_size
+
+    def _evict(self):
+        # remove the least recently used files until 90% of max_size
+        entries = sorted(self._scan(), key=lambda e: e[1])
+        total = sum(size for _, _, size in entries)
+        target = self.max_size * 0.9
+        for path, _, size in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._size = total
+
+    def get_or_render(self, key, render):
+        """
+        Get a cached rendering, calling ``render()`` to create it on a miss.
+
+        :param str key: The cache key
+        :param render: Callable with no arguments returning the bytes
+        :return: (bytes, last modified timestamp)
+        """
+        cached = self.get(key)
+        if cached is not None:
+            return cached
+        data = render()
+        return data, self.set(key, data)
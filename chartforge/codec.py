@@ -0,0 +1,218 @@
+"""
+JSON encoding for chart configs, with the fastest installed library.
+
+The ``json_codec`` setting picks 'orjson', 'ujson' or 'json' for the
+standard library, or 'auto' for the first of them that's installed. Every
+codec has the same api: ``dumps()`` returns str, ``dumpb()`` returns UTF-8
+bytes for responses and storage without a str to bytes round trip, and
+``loads()`` takes either.
+
+Values JSON has no type for are converted by ``json_default()``. All the
+codecs give the same result for them, and output is compact with no
+whitespace. NaN and infinite floats are written as null by every codec, like
+orjson and ``arrays.to_list()`` do, since JSON has no literal for them.
+"""
+import datetime
+import decimal
+import json
+import math
+import threading
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+from django.core.exceptions import ImproperlyConfigured
+
+from chartforge.arrays import ColumnarSeries, encode_array, is_array, to_list
+from chartforge.settings import ChartForgeSettings
+from chartforge.utils import to_timestamp
+
+
+def json_default(obj):
+    """
+    Encoder hook for values JSON has no type for. NumPy arrays, columnar
+    series, querysets and other iterables, like generators, become lists.
+    Dates and datetimes become milliseconds since the epoch, as Highcharts
+    expects, and Decimals become floats.
+    """
+    if is_array(obj):
+        return to_list(obj)
+    if isinstance(obj, ColumnarSeries):
+        return obj.tolist()
+    if isinstance(obj, datetime.date):
+        return to_timestamp(obj)
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    if callable(getattr(obj, 'iterator', None)):
+        return list(obj.iterator())
+    if hasattr(obj, '__iter__'):
+        return list(obj)
+    raise TypeError('%r is not JSON serializable' % (obj,))
+
+
+def _finite(obj):
+    """
+    Copy ``obj`` with NaN and infinite floats replaced by None. Only used
+    after an encoder refused them, so the common case stays in C.
+    """
+    if isinstance(obj, (float, decimal.Decimal)):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return dict((k, _finite(v)) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        return [_finite(v) for v in obj]
+    return obj
+
+
+def _finite_default(obj):
+    return _finite(json_default(obj))
+
+
+_encoder = json.JSONEncoder(separators=(',', ':'), default=json_default, allow_nan=False)
+_finite_encoder = json.JSONEncoder(
+    separators=(',', ':'), default=_finite_default, allow_nan=False)
+
+
+class JSONCodec:
+    """
+    Codec using the standard library ``json`` module.
+    """
+    name = 'json'
+
+    def dumps(self, obj):
+        try:
+            return _encoder.encode(obj)
+        except ValueError:
+            return _finite_encoder.encode(_finite(obj))
+
+    def dumpb(self, obj):
+        return self.dumps(obj).encode('utf-8')
+
+    def loads(self, data):
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytes(data).decode('utf-8')
+        return json.loads(data)
+
+
+class OrjsonCodec(JSONCodec):
+    """
+    Codec using orjson. Numeric NumPy arrays are written straight from their
+    buffers.
+    """
+    name = 'orjson'
+
+    def __init__(self):
+        self.options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        fragment = getattr(orjson, 'Fragment', None)
+
+        def default(obj):
+            if fragment is not None and is_array(obj) and obj.ndim:
+                return fragment(encode_array(obj))
+            return json_default(obj)
+        self._default = default
+
+    def dumps(self, obj):
+        return self.dumpb(obj).decode('utf-8')
+
+    def dumpb(self, obj):
+        return orjson.dumps(obj, default=self._default, option=self.options)
+
+    def loads(self, data):
+        if isinstance(data, str) and type(data) is not str:
+            # orjson only takes exact str, not SafeText from render_to_string()
+            data = str(data)
+        return orjson.loads(data)
+
+
+class UjsonCodec(JSONCodec):
+    """
+    Codec using ujson.
+    """
+    name = 'ujson'
+
+    def dumps(self, obj):
+        try:
+            return ujson.dumps(
+                obj, default=json_default, escape_forward_slashes=False, allow_nan=False)
+        except OverflowError:
+            return ujson.dumps(
+                _finite(obj), default=_finite_default, escape_forward_slashes=False,
+                allow_nan=False)
+
+    def dumpb(self, obj):
+        return self.dumps(obj).encode('utf-8')
+
+    def loads(self, data):
+        return ujson.loads(data)
+
+
+CODECS = {
+    'json': JSONCodec,
+    'orjson': OrjsonCodec,
+    'ujson': UjsonCodec
+}
+
+_INSTALLED = {
+    'json': True,
+    'orjson': orjson is not None,
+    'ujson': ujson is not None
+}
+
+_codec = None
+_codec_lock = threading.Lock()
+
+
+def get_codec(name=None):
+    """
+    Get a codec by name, or the one set by the ``json_codec`` setting.
+
+    :param str name: 'auto', 'orjson', 'ujson' or 'json'
+    :rtype: JSONCodec
+    """
+    global _codec
+    if name is None:
+        if _codec is None:
+            with _codec_lock:
+                if _codec is None:
+                    _codec = get_codec(ChartForgeSettings().json_codec)
+        return _codec
+
+    if name == 'auto':
+        name = next(n for n in ('orjson', 'ujson', 'json') if _INSTALLED[n])
+    if name not in CODECS:
+        raise ImproperlyConfigured('Unknown json_codec: %s' % name)
+    if not _INSTALLED[name]:
+        raise ImproperlyConfigured('json_codec is %s but it is not installed' % name)
+    return CODECS[name]()
+
+
+def dumps(obj):
+    """
+    Encode ``obj`` to a JSON string.
+
+    :rtype: str
+    """
+    return get_codec().dumps(obj)
+
+
+def dumpb(obj):
+    """
+    Encode ``obj`` to UTF-8 JSON bytes.
+
+    :rtype: bytes
+    """
+    return get_codec().dumpb(obj)
+
+
+def loads(data):
+    """
+    Decode a JSON str or bytes.
+    """
+    return get_codec().loads(data)
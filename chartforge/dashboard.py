@@ -0,0 +1,248 @@
+"""
+Loads many dynamic charts at once for a dashboard.
+
+Every chart is resolved through the registry before any data is fetched.
+Charts that would make the same ``get_data()`` call share one result: function
+charts match when they wrap the same function, charts using the default
+``get_data()`` when they have the same ``data_source``, and other class charts
+when they're the same class. All need the same kwargs. The remaining calls,
+and every chart's config, run concurrently in a thread pool sized by the
+``dashboard_workers`` setting. That pool is separate from the backend pool, so
+charts can call backends without waiting on their own pool.
+
+Charts the user doesn't have permission for, see
+``DynamicChart.has_permission()``, get an error instead of data. Kwargs are
+checked with ``DynamicChart.clean_kwargs()`` before anything runs.
+"""
+import inspect
+import logging
+import threading
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FutureTimeoutError, wait)
+
+from chartforge.base import iterencode
+from chartforge.decimation import decimate_config
+from chartforge.dynamic import DynamicChart, InvalidChartKwargs
+from chartforge.registry import charts_registry
+from chartforge.settings import ChartForgeSettings
+from chartforge.utils import call_in_thread, freeze
+
+
+logger = logging.getLogger('chartforge')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_dashboard_executor():
+    """
+    Get the thread pool used to fetch dashboard chart data.
+
+    :rtype: ThreadPoolExecutor
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(ChartForgeSettings().dashboard_workers)
+        return _executor
+
+
+class DashboardChart:
+    """
+    One chart on a dashboard.
+
+    :param str id: Identifies the chart in the response, defaults to its key
+    :param str key: The chart key, like 'app.MyChart'
+    :param dict kwargs: Passed to the chart
+    """
+    def __init__(self, key, kwargs=None, id=None):
+        self.key = key
+        self.kwargs = kwargs or {}
+        self.id = key if id is None else id
+        self.chart = None
+        self.error = None
+
+    def resolve(self, request=None):
+        """
+        Look up the chart and check its kwargs. Sets ``error`` for charts that
+        don't exist or that the user of ``request`` may not load.
+
+        :param request: The HttpRequest, permissions aren't checked without it
+        :raises InvalidChartKwargs: When the chart doesn't accept the kwargs
+        """
+        app_name, _, chart_name = self.key.rpartition('.')
+        try:
+            chart = charts_registry.lookup(app_name, chart_name).chart_class()
+        except KeyError:
+            self.error = 'No chart named %s' % self.key
+            return
+        if request is not None and not chart.has_permission(request):
+            self.error = 'Permission denied'
+            return
+        try:
+            self.kwargs = chart.clean_kwargs(self.kwargs)
+        except InvalidChartKwargs as e:
+            raise InvalidChartKwargs('%s: %s' % (self.key, e))
+        self.chart = chart
+
+    def data_key(self):
+        """
+        Get the key identifying this chart's ``get_data()`` call, or None when
+        the kwargs can't be hashed.
+        """
+        chart_class = type(self.chart)
+        source = chart_class._wrapped_func
+        if source is None and chart_class.data_source is not None and \
+                inspect.unwrap(chart_class.get_data) is DynamicChart.get_data:
+            source = chart_class.data_source
+        if source is None:
+            source = chart_class
+        try:
+            return source, freeze(self.kwargs)
+        except TypeError:
+            return None
+
+
+def parse_charts(items):
+    """
+    Create ``DashboardChart`` instances from a request payload. Each item is a
+    chart key or a dict with ``chart`` and optional ``kwargs`` and ``id``.
+
+    :param list items: The requested charts
+    :rtype: list[DashboardChart]
+    """
+    charts = []
+    for item in items:
+        if isinstance(item, str):
+            charts.append(DashboardChart(item))
+        elif isinstance(item, dict) and isinstance(item.get('chart'), str):
+            kwargs = item.get('kwargs') or {}
+            if not isinstance(kwargs, dict):
+                raise ValueError('Chart kwargs must be an object')
+            charts.append(DashboardChart(item['chart'], kwargs, item.get('id')))
+        else:
+            raise ValueError('Charts must be names or objects with a chart name')
+    return charts
+
+
+class Dashboard:
+    """
+    Fetches the config and data of a list of ``DashboardChart`` instances with
+    shared data calls.
+
+    :param list charts: The charts
+    :param float timeout: Seconds to wait for all of the data, defaults to the
+        ``dashboard_timeout`` setting
+    :param request: The HttpRequest, used to check chart permissions
+    """
+    def __init__(self, charts, timeout=None, request=None):
+        self.charts = charts
+        self.timeout = ChartForgeSettings().dashboard_timeout if timeout is None else timeout
+        self.request = request
+        self._resolved = False
+
+    def resolve(self):
+        """
+        Resolve every chart and check its kwargs. Called before the first
+        result, call it earlier to handle ``InvalidChartKwargs`` up front.
+
+        :raises InvalidChartKwargs: When a chart doesn't accept its kwargs
+        """
+        if not self._resolved:
+            for item in self.charts:
+                item.resolve(self.request)
+            self._resolved = True
+
+    def _submit(self):
+        """
+        Start one data call per distinct key, and a config call per chart.
+
+        :return: list of (chart, data future, config future) tuples, the
+            futures are None for charts that failed to resolve
+        """
+        self.resolve()
+        executor = get_dashboard_executor()
+        futures = {}
+        jobs = []
+        for item in self.charts:
+            if item.error is not None:
+                jobs.append((item, None, None))
+                continue
+            key = item.data_key()
+            future = futures.get(key) if key is not None else None
+            if future is None:
+                future = executor.submit(call_in_thread, item.chart.get_data, **item.kwargs)
+                if key is not None:
+                    futures[key] = future
+            config = executor.submit(call_in_thread, item.chart, **item.kwargs)
+            jobs.append((item, future, config))
+        return jobs
+
+    def _result(self, item, future, config_future, remaining):
+        if future is None:
+            return {'id': item.id, 'chart': item.key, 'error': item.error}
+        chart = item.chart
+        try:
+            deadline = time.time() + remaining
+            data = future.result(remaining)
+            config = config_future.result(max(0, deadline - time.time()))
+            if chart.max_points is not None:
+                data = decimate_config(data, chart.max_points, chart.decimation)
+        except FutureTimeoutError:
+            logger.warning('Dashboard chart %s timed out', item.key)
+            return {'id': item.id, 'chart': item.key, 'error': 'Timed out'}
+        except Exception:
+            logger.exception('Dashboard chart %s failed', item.key)
+            return {'id': item.id, 'chart': item.key, 'error': 'Failed to load'}
+        return {'id': item.id, 'chart': item.key, 'config': config, 'data': data}
+
+    def results(self):
+        """
+        Get the result of every chart in request order. Results are dicts
+        with ``id``, ``chart`` and either ``config`` and ``data``, or
+        ``error``.
+
+        :rtype: list[dict]
+        """
+        deadline = time.time() + self.timeout
+        return [
+            self._result(item, future, config, max(0, deadline - time.time()))
+            for item, future, config in self._submit()
+        ]
+
+    def iter_results(self):
+        """
+        Yield the result of every chart as soon as its data is ready.
+
+        :return: generator of dict
+        """
+        deadline = time.time() + self.timeout
+        pending = self._submit()
+        while pending:
+            futures = set(f for job in pending for f in job[1:] if f is not None)
+            if futures:
+                wait(futures, max(0, deadline - time.time()), return_when=FIRST_COMPLETED)
+            timed_out = time.time() >= deadline
+            waiting = []
+            for item, future, config in pending:
+                if future is None or (future.done() and config.done()) or timed_out:
+                    yield self._result(item, future, config, 0)
+                else:
+                    waiting.append((item, future, config))
+            pending = waiting
+
+    def iter_serialize(self, chunk_size=65536):
+        """
+        Serialize the results as a ``{"charts": [...]}`` document, with each
+        chart written out as soon as it's ready.
+
+        :param int chunk_size: Approximate size of each chunk
+        :return: generator of str
+        """
+        yield '{"charts":['
+        for i, result in enumerate(self.iter_results()):
+            if i:
+                yield ','
+            yield from iterencode(result, chunk_size)
+        yield ']}'
@@ -0,0 +1,222 @@
+"""
+Declarative chart data from the ORM.
+
+A ``QuerySetSource`` describes a chart's data as a model, an x field, an
+aggregated y field and an optional group by field. It compiles to one
+aggregated query, ``values().annotate()`` with ``Trunc`` for time buckets, so
+the database does the grouping. Rows are streamed with ``values_list()`` and
+``iterator()`` straight into series columns, without creating model instances.
+
+Set it as the ``data_source`` of a chart class and the default ``get_data()``
+uses it::
+
+    @dynamic_chart(template_name='sales.json')
+    class Sales:
+        data_source = QuerySetSource(
+            Order, x='created', y='total', bucket='day', group_by='region',
+            filters={'since': 'created__gte'})
+
+Numeric and time x values give ``ColumnarSeries`` data, rows with a NULL x
+are left out since they have no place on the axis. Any other x values, like
+strings, are categories: the data gets ``xAxis.categories`` and y-only series
+lined up with them, NULL becomes the ``null_label`` category.
+
+With a ``version_field`` the data views can tell the data hasn't changed
+without running the chart query, see ``DynamicChart.get_version()``.
+"""
+import decimal
+from itertools import groupby
+
+from django.db.models import Avg, Count, Max, Min, Sum
+from django.db.models.query import QuerySet
+
+from chartforge.arrays import ColumnarSeries
+from chartforge.utils import to_timestamp
+
+try:
+    from django.db.models.functions import Trunc
+except ImportError:
+    # Django < 1.10
+    Trunc = None
+
+
+AGGREGATES = {
+    'sum': Sum,
+    'avg': Avg,
+    'min': Min,
+    'max': Max,
+    'count': Count
+}
+
+BUCKETS = ('year', 'quarter', 'month', 'week', 'day', 'hour', 'minute', 'second')
+
+_X = '_chartforge_x'
+_Y = '_chartforge_y'
+
+
+def _number(value):
+    return float(value) if isinstance(value, decimal.Decimal) else value
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class QuerySetSource:
+    """
+    Chart data from one aggregated query.
+
+    :param queryset: A model class or queryset
+    :param str x: The x axis field
+    :param str y: The field to aggregate, the primary key when None
+    :param aggregate: 'sum', 'avg', 'min', 'max' or 'count', or an aggregate
+        class like ``StdDev``
+    :param str bucket: Truncate ``x`` to this unit, one of ``BUCKETS``
+    :param str group_by: Make a series for each value of this field
+    :param dict filters: Map of chart kwargs to lookups, like
+        ``{'since': 'created__gte'}``, applied when the kwarg is passed
+    :param str name: The series name when there's no ``group_by``
+    :param dict series_options: Added to every series, like
+        ``{'type': 'column'}``
+    :param str version_field: A field updated whenever a row changes, like an
+        ``auto_now`` timestamp, see ``get_version()``
+    :param str null_label: The series name for a NULL ``group_by`` value and
+        the category for a NULL x value
+    """
+    def __init__(self, queryset, x, y=None, aggregate='sum', bucket=None, group_by=None,
+                 filters=None, name=None, series_options=None, version_field=None,
+                 null_label='(none)'):
+        if bucket is not None:
+            assert Trunc is not None, 'Time buckets need Django 1.10 or later'
+            assert bucket in BUCKETS, 'Unknown bucket: %s' % bucket
+        if y is None:
+            aggregate = 'count'
+        self.queryset = queryset
+        self.x = x
+        self.y = 'pk' if y is None else y
+        self.aggregate = AGGREGATES[aggregate] if isinstance(aggregate, str) else aggregate
+        self.bucket = bucket
+        self.group_by = group_by
+        self.filters = filters or {}
+        self.name = name
+        self.series_options = series_options or {}
+        self.version_field = version_field
+        self.null_label = null_label
+
+    def get_queryset(self, **kwargs):
+        """
+        Get the base queryset with the ``filters`` for ``kwargs`` applied.
+        Override to add custom filtering.
+
+        :rtype: QuerySet
+        """
+        queryset = self.queryset
+        if not isinstance(queryset, QuerySet):
+            queryset = queryset._default_manager.all()
+        lookups = dict(
+            (lookup, kwargs[name]) for name, lookup in self.filters.items() if name in kwargs)
+        return queryset.filter(**lookups) if lookups else queryset
+
+    def get_version(self, **kwargs):
+        """
+        Get the latest ``version_field`` value and the row count of the
+        filtered rows, which change whenever the data does. The count catches
+        deleted rows. It's one aggregate query without grouping, much cheaper
+        than the chart query when ``version_field`` is indexed.
+
+        :return: tuple, or None without a ``version_field``
+        """
+        if self.version_field is None:
+            return None
+        result = self.get_queryset(**kwargs).aggregate(
+            version=Max(self.version_field), count=Count('pk'))
+        return result['version'], result['count']
+
+    def get_query(self, **kwargs):
+        """
+        Build the aggregated query, yielding ``(x, y)`` rows ordered by x, or
+        ``(group, x, y)`` rows ordered by group and x with ``group_by``.
+
+        :rtype: QuerySet
+        """
+        queryset = self.get_queryset(**kwargs)
+        if self.bucket is not None:
+            queryset = queryset.annotate(**{_X: Trunc(self.x, self.bucket)})
+            x = _X
+        else:
+            x = self.x
+
+        keys = [x] if self.group_by is None else [self.group_by, x]
+        queryset = queryset.values(*keys).annotate(**{_Y: self.aggregate(self.y)}).order_by(*keys)
+        return queryset.values_list(*(keys + [_Y]))
+
+    def _label(self, value):
+        return self.null_label if value is None else str(value)
+
+    def _columns(self, rows):
+        xs, ys = [], []
+        for x, y in rows:
+            xs.append(to_timestamp(x))
+            ys.append(_number(y))
+        return xs, ys
+
+    def _series(self, name, data):
+        series = dict(self.series_options, data=data)
+        if name is not None:
+            series['name'] = name
+        return series
+
+    def _categories(self, groups):
+        """
+        Get the sorted category labels of every x value in the groups, in
+        their original order when they can't be compared.
+        """
+        values = []
+        seen = set()
+        for _, xs, _ in groups:
+            for x in xs:
+                if x is not None and x not in seen:
+                    seen.add(x)
+                    values.append(x)
+        try:
+            values.sort()
+        except TypeError:
+            pass
+        labels = [str(x) for x in values]
+        if any(None in xs for _, xs, _ in groups):
+            labels.append(self.null_label)
+        return labels
+
+    def get_data(self, **kwargs):
+        """
+        Run the query and build the series. Numeric and time x values give
+        ``ColumnarSeries`` data without the rows with a NULL x. Others give
+        ``xAxis.categories`` and y-only data, with None where a series has no
+        row for a category.
+
+        :return: dict with a ``series`` list, and ``xAxis`` for categories
+        """
+        rows = self.get_query(**kwargs).iterator()
+        if self.group_by is None:
+            groups = [(self.name,) + self._columns(rows)]
+        else:
+            groups = [
+                (self._label(group),) + self._columns(row[1:] for row in group_rows)
+                for group, group_rows in groupby(rows, key=lambda row: row[0])
+            ]
+
+        if all(x is None or _is_number(x) for _, xs, _ in groups for x in xs):
+            series = []
+            for name, xs, ys in groups:
+                if None in xs:
+                    points = [p for p in zip(xs, ys) if p[0] is not None]
+                    xs, ys = [p[0] for p in points], [p[1] for p in points]
+                series.append(self._series(name, ColumnarSeries(xs, ys)))
+            return {'series': series}
+
+        categories = self._categories(groups)
+        series = []
+        for name, xs, ys in groups:
+            values = dict((self._label(x), y) for x, y in zip(xs, ys))
+            series.append(self._series(name, [values.get(c) for c in categories]))
+        return {'xAxis': {'categories': categories}, 'series': series}
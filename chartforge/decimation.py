@@ -0,0 +1,405 @@
+"""
+Point decimation for series data. Shrinks series down to about as many
+points as the chart can actually show before they're sent to the browser or
+a renderer.
+
+Each decimator is a function ``func(x, y, threshold)`` returning the new
+``(x, y)`` sequences. NumPy is used when it's installed, otherwise the pure
+Python versions are used. Only numeric series are decimated, series with
+category or string x values are left alone. So are charts with
+``xAxis.categories``, their y-only data lines up with the categories by
+index.
+
+Rendered and exported charts are decimated by ``prepare_chart()`` with the
+``max_points`` and ``decimation`` settings.
+"""
+from chartforge.arrays import ColumnarSeries, numpy
+from chartforge.settings import ChartForgeSettings
+
+
+def _lttb_numpy(x, y, threshold):
+    n = len(x)
+    every = (n - 2) / (threshold - 2)
+    starts = (numpy.arange(threshold - 1) * every).astype(int) + 1
+    starts[-1] = n - 1
+    # bucket averages from cumulative sums, the last bucket is the last point
+    cx = numpy.concatenate(([0], numpy.cumsum(x)))
+    cy = numpy.concatenate(([0], numpy.nancumsum(y)))
+    cvalid = numpy.concatenate(([0], numpy.cumsum(~numpy.isnan(y))))
+    ends = numpy.append(starts[1:], n)
+    avg_x = (cx[ends] - cx[starts]) / (ends - starts)
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        # gaps are left out of the average, buckets of only gaps are NaN
+        avg_y = (cy[ends] - cy[starts]) / (cvalid[ends] - cvalid[starts])
+
+    selected = numpy.empty(threshold, dtype=int)
+    selected[0] = 0
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = starts[i], starts[i + 1]
+        next_y = avg_y[i + 1]
+        if numpy.isnan(next_y):
+            next_y = y[a]
+        area = numpy.abs(
+            (x[a] - avg_x[i + 1]) * (y[lo:hi] - y[a]) -
+            (x[a] - x[lo:hi]) * (next_y - y[a]))
+        area[numpy.isnan(area)] = -1
+        a = lo + int(numpy.argmax(area))
+        selected[i + 1] = a
+    selected[-1] = n - 1
+    return x[selected], y[selected]
+
+
+def _lttb_python(x, y, threshold):
+    n = len(x)
+    every = (n - 2) / (threshold - 2)
+    out_x, out_y = [x[0]], [y[0]]
+    a = 0
+    for i in range(threshold - 2):
+        lo = int(i * every) + 1
+        hi = int((i + 1) * every) + 1
+        avg_lo = hi
+        avg_hi = min(int((i + 2) * every) + 1, n)
+        ys = [v for v in y[avg_lo:avg_hi] if v is not None]
+        avg_x = sum(x[avg_lo:avg_hi]) / (avg_hi - avg_lo)
+        ya = y[a] or 0
+        avg_y = sum(ys) / len(ys) if ys else ya
+        best, best_area = lo, -1
+        for j in range(lo, hi):
+            if y[j] is None:
+                continue
+            area = abs((x[a] - avg_x) * (y[j] - ya) - (x[a] - x[j]) * (avg_y - ya))
+            if area > best_area:
+                best, best_area = j, area
+        a = best
+        out_x.append(x[a])
+        out_y.append(y[a])
+    out_x.append(x[-1])
+    out_y.append(y[-1])
+    return out_x, out_y
+
+
+def lttb(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets, keeps the points that best preserve the
+    visual shape of the series.
+
+    :param x: x values, must be sorted
+    :param y: y values
+    :param int threshold: The number of points to keep
+    :return: (x, y)
+    """
+    if threshold >= len(x) or threshold < 3:
+        return x, y
+    if numpy is not None and not isinstance(x, list):
+        return _lttb_numpy(x, y, threshold)
+    return _lttb_python(list(x), list(y), threshold)
+
+
+def _bucket_starts(n, buckets):
+    return [int(i * n / buckets) for i in range(buckets)]
+
+
+def minmax(x, y, threshold):
+    """
+    Keep the minimum and maximum point of each bucket, so spikes are never
+    dropped.
+
+    :param x: x values, must be sorted
+    :param y: y values
+    :param int threshold: The number of points to keep
+    :return: (x, y)
+    """
+    n = len(x)
+    buckets = threshold // 2
+    if threshold >= n or buckets < 1:
+        return x, y
+    starts = _bucket_starts(n, buckets)
+    ends = starts[1:] + [n]
+
+    if numpy is not None and not isinstance(x, list):
+        selected = []
+        filled = numpy.where(numpy.isnan(y), numpy.nanmean(y), y)
+        for lo, hi in zip(starts, ends):
+            selected.append(lo + int(numpy.argmin(filled[lo:hi])))
+            selected.append(lo + int(numpy.argmax(filled[lo:hi])))
+        selected = numpy.unique(selected)
+        return x[selected], y[selected]
+
+    selected = []
+    for lo, hi in zip(starts, ends):
+        points = [j for j in range(lo, hi) if y[j] is not None] or [lo]
+        selected.append(min(points, key=lambda j: y[j] if y[j] is not None else 0))
+        selected.append(max(points, key=lambda j: y[j] if y[j] is not None else 0))
+    selected = sorted(set(selected))
+    return [x[j] for j in selected], [y[j] for j in selected]
+
+
+def average(x, y, threshold):
+    """
+    Replace each bucket with the average of its points.
+
+    :param x: x values, must be sorted
+    :param y: y values
+    :param int threshold: The number of points to keep
+    :return: (x, y)
+    """
+    n = len(x)
+    if threshold >= n or threshold < 1:
+        return x, y
+    starts = _bucket_starts(n, threshold)
+
+    if numpy is not None and not isinstance(x, list):
+        counts = numpy.diff(numpy.append(starts, n))
+        valid = ~numpy.isnan(y)
+        y_sums = numpy.add.reduceat(numpy.where(valid, y, 0), starts)
+        y_counts = numpy.add.reduceat(valid.astype(int), starts)
+        with numpy.errstate(invalid='ignore', divide='ignore'):
+            out_y = y_sums / y_counts
+        return numpy.add.reduceat(x, starts) / counts, out_y
+
+    out_x, out_y = [], []
+    for lo, hi in zip(starts, starts[1:] + [n]):
+        ys = [v for v in y[lo:hi] if v is not None]
+        out_x.append(sum(x[lo:hi]) / (hi - lo))
+        out_y.append(sum(ys) / len(ys) if ys else None)
+    return out_x, out_y
+
+
+DECIMATORS = {
+    'lttb': lttb,
+    'minmax': minmax,
+    'average': average
+}
+
+
+def register_decimator(name, func):
+    """
+    Register a custom decimator so it can be used by name.
+
+    :param str name: The decimator name
+    :param func: A function ``func(x, y, threshold)`` returning ``(x, y)``
+    """
+    DECIMATORS[name] = func
+
+
+def get_decimator(method):
+    """
+    Look up a decimator by name, callables are returned as is.
+
+    :param method: A decimator name or function
+    """
+    if callable(method):
+        return method
+    try:
+        return DECIMATORS[method]
+    except KeyError:
+        raise ValueError('Unknown decimation method: %s' % method)
+
+
+def decimate_series(data, threshold, method='lttb', point_start=0, point_interval=1):
+    """
+    Decimate the ``data`` of a single series. Handles lists of y values,
+    lists of ``[x, y]`` points, NumPy arrays and two column
+    ``ColumnarSeries``. Any other format, like lists of point dicts, is
+    returned unchanged. Lists of y values become ``[x, y]`` points, using
+    ``point_start + index * point_interval`` as x, so the kept points stay in
+    their original positions.
+
+    :param data: The series data
+    :param int threshold: The number of points to keep
+    :param method: A decimator name or function
+    :param point_start: The x value of the first y value, ``pointStart``
+    :param point_interval: The x step between y values, ``pointInterval``
+    :return: The decimated data
+    """
+    if threshold is None or not hasattr(data, '__len__') or len(data) <= threshold:
+        return data
+    func = get_decimator(method)
+
+    if isinstance(data, ColumnarSeries):
+        if len(data.columns) != 2:
+            return data
+        x, y = data.columns
+        if numpy is not None:
+            try:
+                x, y = numpy.asarray(x, dtype=float), numpy.asarray(y, dtype=float)
+            except (TypeError, ValueError):
+                return data
+        elif not _is_numeric(x, y):
+            return data
+        return ColumnarSeries(*func(x, y, threshold))
+
+    if numpy is not None and isinstance(data, numpy.ndarray):
+        if data.dtype.kind not in 'biuf':
+            return data
+        if data.ndim == 1:
+            x = point_start + numpy.arange(len(data), dtype=float) * point_interval
+            x, y = func(x, data.astype(float), threshold)
+            return numpy.column_stack((x, y))
+        if data.ndim == 2 and data.shape[1] == 2:
+            x, y = func(data[:, 0].astype(float), data[:, 1].astype(float), threshold)
+            return numpy.column_stack((x, y))
+        return data
+
+    if not isinstance(data, (list, tuple)):
+        return data
+
+    first = data[0]
+    if isinstance(first, (list, tuple)):
+        if any(len(p) != 2 for p in data):
+            return data
+        x, y = [p[0] for p in data], [p[1] for p in data]
+    elif isinstance(first, (int, float)) or first is None:
+        x, y = [point_start + i * point_interval for i in range(len(data))], list(data)
+    else:
+        return data
+    if not _is_numeric(x, y):
+        return data
+
+    if numpy is not None:
+        x, y = numpy.asarray(x, dtype=float), numpy.asarray(y, dtype=float)
+    x, y = func(x, y, threshold)
+    if numpy is not None:
+        x, y = _nan_to_none(x), _nan_to_none(y)
+    return [list(p) for p in zip(x, y)]
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_numeric(x, y):
+    """
+    Check that every x is a number and every y is a number or None.
+    """
+    return all(map(_is_number, x)) and all(v is None or _is_number(v) for v in y)
+
+
+def _nan_to_none(arr):
+    if not isinstance(arr, numpy.ndarray):
+        return arr
+    return [None if v != v else v for v in arr.tolist()]
+
+
+def _has_categories(config):
+    axes = config.get('xAxis')
+    if isinstance(axes, dict):
+        axes = [axes]
+    return isinstance(axes, list) and any(
+        isinstance(axis, dict) and axis.get('categories') is not None for axis in axes)
+
+
+POINT_OPTIONS = ('pointStart', 'pointInterval', 'pointIntervalUnit')
+
+
+def _is_y_values(data):
+    if numpy is not None and isinstance(data, numpy.ndarray):
+        return data.ndim == 1
+    if isinstance(data, (list, tuple)) and data:
+        return not isinstance(data[0], (list, tuple, dict))
+    return False
+
+
+def _point_options(series, plot_options):
+    """
+    Get the ``pointStart`` options that apply to a series, from the series
+    itself or else from ``plotOptions``.
+    """
+    options = {}
+    if isinstance(plot_options, dict):
+        for key in ('series', series.get('type')):
+            if isinstance(plot_options.get(key), dict):
+                options.update((k, v) for k, v in plot_options[key].items()
+                               if k in POINT_OPTIONS)
+    options.update((k, v) for k, v in series.items() if k in POINT_OPTIONS)
+    return options
+
+
+def _decimate_series_dict(series, threshold, method, plot_options=None):
+    data = series['data']
+    if not _is_y_values(data):
+        return decimate_series(data, threshold, method)
+    options = _point_options(series, plot_options)
+    start, interval = options.get('pointStart', 0), options.get('pointInterval', 1)
+    if 'pointIntervalUnit' in options or not (_is_number(start) and _is_number(interval)):
+        # the x values can't be worked out, so keep the y values as they are
+        return data
+    return decimate_series(data, threshold, method, start, interval)
+
+
+def decimate_config(config, threshold, method='lttb'):
+    """
+    Decimate every series in a chart config. Accepts a config dict with a
+    ``series`` list or a plain list of series dicts. Only the changed series
+    are copied, the rest of the config is shared with the original, and the
+    config itself is returned when nothing was decimated. Configs with
+    ``xAxis.categories`` are returned as they are.
+
+    Lists of y values become ``[x, y]`` points, with x from the series'
+    ``pointStart`` and ``pointInterval``, which are then dropped from the
+    series. Series using ``pointIntervalUnit`` are left as they are.
+
+    :param config: The chart config or data
+    :param int threshold: The number of points to keep per series
+    :param method: A decimator name or function
+    :return: The decimated config
+    """
+    if threshold is None:
+        return config
+    if isinstance(config, dict):
+        series = config.get('series')
+        if not isinstance(series, list) or _has_categories(config):
+            return config
+        decimated = _decimate_series_list(series, threshold, method, config.get('plotOptions'))
+        if decimated is series:
+            return config
+        return dict(config, series=decimated)
+    if isinstance(config, list):
+        return _decimate_series_list(config, threshold, method)
+    return config
+
+
+def _decimate_series_list(series_list, threshold, method, plot_options=None):
+    result = []
+    changed = False
+    for series in series_list:
+        if isinstance(series, dict) and 'data' in series:
+            data = _decimate_series_dict(series, threshold, method, plot_options)
+            if data is not series['data']:
+                series = dict(series, data=data)
+                for key in ('pointStart', 'pointInterval'):
+                    series.pop(key, None)
+                changed = True
+        result.append(series)
+    return result if changed else series_list
+
+
+def decimate_chart(chart, threshold, method='lttb'):
+    """
+    Create a copy of a ``Chart`` with every series decimated.
+
+    :param Chart chart: The chart to decimate
+    :param int threshold: The number of points to keep per series
+    :param method: A decimator name or function
+    :rtype: Chart
+    """
+    config = decimate_config(chart.config, threshold, method)
+    if config is chart.config:
+        return chart
+    return chart.__class__(chart.slug, config)
+
+
+def prepare_chart(chart):
+    """
+    Decimate a chart before it's rendered or exported, with the
+    ``max_points`` and ``decimation`` settings. Charts are returned unchanged
+    when ``max_points`` is None.
+
+    :param Chart chart: The chart
+    :rtype: Chart
+    """
+    settings = ChartForgeSettings()
+    if settings.max_points is None:
+        return chart
+    return decimate_chart(chart, settings.max_points, settings.decimation)
@@ -1,9 +1,49 @@
-import json
+import asyncio
+import inspect
+import threading
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
 from django.template.loader import render_to_string
 from django.core.exceptions import ImproperlyConfigured
 
+from chartforge.cache import ResultCache, TemplateCache
+from chartforge.codec import loads
+from chartforge.decimation import decimate_config
+from chartforge.incremental import make_delta
+from chartforge.instrumentation import instrument_chart
 from chartforge.registry import charts_registry
+from chartforge.scheduler import get_snapshot, get_snapshot_time, is_computing
+from chartforge.settings import ChartForgeSettings
+from chartforge.utils import call_in_thread, run_sync
+
+
+_MISSING = object()
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class InvalidChartKwargs(ValueError):
+    """
+    Raised by ``DynamicChart.clean_kwargs()`` for kwargs a chart doesn't
+    accept.
+    """
+
+
+def get_data_executor():
+    """
+    Get the thread pool ``aget_data()`` runs sync ``get_data()`` calls in.
+    It's separate from the default executor so slow chart queries can't
+    starve other ``run_in_executor()`` users.
+
+    :rtype: ThreadPoolExecutor
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(ChartForgeSettings().data_workers)
+        return _executor
 
 
 class DynamicChart:
@@ -15,7 +55,18 @@ class DynamicChart:
     verbose_name = None
     template_name = None
     template = None
+    cache_template = True
+    decimation = 'lttb'
+    max_points = None
+    incremental = False
+    cursor_key = 'x'
+    refresh = None
+    refresh_kwargs = None
+    max_staleness = None
+    data_source = None
+    allowed_kwargs = None
     _wrapped_func = None
+    _data_cache = None
 
     def __call__(self, **kwargs):
         """
@@ -52,11 +103,29 @@ class DynamicChart:
         a chart template, but once a chart is created, the template is static.
         Use a custom ``get_data()`` method to add dynamic data sources.
 
+        The compiled template and parsed JSON are cached per chart class, set
+        ``cache_template = False`` to render from scratch every time.
+
         :return: dict
         """
         context = self.get_context_data(**kwargs)
-        result = render_to_string(self.template_name, context)
-        return json.loads(result)
+        if not self.cache_template:
+            return loads(render_to_string(self.template_name, context))
+        return self.get_template_cache().render(context, loads)
+
+    @classmethod
+    def get_template_cache(cls):
+        """
+        Get the ``TemplateCache`` for this chart class, creating it on first
+        use. A new cache is made if ``template_name`` was changed.
+
+        :return: TemplateCache
+        """
+        cache = cls.__dict__.get('_template_cache')
+        if cache is None or cache.template_name != cls.template_name:
+            cache = TemplateCache(cls.template_name)
+            cls._template_cache = cache
+        return cache
 
     def get_context_data(self, **kwargs):
         """
@@ -68,6 +137,54 @@ class DynamicChart:
         """
         return kwargs
 
+    def _data_func(self):
+        if self._wrapped_func is not None:
+            return self._wrapped_func
+        func = inspect.unwrap(type(self).get_data)
+        if func is DynamicChart.get_data and self.data_source is not None:
+            return None
+        return func.__get__(self)
+
+    def has_permission(self, request):
+        """
+        Check if the user of a request may load this chart from the data,
+        delta, events and dashboard views. Everyone may by default.
+
+        :param request: The HttpRequest
+        :rtype: bool
+        """
+        return True
+
+    def clean_kwargs(self, kwargs):
+        """
+        Check kwargs from a request before they're passed to the chart,
+        raising ``InvalidChartKwargs`` for any it doesn't accept. The views
+        answer those requests with a 400.
+
+        Only the names in ``allowed_kwargs`` are accepted when it's set.
+        Otherwise the ``filters`` of the ``data_source`` are, or the
+        arguments ``get_data()`` or the wrapped function take, anything when
+        they take ``**kwargs``. Override to convert or validate the values.
+
+        :param dict kwargs: The kwargs from the request
+        :return: dict
+        """
+        allowed = self.allowed_kwargs
+        if allowed is None:
+            func = self._data_func()
+            if func is None:
+                allowed = getattr(self.data_source, 'filters', None)
+            else:
+                params = inspect.signature(func).parameters.values()
+                if not any(p.kind == p.VAR_KEYWORD for p in params):
+                    allowed = [p.name for p in params if p.kind in (
+                        p.POSITIONAL_OR_KEYWORD, p.KEYWORD_ONLY)]
+        if allowed is not None:
+            unknown = sorted(set(kwargs) - set(allowed))
+            if unknown:
+                raise InvalidChartKwargs('Unknown chart kwargs: %s' % ', '.join(unknown))
+        return kwargs
+
     def get_editing_data(self, **kwargs):
         """
         Get data that is used when editing this report. Set to something cached
@@ -81,12 +198,141 @@ class DynamicChart:
     def get_data(self, **kwargs):
         """
         Override to do any querying or processing needed to make the chart data
-        dynamic.
+        dynamic. Can also be a coroutine function, see ``aget_data()``.
+        Without an override or wrapped function, the ``data_source`` is used
+        when set, see ``chartforge.datasource.QuerySetSource``.
         :param kwargs:
         :return: dict
         """
         func = self._wrapped_func
-        return func(**kwargs) if func is not None else kwargs
+        if func is not None:
+            result = func(**kwargs)
+        elif self.data_source is not None:
+            result = self.data_source.get_data(**kwargs)
+        else:
+            result = kwargs
+        if inspect.isawaitable(result):
+            result = run_sync(result)
+        return result
+
+    @classmethod
+    def has_async_data(cls):
+        """
+        Check if the wrapped function or ``get_data()`` override is a
+        coroutine function.
+
+        :rtype: bool
+        """
+        func = cls._wrapped_func
+        if func is None:
+            func = inspect.unwrap(cls.get_data)
+        return asyncio.iscoroutinefunction(func)
+
+    async def aget_data(self, **kwargs):
+        """
+        Async version of ``get_data()``. Coroutine functions are awaited
+        directly, sync ones run in the ``get_data_executor()`` pool so they
+        don't block the event loop. Snapshots and cached results are used as
+        with ``get_data()``, and concurrent calls for a missing result share
+        one computation.
+
+        :return: dict
+        """
+        if not self.has_async_data():
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                get_data_executor(), partial(call_in_thread, self.get_data, **kwargs))
+
+        if self.refresh is not None:
+            result = get_snapshot(type(self), kwargs, _MISSING)
+            if result is not _MISSING:
+                return result
+
+        func = self._wrapped_func
+        if func is not None:
+            compute = partial(func, **kwargs)
+        else:
+            compute = partial(inspect.unwrap(type(self).get_data), self, **kwargs)
+
+        cache = self._data_cache
+        if cache is None:
+            return await compute()
+        return await cache.aget_or_compute(kwargs, compute)
+
+    def get_version(self, **kwargs):
+        """
+        Override to return a cheap value that changes whenever the data for
+        ``kwargs`` does, like the latest ``updated`` timestamp of the rows it's
+        built from. The ``chart_data`` view makes its ETag from it, so clients
+        that have the current data get a 304 before ``get_data()`` runs.
+
+        By default charts with a ``refresh`` interval use the time their
+        snapshot was made, and charts using the ``data_source`` use its
+        version unless they have a ``cache_timeout``, which could pair a new
+        version with older cached data. None means unknown, and the data is
+        always sent.
+        """
+        if self.refresh is not None:
+            created = get_snapshot_time(type(self), kwargs)
+            if created is not None:
+                return created
+        uses_source = self._wrapped_func is None and \
+            inspect.unwrap(type(self).get_data) is DynamicChart.get_data
+        if uses_source and self.data_source is not None and self._data_cache is None:
+            return self.data_source.get_version(**kwargs)
+        return None
+
+    def get_decimated_data(self, max_points=None, **kwargs):
+        """
+        Get the data from ``get_data()`` with every series decimated down to
+        ``max_points``, or the ``max_points`` attribute when not passed. The
+        ``decimation`` attribute sets the method, one of the names in
+        ``chartforge.decimation.DECIMATORS`` or a function.
+
+        :param int max_points: Max points per series, None to disable
+        :return: dict
+        """
+        data = self.get_data(**kwargs)
+        if max_points is None:
+            max_points = self.max_points
+        if max_points is None:
+            return data
+        return decimate_config(data, max_points, self.decimation)
+
+    def get_delta(self, cursor=None, **kwargs):
+        """
+        Get only the points added after ``cursor``, see
+        ``chartforge.incremental.make_delta()``.
+
+        Set ``incremental = True`` when ``get_data()`` accepts a ``since``
+        kwarg and can query just the new points itself, otherwise the full
+        data is fetched and filtered.
+
+        :param cursor: The x value of the last point the client has
+        :return: dict
+        """
+        if self.incremental and cursor is not None:
+            data = self.get_data(since=cursor, **kwargs)
+        else:
+            data = self.get_data(**kwargs)
+        return make_delta(data, cursor, self.cursor_key)
+
+    @classmethod
+    def invalidate_data(cls, **kwargs):
+        """
+        Remove the cached ``get_data()`` result for ``kwargs``. Does nothing
+        when the chart wasn't registered with ``cache_timeout``.
+        """
+        if cls._data_cache is not None:
+            cls._data_cache.invalidate(kwargs)
+
+    @classmethod
+    def invalidate_all_data(cls):
+        """
+        Remove all of the cached ``get_data()`` results for this chart.
+        """
+        if cls._data_cache is not None:
+            cls._data_cache.invalidate_all()
 
     def __str__(self):
         kwargs = OrderedDict([
@@ -105,7 +351,48 @@ class DynamicChart:
         )
 
 
-def dynamic_chart(name=None, template_name=None, template=None, verbose_name=None):
+def _cache_data(get_data):
+    """
+    Wrap a ``get_data()`` method so results are stored in the chart class's
+    ``_data_cache``.
+    """
+    @wraps(get_data)
+    def cached_get_data(self, **kwargs):
+        return self._data_cache.get_or_compute(kwargs, lambda: get_data(self, **kwargs))
+    return cached_get_data
+
+
+def _sync_data(get_data):
+    """
+    Wrap a coroutine ``get_data()`` method so calling it from sync code runs
+    it to completion, ``aget_data()`` still awaits the original.
+    """
+    @wraps(get_data)
+    def sync_get_data(self, **kwargs):
+        return run_sync(get_data(self, **kwargs))
+    return sync_get_data
+
+
+def _serve_snapshot(get_data):
+    """
+    Wrap a ``get_data()`` method so snapshots made by the scheduler are
+    returned while they're fresh enough, except while the scheduler is
+    computing the next one.
+    """
+    @wraps(get_data)
+    def snapshot_get_data(self, **kwargs):
+        result = _MISSING
+        if not is_computing(type(self)):
+            result = get_snapshot(type(self), kwargs, _MISSING)
+        if result is _MISSING:
+            result = get_data(self, **kwargs)
+        return result
+    return snapshot_get_data
+
+
+def dynamic_chart(name=None, template_name=None, template=None, verbose_name=None,
+                  cache_timeout=None, cache_key=None, refresh=None, refresh_kwargs=None,
+                  max_staleness=None):
     """
     A function or class decorator that registers a chart with the chartforge
     registry.
@@ -133,6 +420,16 @@ def dynamic_chart(name=None, template_name=None, template=None, verbose_name=Non
     :param template_name: A name of a file to use for the template
     :param template: A dict to use as the template
     :param verbose_name: The name displayed to users in the admin
+    :param cache_timeout: Cache ``get_data()`` results for this many seconds
+    :param cache_key: A callable taking the chart kwargs and returning a
+        cache key, or a string formatted with the kwargs. By default all of the
+        kwargs are part of the key.
+    :param refresh: Precompute the data every this many seconds with the
+        ``chartforge_scheduler`` command, see ``chartforge.scheduler``
+    :param refresh_kwargs: List of kwargs dicts to precompute, defaults to
+        just the empty kwargs
+    :param max_staleness: Seconds a precomputed snapshot is served for,
+        defaults to twice ``refresh``
     :return:
     """
     def wrapper(cls_or_func):
@@ -161,6 +458,22 @@ def dynamic_chart(name=None, template_name=None, template=None, verbose_name=Non
 
         chart_class = type(_name, bases, attrs)
         chart_class.__doc__ = cls_or_func.__doc__
+
+        if asyncio.iscoroutinefunction(chart_class.get_data):
+            chart_class.get_data = _sync_data(chart_class.get_data)
+
+        if cache_timeout is not None:
+            chart_class._data_cache = ResultCache(
+                '%s.%s' % (app, _name), cache_timeout, cache_key)
+            chart_class.get_data = _cache_data(chart_class.get_data)
+
+        if refresh is not None:
+            chart_class.refresh = refresh
+            chart_class.refresh_kwargs = list(refresh_kwargs or [{}])
+            chart_class.max_staleness = refresh * 2 if max_staleness is None else max_staleness
+            chart_class.get_data = _serve_snapshot(chart_class.get_data)
+
+        instrument_chart(chart_class, '%s.%s' % (app, _name))
         charts_registry.register(app, _name, chart_class)
 
         return cls_or_func
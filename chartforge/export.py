@@ -0,0 +1,211 @@
+"""
+Chart export bundles. Each ``ExportType`` wrapper is compiled once into
+byte segments, and exporting a chart joins the segments with the serialized
+config in a single copy. Bundles have content hashed filenames and gzip and
+brotli variants so they can be served like any other static asset.
+"""
+import gzip
+import hashlib
+import io
+import re
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+from chartforge.base import ExportType
+from chartforge.codec import dumpb
+from chartforge.settings import ChartForgeSettings
+
+
+WRAPPERS = {
+    ExportType.IFRAME: (
+        '<!DOCTYPE html>\n'
+        '<html><head><meta charset="utf-8"><title>{{title}}</title>\n'
+        '<script src="{{highcharts_url}}"></script>\n'
+        '<style>html,body,#chart{margin:0;width:100%;height:100%}</style>\n'
+        '</head><body><div id="chart"></div>\n'
+        '<script>Highcharts.chart("chart", {{config}});</script>\n'
+        '</body></html>\n'
+    ),
+    ExportType.PLAIN_JS: (
+        '(function () {\n'
+        '  var config = {{config}};\n'
+        '  var render = function () { Highcharts.chart({{container}}, config); };\n'
+        '  if (document.readyState === "loading") {\n'
+        '    document.addEventListener("DOMContentLoaded", render);\n'
+        '  } else {\n'
+        '    render();\n'
+        '  }\n'
+        '})();\n'
+    ),
+    ExportType.REQUIRE_JS: (
+        'define(["highcharts"], function (Highcharts) {\n'
+        '  var config = {{config}};\n'
+        '  return {\n'
+        '    config: config,\n'
+        '    render: function (el) { return Highcharts.chart(el || {{container}}, config); }\n'
+        '  };\n'
+        '});\n'
+    ),
+    ExportType.UMD_JS: (
+        '(function (root, factory) {\n'
+        '  if (typeof define === "function" && define.amd) {\n'
+        '    define(["highcharts"], factory);\n'
+        '  } else if (typeof module === "object" && module.exports) {\n'
+        '    module.exports = factory(require("highcharts"));\n'
+        '  } else {\n'
+        '    root[{{global_name}}] = factory(root.Highcharts);\n'
+        '  }\n'
+        '}(typeof self !== "undefined" ? self : this, function (Highcharts) {\n'
+        '  var config = {{config}};\n'
+        '  return {\n'
+        '    config: config,\n'
+        '    render: function (el) { return Highcharts.chart(el || {{container}}, config); }\n'
+        '  };\n'
+        '}));\n'
+    )
+}
+
+CONTENT_TYPES = {
+    ExportType.IFRAME: ('text/html; charset=utf-8', 'html'),
+    ExportType.PLAIN_JS: ('application/javascript; charset=utf-8', 'js'),
+    ExportType.REQUIRE_JS: ('application/javascript; charset=utf-8', 'js'),
+    ExportType.UMD_JS: ('application/javascript; charset=utf-8', 'js')
+}
+
+_PLACEHOLDER = re.compile(r'\{\{(\w+)\}\}')
+_compiled = {}
+
+
+def compile_wrapper(export_type):
+    """
+    Split a wrapper into a list of byte segments and placeholder names,
+    compiled once per export type.
+
+    :param ExportType export_type: The export type
+    :rtype: list
+    """
+    compiled = _compiled.get(export_type)
+    if compiled is None:
+        compiled = []
+        for i, part in enumerate(_PLACEHOLDER.split(WRAPPERS[export_type])):
+            # odd parts are the placeholder names
+            compiled.append(part if i % 2 else part.encode('utf-8'))
+        _compiled[export_type] = compiled
+    return compiled
+
+
+def _script_json(obj):
+    # escape '</' so the config can't close the script tag it's embedded in
+    return dumpb(obj).replace(b'</', b'<\\/')
+
+
+def _gzip(data):
+    buf = io.BytesIO()
+    # no timestamp so the output only depends on the content
+    with gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=9, mtime=0) as f:
+        f.write(data)
+    return buf.getvalue()
+
+
+class ExportBundle:
+    """
+    An exported chart with its precompressed variants.
+    """
+    def __init__(self, slug, export_type, content):
+        self.slug = slug
+        self.export_type = export_type
+        self.content = content
+        self.content_type, self.extension = CONTENT_TYPES[export_type]
+        self.digest = hashlib.sha256(content).hexdigest()
+        self._gzip = None
+        self._brotli = None
+
+    @property
+    def filename(self):
+        """
+        Content hashed filename, safe to cache forever.
+        """
+        kind = 'html' if self.export_type == ExportType.IFRAME else self.export_type
+        return '%s.%s.%s.%s' % (self.slug, kind, self.digest[:12], self.extension)
+
+    @property
+    def gzip(self):
+        if self._gzip is None:
+            self._gzip = _gzip(self.content)
+        return self._gzip
+
+    @property
+    def brotli(self):
+        """
+        Brotli compressed content, None when brotli isn't installed.
+        """
+        if self._brotli is None and brotli is not None:
+            self._brotli = brotli.compress(self.content, quality=11)
+        return self._brotli
+
+    def variants(self):
+        """
+        Get the ``(filename, bytes)`` of every variant.
+
+        :rtype: list
+        """
+        variants = [(self.filename, self.content), (self.filename + '.gz', self.gzip)]
+        if self.brotli is not None:
+            variants.append((self.filename + '.br', self.brotli))
+        return variants
+
+
+def export_chart(chart, export_type=None):
+    """
+    Export a chart using a precompiled wrapper.
+
+    :param Chart chart: The chart to export
+    :param ExportType export_type: The export type, defaults to plain js
+    :rtype: ExportBundle
+    """
+    export_type = export_type or ExportType.PLAIN_JS
+    title = (chart.config.get('title') or {}).get('text') or chart.slug
+    slug = str(chart.slug)
+    values = {
+        'config': _script_json(chart.config),
+        'container': dumpb('chartforge-%s' % slug),
+        'global_name': dumpb('chartforge_%s' % re.sub(r'\W', '_', slug)),
+        'title': str(title).replace('&', '&amp;').replace('<', '&lt;').encode('utf-8'),
+        'highcharts_url': ChartForgeSettings().highcharts_url.encode('utf-8')
+    }
+    content = b''.join(
+        values[part] if isinstance(part, str) else part
+        for part in compile_wrapper(export_type))
+    return ExportBundle(slug, export_type, content)
+
+
+def write_exports(charts, export_types=None, storage=None, prefix='chartforge/exports'):
+    """
+    Export many charts and write every variant to a storage. Files that
+    already exist are skipped, the hashed names mean they can't have
+    changed.
+
+    :param charts: iterable of Chart
+    :param export_types: The export types, defaults to all of them
+    :param storage: A django storage, defaults to ``staticfiles_storage``
+    :param str prefix: Directory in the storage
+    :return: dict of (slug, export type) to the stored path
+    """
+    from django.core.files.base import ContentFile
+    if storage is None:
+        from django.contrib.staticfiles.storage import staticfiles_storage as storage
+
+    export_types = export_types or list(WRAPPERS)
+    paths = {}
+    for chart in charts:
+        for export_type in export_types:
+            bundle = export_chart(chart, export_type)
+            for filename, data in bundle.variants():
+                path = '%s/%s' % (prefix, filename)
+                if not storage.exists(path):
+                    storage.save(path, ContentFile(data))
+            paths[(bundle.slug, export_type)] = '%s/%s' % (prefix, bundle.filename)
+    return paths
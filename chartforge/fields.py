@@ -1,10 +1,35 @@
-from django.db.models.fields import CharField
+from django.db.models.fields import BinaryField, CharField
 
 from chartforge.registry import get_chart_class, is_chart_class
+from chartforge.storage import decode_config, encode_config
 
 
 class ChartClassField(CharField):
     """
     Custom Django model field to support saving a chart class to a model.
     """
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('max_length', 255)
+        super().__init__(*args, **kwargs)
 
+
+class ConfigField(BinaryField):
+    """
+    Binary model field holding a config encoded with
+    ``chartforge.storage.encode_config()``. Values are decoded when loaded
+    and encoded when saved, so the attribute is always the plain config.
+    """
+    def from_db_value(self, value, *args):
+        if value is None:
+            return None
+        return decode_config(value)
+
+    def to_python(self, value):
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return decode_config(value)
+        return value
+
+    def get_db_prep_value(self, value, connection, prepared=False):
+        if value is not None and not isinstance(value, (bytes, bytearray, memoryview)):
+            value = encode_config(value)
+        return super().get_db_prep_value(value, connection, prepared)
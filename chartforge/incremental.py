@@ -0,0 +1,158 @@
+"""
+Incremental chart updates. A delta holds only the points added after a
+cursor, which is the x value (a timestamp or id) of the last point the client
+has, so live charts don't have to resend whole series.
+"""
+import datetime
+
+from django.utils.dateparse import parse_date, parse_datetime
+
+from chartforge.arrays import ColumnarSeries, is_array, to_list
+from chartforge.utils import to_timestamp
+
+
+class InvalidCursor(ValueError):
+    """
+    Raised when a cursor can't be compared with the x values of a chart.
+    """
+
+
+def parse_cursor(value):
+    """
+    Parse a cursor from a query string, numbers are converted and anything
+    else, like ISO dates, is kept as a string.
+
+    :param str value: The raw cursor
+    """
+    if value is None or value == '':
+        return None
+    for cast in (int, float):
+        try:
+            return cast(value)
+        except ValueError:
+            pass
+    return value
+
+
+def point_cursor(point, index, cursor_key='x'):
+    """
+    Get the cursor value of a point: the x of ``[x, y]`` points, the
+    ``cursor_key`` of point dicts, or the index of plain y values.
+    """
+    if isinstance(point, dict):
+        return point.get(cursor_key, index)
+    if isinstance(point, (list, tuple)) and len(point) > 1:
+        return point[0]
+    return index
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def coerce_cursor(cursor, value):
+    """
+    Convert a cursor parsed from a query string to the type of the x values
+    it's compared with: ISO strings become dates or datetimes, and numbers
+    become strings for string x values. Numbers are kept for date and
+    datetime x values, they're the milliseconds since the epoch the codecs
+    write, see ``after_cursor()``. Raises ``InvalidCursor`` when none of
+    that is possible, like a date cursor for numeric x values.
+
+    :param cursor: The parsed cursor
+    :param value: An x value of the chart data
+    """
+    if cursor is None or value is None:
+        return cursor
+    if _is_number(value):
+        if _is_number(cursor):
+            return cursor
+    elif isinstance(value, datetime.date) and _is_number(cursor):
+        return cursor
+    elif isinstance(value, datetime.datetime):
+        if isinstance(cursor, datetime.datetime):
+            return cursor
+        parsed = parse_datetime(cursor) if isinstance(cursor, str) else None
+        if parsed is not None and (parsed.tzinfo is None) == (value.tzinfo is None):
+            return parsed
+    elif isinstance(value, datetime.date):
+        if isinstance(cursor, datetime.date) and not isinstance(cursor, datetime.datetime):
+            return cursor
+        parsed = parse_date(cursor) if isinstance(cursor, str) else None
+        if parsed is not None:
+            return parsed
+    elif isinstance(value, str):
+        return cursor if isinstance(cursor, str) else str(cursor)
+    else:
+        try:
+            value > cursor
+            return cursor
+        except TypeError:
+            pass
+    raise InvalidCursor('Cursor %r does not match the x values of this chart' % (cursor,))
+
+
+def after_cursor(value, cursor):
+    """
+    Check if an x value comes after a cursor converted by
+    ``coerce_cursor()``. Dates and datetimes are compared as epoch
+    milliseconds with numeric cursors.
+    """
+    if _is_number(cursor):
+        return to_timestamp(value) > cursor
+    return value > cursor
+
+
+def _series_list(data):
+    if isinstance(data, dict):
+        data = data.get('series')
+    return data if isinstance(data, list) else []
+
+
+def make_delta(data, cursor=None, cursor_key='x'):
+    """
+    Build a delta from chart data, keeping only points after ``cursor``.
+
+    :param data: A config dict with ``series`` or a list of series dicts
+    :param cursor: The client's cursor, None to send every point. It's
+        converted to the type of the x values with ``coerce_cursor()``
+    :param str cursor_key: The key holding the cursor in point dicts
+    :return: dict with the new ``cursor`` and the changed ``series``, each
+        with its ``index``, ``id`` when set, and new ``data``. Date cursors
+        are encoded as epoch milliseconds like the x values, so clients can
+        send them back as they are
+    """
+    new_cursor = None
+    changed = []
+    for i, series in enumerate(_series_list(data)):
+        if not isinstance(series, dict):
+            continue
+        points = series.get('data') or []
+        if isinstance(points, ColumnarSeries):
+            points = points.tolist()
+        elif is_array(points):
+            points = to_list(points)
+
+        after = None
+        new_points = []
+        for j, point in enumerate(points):
+            value = point_cursor(point, j, cursor_key)
+            if cursor is None:
+                new_points.append(point)
+            elif value is None:
+                # points without an x can't be placed after the cursor
+                continue
+            else:
+                if after is None:
+                    after = coerce_cursor(cursor, value)
+                if not after_cursor(value, after):
+                    continue
+                new_points.append(point)
+            if value is not None and (new_cursor is None or value > new_cursor):
+                new_cursor = value
+        if new_points:
+            entry = {'index': i, 'data': new_points}
+            if 'id' in series:
+                entry['id'] = series['id']
+            changed.append(entry)
+    return {'cursor': cursor if new_cursor is None else new_cursor, 'series': changed}
@@ -0,0 +1,489 @@
+"""
+Timing, payload sizes and cache hit ratios for charts.
+
+Everything is off unless the ``instrumentation`` setting is True. The stage
+wrappers are always installed and check the setting on every call, so it can
+be changed with ``override_settings()`` at runtime. When on:
+
+- The ``DynamicChart`` stages ``call``, ``context``, ``template`` and ``data``
+  are timed for every registered chart class. So are ``serialize`` and every
+  backend call, as ``backend.<method>``. Timings go into a histogram per stage
+  and name. Names are chart classes, backends or Highcharts chart types, never
+  chart slugs, so the number of series stays bounded.
+- ``ResultCache`` lookups count hits and misses per cache.
+- ``Chart.serialize()`` counts payload bytes.
+- Each of these also sends a signal from ``chartforge.signals``. The
+  ``statsd`` setting connects a ``StatsdExporter`` to them.
+- A ``profile_rate`` fraction of the calls to the charts listed in the
+  ``profile_charts`` setting run under cProfile. The stats are added up per
+  chart, see ``get_profile()``.
+
+``metrics.prometheus_text()`` and the ``chartforge_metrics`` view expose the
+collected metrics in the Prometheus text format. The view is for staff users
+only unless the ``metrics_public`` setting is True.
+"""
+import asyncio
+import cProfile
+import functools
+import os
+import pstats
+import random
+import re
+import socket
+import threading
+import time
+from bisect import bisect_left
+
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from chartforge import signals
+from chartforge.settings import ChartForgeSettings
+
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+CHART_STAGES = (
+    ('__call__', 'call'),
+    ('get_context_data', 'context'),
+    ('render_template', 'template'),
+    ('get_data', 'data')
+)
+
+# the Highcharts series types, anything else is counted as 'other'
+CHART_TYPES = frozenset((
+    'area', 'arearange', 'areaspline', 'areasplinerange', 'bar', 'boxplot', 'bubble',
+    'column', 'columnrange', 'errorbar', 'funnel', 'gauge', 'heatmap', 'line', 'pie',
+    'polygon', 'pyramid', 'sankey', 'scatter', 'solidgauge', 'spline', 'treemap',
+    'waterfall'
+))
+
+_settings = None
+_local = threading.local()
+
+
+def get_settings():
+    global _settings
+    if _settings is None:
+        _settings = ChartForgeSettings()
+    return _settings
+
+
+@receiver(setting_changed)
+def _reset_settings(setting, **kwargs):
+    global _settings
+    if setting == 'CHART_FORGE':
+        _settings = None
+
+
+def enabled():
+    """
+    Check if the ``instrumentation`` setting is on.
+
+    :rtype: bool
+    """
+    return get_settings().instrumentation
+
+
+def chart_type(config):
+    """
+    Get the metrics name for a chart config: its Highcharts ``chart.type``,
+    'line' when unset and 'other' for unknown types.
+
+    :param dict config: The chart config
+    :rtype: str
+    """
+    chart = config.get('chart') if isinstance(config, dict) else None
+    name = chart.get('type', 'line') if isinstance(chart, dict) else 'line'
+    return name if name in CHART_TYPES else 'other'
+
+
+class Histogram:
+    """
+    Counts observations into buckets by upper bound, like a Prometheus
+    histogram.
+    """
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """
+        Get the cumulative count for each bucket.
+
+        :return: list of (upper bound, count), ending with ``inf``
+        """
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _bound(value):
+    return '+Inf' if value == float('inf') else repr(float(value))
+
+
+class Metrics:
+    """
+    Collects the stage timings, payload sizes and cache hits in memory, per
+    process.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            # (stage, name) -> Histogram
+            self.timings = {}
+            # (stage, name) -> [payloads, bytes]
+            self.payloads = {}
+            # cache -> [hits, misses]
+            self.caches = {}
+
+    def observe(self, stage, name, duration):
+        with self._lock:
+            histogram = self.timings.get((stage, name))
+            if histogram is None:
+                histogram = self.timings[(stage, name)] = Histogram()
+            histogram.observe(duration)
+
+    def add_payload(self, stage, name, size):
+        with self._lock:
+            counts = self.payloads.setdefault((stage, name), [0, 0])
+            counts[0] += 1
+            counts[1] += size
+
+    def add_cache(self, cache, hit):
+        with self._lock:
+            self.caches.setdefault(cache, [0, 0])[0 if hit else 1] += 1
+
+    def hit_ratio(self, cache):
+        """
+        Get the fraction of lookups that were hits for a cache.
+
+        :param str cache: The cache prefix
+        :return: float, or None when there were no lookups
+        """
+        hits, misses = self.caches.get(cache, (0, 0))
+        total = hits + misses
+        return hits / total if total else None
+
+    def slowest(self, stage='call', count=10):
+        """
+        Get the names with the highest mean duration for a stage.
+
+        :param str stage: The stage name
+        :param int count: The number of results
+        :return: list of (name, mean seconds, calls)
+        """
+        with self._lock:
+            rows = [
+                (name, h.sum / h.count, h.count)
+                for (s, name), h in self.timings.items() if s == stage and h.count
+            ]
+        return sorted(rows, key=lambda row: row[1], reverse=True)[:count]
+
+    def prometheus_text(self):
+        """
+        Format the metrics in the Prometheus text exposition format.
+
+        :rtype: str
+        """
+        with self._lock:
+            timings = sorted(self.timings.items())
+            payloads = sorted(self.payloads.items())
+            caches = sorted((k, list(v)) for k, v in self.caches.items())
+
+        lines = [
+            '# HELP chartforge_stage_seconds Time spent in chart stages and backend calls.',
+            '# TYPE chartforge_stage_seconds histogram'
+        ]
+        for (stage, name), histogram in timings:
+            labels = 'stage="%s",name="%s"' % (_label(stage), _label(name))
+            for bound, count in histogram.cumulative():
+                lines.append('chartforge_stage_seconds_bucket{%s,le="%s"} %d' % (
+                    labels, _bound(bound), count))
+            lines.append('chartforge_stage_seconds_sum{%s} %r' % (labels, histogram.sum))
+            lines.append('chartforge_stage_seconds_count{%s} %d' % (labels, histogram.count))
+
+        lines.append('# HELP chartforge_payload_bytes_total Bytes of serialized chart payloads.')
+        lines.append('# TYPE chartforge_payload_bytes_total counter')
+        for (stage, name), (_, size) in payloads:
+            lines.append('chartforge_payload_bytes_total{stage="%s",name="%s"} %d' % (
+                _label(stage), _label(name), size))
+        lines.append('# HELP chartforge_payloads_total Number of serialized chart payloads.')
+        lines.append('# TYPE chartforge_payloads_total counter')
+        for (stage, name), (count, _) in payloads:
+            lines.append('chartforge_payloads_total{stage="%s",name="%s"} %d' % (
+                _label(stage), _label(name), count))
+
+        lines.append('# HELP chartforge_cache_requests_total Chart data cache lookups.')
+        lines.append('# TYPE chartforge_cache_requests_total counter')
+        for cache, (hits, misses) in caches:
+            lines.append('chartforge_cache_requests_total{cache="%s",result="hit"} %d' % (
+                _label(cache), hits))
+            lines.append('chartforge_cache_requests_total{cache="%s",result="miss"} %d' % (
+                _label(cache), misses))
+        lines.append('# HELP chartforge_cache_hit_ratio Fraction of cache lookups that were hits.')
+        lines.append('# TYPE chartforge_cache_hit_ratio gauge')
+        for cache, (hits, misses) in caches:
+            lines.append('chartforge_cache_hit_ratio{cache="%s"} %r' % (
+                _label(cache), hits / (hits + misses)))
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+# Recording
+
+def record_stage(stage, name, duration):
+    metrics.observe(stage, name, duration)
+    signals.stage_finished.send(sender=None, stage=stage, name=name, duration=duration)
+
+
+def record_payload(stage, name, size):
+    if not enabled():
+        return
+    metrics.add_payload(stage, name, size)
+    signals.payload_serialized.send(sender=None, stage=stage, name=name, size=size)
+
+
+def record_cache(cache, hit):
+    if not enabled():
+        return
+    metrics.add_cache(cache, hit)
+    signals.cache_accessed.send(sender=None, cache=cache, hit=hit)
+
+
+class _Timer:
+    def __init__(self, stage, name):
+        self.stage = stage
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record_stage(self.stage, self.name, time.perf_counter() - self.start)
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_null_timer = _NullTimer()
+
+
+def timed(stage, name):
+    """
+    Context manager timing its block as ``stage`` for ``name``. Does nothing
+    when instrumentation is off.
+
+    :param str stage: The stage name
+    :param str name: The chart or backend name
+    """
+    if not enabled():
+        return _null_timer
+    return _Timer(stage, name)
+
+
+def instrument(func, stage, name, profile=False):
+    """
+    Wrap a function so every call is timed as ``stage`` for ``name``. Calls
+    made while instrumentation is off go straight to ``func``.
+
+    :param func: The function or coroutine function
+    :param str stage: The stage name
+    :param str name: The chart or backend name
+    :param bool profile: Profile sampled calls, see ``should_profile()``.
+        Only the outermost instrumented call in a thread is profiled.
+    :return: The wrapped function
+    """
+    if asyncio.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            if not enabled():
+                return await func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                record_stage(stage, name, time.perf_counter() - start)
+        async_wrapper._chartforge_instrumented = True
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not enabled():
+            return func(*args, **kwargs)
+        depth = getattr(_local, 'depth', 0)
+        profiler = None
+        if profile and not depth and should_profile(name):
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # another profiler is already running
+                profiler = None
+
+        _local.depth = depth + 1
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            duration = time.perf_counter() - start
+            _local.depth = depth
+            if profiler is not None:
+                profiler.disable()
+                add_profile(name, profiler)
+            record_stage(stage, name, duration)
+    wrapper._chartforge_instrumented = True
+    return wrapper
+
+
+def instrument_chart(chart_class, name):
+    """
+    Time the stages of a chart class, see ``CHART_STAGES``. Called by
+    ``dynamic_chart()`` for every registered chart.
+
+    :param chart_class: A DynamicChart subclass
+    :param str name: The chart name used in metrics, like 'app.MyChart'
+    """
+    for attr, stage in CHART_STAGES:
+        func = getattr(chart_class, attr)
+        if getattr(func, '_chartforge_instrumented', False):
+            # inherited from another registered chart, only time it once
+            # under this chart's name
+            func = func.__wrapped__
+        setattr(chart_class, attr, instrument(func, stage, name, True))
+
+
+# Profiling
+
+_profiles = {}
+_profiles_lock = threading.Lock()
+
+
+def should_profile(name):
+    """
+    Decide if a call to a chart should be profiled, based on the
+    ``profile_charts`` and ``profile_rate`` settings.
+
+    :param str name: The chart name
+    :rtype: bool
+    """
+    settings = get_settings()
+    charts = settings.profile_charts
+    if not charts or (name not in charts and '*' not in charts):
+        return False
+    return random.random() < settings.profile_rate
+
+
+def add_profile(name, profiler):
+    """
+    Add a profiled call to the stats for a chart.
+
+    :param str name: The chart name
+    :param cProfile.Profile profiler: The finished profiler
+    """
+    stats = pstats.Stats(profiler)
+    with _profiles_lock:
+        total = _profiles.get(name)
+        if total is None:
+            _profiles[name] = pstats.Stats(profiler)
+        else:
+            total.add(stats)
+    signals.chart_profiled.send(sender=None, name=name, stats=stats)
+
+
+def get_profile(name):
+    """
+    Get the combined stats of every profiled call to a chart.
+
+    :param str name: The chart name
+    :return: pstats.Stats, or None when no calls were profiled
+    """
+    with _profiles_lock:
+        return _profiles.get(name)
+
+
+def dump_profiles(directory):
+    """
+    Write the profile stats of every chart to ``<name>.prof`` files, for
+    ``python -m pstats`` or snakeviz.
+
+    :param str directory: The directory to write to
+    :return: list of paths written
+    """
+    os.makedirs(directory, exist_ok=True)
+    with _profiles_lock:
+        profiles = list(_profiles.items())
+    paths = []
+    for name, stats in profiles:
+        path = os.path.join(directory, '%s.prof' % name)
+        stats.dump_stats(path)
+        paths.append(path)
+    return paths
+
+
+# Exporters
+
+class StatsdExporter:
+    """
+    Sends the instrumentation signals to a statsd server over UDP. Stage
+    timings are sent as timers, cache lookups and payload bytes as counters.
+    Connected in ``ready()`` when the ``statsd`` setting is set to a dict of
+    these arguments.
+    """
+    def __init__(self, host='localhost', port=8125, prefix='chartforge'):
+        self.address = (host, port)
+        self.prefix = prefix
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def connect(self):
+        signals.stage_finished.connect(self.on_stage, weak=False)
+        signals.cache_accessed.connect(self.on_cache, weak=False)
+        signals.payload_serialized.connect(self.on_payload, weak=False)
+
+    def disconnect(self):
+        signals.stage_finished.disconnect(self.on_stage)
+        signals.cache_accessed.disconnect(self.on_cache)
+        signals.payload_serialized.disconnect(self.on_payload)
+
+    def metric(self, *parts):
+        return '.'.join([self.prefix] + [re.sub(r'[^\w-]', '_', str(p)) for p in parts])
+
+    def send(self, line):
+        try:
+            self.socket.sendto(line.encode('utf-8'), self.address)
+        except OSError:
+            pass
+
+    def on_stage(self, sender, stage, name, duration, **kwargs):
+        self.send('%s:%.3f|ms' % (self.metric('stage', stage, name), duration * 1000))
+
+    def on_cache(self, sender, cache, hit, **kwargs):
+        self.send('%s:1|c' % self.metric('cache', cache, 'hit' if hit else 'miss'))
+
+    def on_payload(self, sender, stage, name, size, **kwargs):
+        self.send('%s:%d|c' % (self.metric('payload', stage, name), size))
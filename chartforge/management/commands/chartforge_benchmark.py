@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from chartforge.benchmarks import SIZES, compare, load_results, run_benchmarks, save_results
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the chart pipeline on synthetic data, optionally comparing against a baseline.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'names', nargs='*',
+            help='Benchmarks to run, by name or prefix like "chart.". Defaults to all.')
+        parser.add_argument(
+            '--size', action='append', dest='sizes', choices=sorted(SIZES),
+            help='Dataset size, can be repeated. Defaults to small.')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per benchmark.')
+        parser.add_argument(
+            '--min-time', type=float, default=0.2, help='Minimum seconds per timed run.')
+        parser.add_argument('--output', help='Write the results as JSON to this file.')
+        parser.add_argument('--baseline', help='Compare against results saved with --output.')
+        parser.add_argument(
+            '--threshold', type=float, default=0.1,
+            help='Allowed slowdown against the baseline, 0.1 is 10%%.')
+
+    def handle(self, *args, **options):
+        baseline = load_results(options['baseline']) if options['baseline'] else None
+        results = run_benchmarks(
+            options['sizes'] or ['small'], options['names'], options['repeat'],
+            options['min_time'], log=self.stdout.write)
+        if options['output']:
+            save_results(results, options['output'])
+
+        if baseline is None:
+            return
+        regressions = []
+        for name, size, before, after, ratio in compare(results, baseline):
+            line = '%s [%s]: %.6fs -> %.6fs (%+.1f%%)' % (
+                name, size, before, after, (ratio - 1) * 100)
+            if ratio > 1 + options['threshold']:
+                regressions.append(line)
+                self.stdout.write(self.style.ERROR(line))
+            else:
+                self.stdout.write(line)
+        if regressions:
+            raise CommandError('%d benchmark(s) regressed by more than %d%%' % (
+                len(regressions), options['threshold'] * 100))
@@ -0,0 +1,70 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from chartforge.codec import dumps, loads
+from chartforge.models import Chart, ChartTemplate
+from chartforge.storage import CODEC_IDS, default_codec, encode_config
+
+
+class Command(BaseCommand):
+    help = 'Convert chart configs between JSON text and encoded binary storage.'
+
+    # model, [(text field, blob field), ...]
+    fields = [
+        (Chart, [('config', 'config_blob')]),
+        (ChartTemplate, [('chart_config', 'chart_config_blob'),
+                         ('example_data', 'example_data_blob')])
+    ]
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--codec', dest='codec', default=None, choices=sorted(CODEC_IDS),
+            help='Codec to encode with, defaults to the config_storage setting.')
+        parser.add_argument(
+            '--to-json', action='store_true', dest='to_json', default=False,
+            help='Convert encoded configs back to JSON text.')
+        parser.add_argument(
+            '--batch-size', type=int, dest='batch_size', default=500)
+
+    def handle(self, *args, **options):
+        codec = options['codec'] or default_codec()
+        if codec is None and not options['to_json']:
+            raise CommandError('Set the config_storage setting or pass --codec')
+
+        for model, fields in self.fields:
+            count = self.convert(model, fields, codec, options['to_json'], options['batch_size'])
+            self.stdout.write('Converted %d %s rows' % (count, model._meta.verbose_name))
+
+    def convert(self, model, fields, codec, to_json, batch_size):
+        text_fields = [text for text, _ in fields]
+        blob_fields = [blob for _, blob in fields]
+        if to_json:
+            queryset = model.objects.filter(**{'%s__isnull' % blob_fields[0]: False})
+        else:
+            queryset = model.objects.filter(**{'%s__isnull' % blob_fields[0]: True})
+        queryset = queryset.only('pk', *(text_fields + blob_fields)).order_by('pk')
+
+        count = 0
+        last_pk = None
+        while True:
+            batch = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            batch = list(batch[:batch_size])
+            if not batch:
+                return count
+            with transaction.atomic():
+                for obj in batch:
+                    updates = {}
+                    for text, blob in fields:
+                        if to_json:
+                            value = getattr(obj, blob)
+                            updates[text] = dumps(value) if value is not None else ''
+                            updates[blob] = None
+                        else:
+                            # encode here so the requested codec is used
+                            # instead of the setting
+                            value = getattr(obj, text)
+                            updates[text] = ''
+                            updates[blob] = encode_config(loads(value), codec) if value else None
+                    model.objects.filter(pk=obj.pk).update(**updates)
+            count += len(batch)
+            last_pk = batch[-1].pk
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from chartforge.backends import get_backend_manager
+from chartforge.export import WRAPPERS, write_exports
+
+
+class Command(BaseCommand):
+    help = 'Export charts with precompressed, content hashed filenames to static storage.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('slugs', nargs='*', help='Charts to export, defaults to all.')
+        parser.add_argument(
+            '--type', action='append', dest='export_types', choices=sorted(WRAPPERS),
+            help='Export type, can be repeated. Defaults to all types.')
+        parser.add_argument(
+            '--prefix', dest='prefix', default='chartforge/exports',
+            help='Directory in the static storage.')
+
+    def handle(self, *args, **options):
+        manager = get_backend_manager()
+        if options['slugs']:
+            found = manager.get_charts_by_slugs(options['slugs'])
+            missing = [slug for slug in options['slugs'] if slug not in found]
+            if missing:
+                raise CommandError('No charts found for: %s' % ', '.join(missing))
+            charts = list(found.values())
+        else:
+            charts = manager.get_charts()
+
+        charts = [manager.prepare_chart(chart) for chart in charts]
+        paths = write_exports(charts, options['export_types'], prefix=options['prefix'])
+        for (slug, export_type), path in sorted(paths.items()):
+            self.stdout.write('%s %s: %s' % (slug, export_type, path))
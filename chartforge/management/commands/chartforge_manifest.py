@@ -0,0 +1,25 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from chartforge.manifest import write_manifest
+from chartforge.settings import ChartForgeSettings
+
+
+class Command(BaseCommand):
+    help = 'Write a manifest of all registered charts, used to speed up startup.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output', '-o', dest='output', default=None,
+            help='Manifest path, defaults to the manifest setting.')
+
+    def handle(self, *args, **options):
+        path = options['output'] or ChartForgeSettings().manifest
+        if not path:
+            raise CommandError('Set the manifest setting or pass --output')
+
+        # probe every app, an existing manifest may be missing new modules
+        apps.get_app_config('chartforge').import_chart_apps()
+        manifest = write_manifest(path)
+        self.stdout.write('Wrote %d charts from %d modules to %s' % (
+            len(manifest['charts']), len(manifest['modules']), path))
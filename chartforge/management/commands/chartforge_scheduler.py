@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from chartforge.scheduler import Scheduler
+
+
+class Command(BaseCommand):
+    help = 'Precompute the data of charts registered with a refresh interval.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'charts', nargs='*', help='Chart keys to refresh, like app.MyChart. Defaults to all.')
+        parser.add_argument(
+            '--once', action='store_true', dest='once',
+            help='Run the jobs that are due and exit, for running from cron.')
+        parser.add_argument('--workers', type=int, help='Worker processes.')
+
+    def handle(self, *args, **options):
+        try:
+            scheduler = Scheduler(options['workers'], options['charts'])
+        except KeyError as e:
+            raise CommandError(e.args[0])
+        scheduler.run(once=options['once'])
@@ -0,0 +1,99 @@
+"""
+Reading and writing the chart manifest. The manifest lists every registered
+chart and the module it lives in, so ``ChartForgeConfig.ready()`` can import
+exactly those modules instead of probing every app for a ``charts`` module.
+"""
+import json
+import os
+
+from django.template import TemplateDoesNotExist
+from django.template.loader import get_template
+
+from chartforge.registry import charts_registry
+
+
+MANIFEST_VERSION = 1
+
+
+def _template_path(template_name):
+    if template_name is None:
+        return None
+    try:
+        template = get_template(template_name)
+    except TemplateDoesNotExist:
+        return None
+    origin = getattr(getattr(template, 'template', None), 'origin', None)
+    return getattr(origin, 'name', None)
+
+
+def build_manifest():
+    """
+    Build the manifest from the charts in the registry.
+
+    :return: dict
+    """
+    charts = []
+    for entry in charts_registry.get_entries():
+        chart_class = entry.chart_class
+        charts.append({
+            'key': entry.key,
+            'app': entry.app_name,
+            'name': entry.chart_name,
+            'module': chart_class.__module__,
+            'template_name': chart_class.template_name,
+            'template_path': _template_path(chart_class.template_name)
+        })
+    return {
+        'version': MANIFEST_VERSION,
+        'modules': sorted(set(chart['module'] for chart in charts)),
+        'charts': charts
+    }
+
+
+def write_manifest(path):
+    """
+    Write the manifest to ``path``.
+
+    :param str path: The manifest file path
+    :return: dict
+    """
+    manifest = build_manifest()
+    tmp_path = '%s.tmp' % path
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+    return manifest
+
+
+def read_manifest(path):
+    """
+    Read a manifest file. Returns None when the file doesn't exist or was
+    written by an incompatible version.
+
+    :param str path: The manifest file path
+    :return: dict
+    """
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    if manifest.get('version') != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def load_manifest(manifest, lazy=False):
+    """
+    Import, or queue for lazy import, the modules listed in a manifest.
+
+    :param dict manifest: A manifest from ``read_manifest()``
+    :param bool lazy: Queue the modules in the registry instead of importing
+    """
+    for chart in manifest['charts']:
+        app, module = chart['app'], chart['module']
+        charts_registry.add_lazy(app, module)
+        if app.endswith('.charts'):
+            charts_registry.add_lazy(app[:-len('.charts')], module)
+    if not lazy:
+        charts_registry.load_pending()
@@ -0,0 +1,71 @@
+"""
+Deep merging of Highcharts option trees.
+
+Merges never modify their inputs and only copy the dicts along the paths the
+override changes, every other subtree is shared with the template. Results
+must be treated as read only, use ``chartforge.cache.copy_json()`` first to
+modify one.
+"""
+# Option arrays merged item by item instead of being replaced
+ARRAY_KEYS = frozenset(['series', 'xAxis', 'yAxis', 'zAxis', 'colorAxis'])
+
+
+def merge(base, override, one_to_one=False):
+    """
+    Deep merge ``override`` into ``base``. Dicts are merged recursively, the
+    arrays in ``ARRAY_KEYS`` are merged with ``merge_items()`` and anything
+    else in ``override`` replaces the value in ``base``.
+
+    :param base: The template options
+    :param override: The options to apply
+    :param bool one_to_one: Drop array items in base with no match in override
+    :return: The merged options
+    """
+    if not isinstance(base, dict) or not isinstance(override, dict):
+        return override
+    if not override:
+        return base
+    result = dict(base)
+    for key, value in override.items():
+        if key not in base:
+            result[key] = value
+        elif key in ARRAY_KEYS and isinstance(base[key], list) and isinstance(value, list):
+            result[key] = merge_items(base[key], value, one_to_one)
+        else:
+            result[key] = merge(base[key], value, one_to_one)
+    return result
+
+
+def merge_items(base, override, one_to_one=False):
+    """
+    Merge arrays of option dicts, like series or axes, the way Highcharts'
+    ``update()`` does. Items are matched by ``id`` when they have one,
+    otherwise by position. Unmatched override items are appended, and
+    unmatched base items are kept unless ``one_to_one`` is set.
+
+    :param list base: The template items
+    :param list override: The items to apply
+    :param bool one_to_one: Drop base items with no match in override
+    :rtype: list
+    """
+    by_id = dict(
+        (item['id'], i) for i, item in enumerate(base)
+        if isinstance(item, dict) and 'id' in item)
+    used = set()
+    result = []
+    for i, item in enumerate(override):
+        if isinstance(item, dict) and item.get('id') in by_id:
+            j = by_id[item['id']]
+        elif (i < len(base) and i not in used and
+              not (isinstance(base[i], dict) and 'id' in base[i])):
+            j = i
+        else:
+            j = None
+        if j is None or j in used:
+            result.append(item)
+        else:
+            used.add(j)
+            result.append(merge(base[j], item, one_to_one))
+    if not one_to_one:
+        result.extend(item for j, item in enumerate(base) if j not in used)
+    return result
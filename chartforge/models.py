@@ -1,7 +1,8 @@
 from django.db import models
 from django.conf import settings
 
-from chartforge.fields import ChartClassField
+from chartforge.codec import loads
+from chartforge.fields import ChartClassField, ConfigField
 
 
 class ChartTemplate(models.Model):
@@ -11,11 +12,33 @@ class ChartTemplate(models.Model):
      * an uploaded chart config
      * a static chart file
     """
-    name = models.CharField(max_length=100)
+    name = models.CharField(max_length=100, db_index=True)
     chart_class = ChartClassField()
     thumbnail = models.ImageField(upload_to='chartforge/tpl')
     example_data = models.TextField()
     chart_config = models.TextField()
+    # encoded versions used instead of the text fields when set, see the
+    # config_storage setting and the chartforge_convert_configs command
+    example_data_blob = ConfigField(null=True, editable=False)
+    chart_config_blob = ConfigField(null=True, editable=False)
+
+    def get_chart_config(self):
+        """
+        Get the chart config, from the encoded field when it's set.
+
+        :return: dict
+        """
+        if self.chart_config_blob is not None:
+            return self.chart_config_blob
+        return loads(self.chart_config) if self.chart_config else None
+
+    def get_example_data(self):
+        """
+        Get the example data, from the encoded field when it's set.
+        """
+        if self.example_data_blob is not None:
+            return self.example_data_blob
+        return loads(self.example_data) if self.example_data else None
 
 
 class Chart(models.Model):
@@ -24,7 +47,29 @@ class Chart(models.Model):
     type which is really just a subclass of Chart or ModelChart.
     """
     name = models.CharField(max_length=100)
+    slug = models.SlugField(max_length=100, unique=True)
+    config = models.TextField(default='{}')
+    config_blob = ConfigField(null=True, editable=False)
     thumbnail = models.ImageField(upload_to='chartforge/chart', null=True)
     chart_type = models.ForeignKey(ChartTemplate, null=True)
-    publish = models.BooleanField(default=False)
+    publish = models.BooleanField(default=False, db_index=True)
     author = models.ForeignKey(settings.AUTH_USER_MODEL, null=True)
+    # bumped on every save, so chart data views can make ETags without
+    # loading the config. chartforge ships no migrations, existing tables
+    # need these columns added by hand, see the README
+    version = models.PositiveIntegerField(default=0, editable=False)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        index_together = [('publish', 'slug')]
+
+    def save(self, *args, **kwargs):
+        self.version += 1
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'version', 'updated'}
+        try:
+            super().save(*args, **kwargs)
+        except Exception:
+            # the row wasn't written, so a retry mustn't skip a version
+            self.version -= 1
+            raise
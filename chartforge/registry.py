@@ -1,10 +1,17 @@
+import threading
 from collections import OrderedDict
+from importlib import import_module
 
 
 class ChartRegistry:
     """
     Singleton instance used to keep track of all available chart types and
     templates.
+
+    Entries are indexed by full key, by ``(app_name, chart_name)`` and by app
+    so every lookup is a single dict access. Modules can also be registered
+    lazily with ``add_lazy()``, they're imported the first time one of their
+    charts is looked up.
     """
     class _Entry:
         def __init__(self, app_name, chart_name, chart_class):
@@ -12,8 +19,17 @@ class ChartRegistry:
             self.chart_name = chart_name
             self.chart_class = chart_class
 
+        @property
+        def key(self):
+            return '%s.%s' % (self.app_name, self.chart_name)
+
     def __init__(self):
         self.charts = OrderedDict()
+        self._by_name = {}
+        self._by_short_name = {}
+        self._by_app = OrderedDict()
+        self._pending = OrderedDict()
+        self._lock = threading.RLock()
 
     def register(self, app_name, chart_name, chart_class):
         """
@@ -27,12 +43,104 @@ class ChartRegistry:
         from chartforge.dynamic import DynamicChart
 
         key = '%s.%s' % (app_name, chart_name)
-        if key in self.charts:
-            raise ValueError('Duplicate chart registered: %s' % key)
-
         assert issubclass(chart_class, DynamicChart), 'Must be a subclass of DynamicChart'
 
-        self.charts[key] = self._Entry(app_name, chart_name, chart_class)
+        with self._lock:
+            if key in self.charts:
+                raise ValueError('Duplicate chart registered: %s' % key)
+            entry = self._Entry(app_name, chart_name, chart_class)
+            self.charts[key] = entry
+            self._by_name[(app_name, chart_name)] = entry
+            if app_name.endswith('.charts'):
+                # charts in app.charts can be looked up with just the app name,
+                # a chart registered directly on the app takes precedence
+                self._by_name.setdefault((app_name[:-len('.charts')], chart_name), entry)
+            self._by_short_name.setdefault(chart_name, []).append(entry)
+            self._by_app.setdefault(app_name, OrderedDict())[chart_name] = entry
+
+    def add_lazy(self, app_name, module_path, required=True):
+        """
+        Queue a module to be imported the first time a chart for ``app_name``
+        is looked up, instead of importing it right away.
+
+        :param str app_name: The app name used in lookups
+        :param str module_path: Dot path to the module containing charts
+        :param bool required: When False, an ImportError is ignored
+        """
+        with self._lock:
+            self._pending.setdefault(app_name, []).append((module_path, required))
+
+    def load_pending(self, app_name=None):
+        """
+        Import queued modules for ``app_name``, or all queued modules when
+        ``app_name`` is None.
+
+        :param str app_name: The app to load
+        """
+        with self._lock:
+            if app_name is None:
+                modules = [m for ms in self._pending.values() for m in ms]
+                self._pending.clear()
+            else:
+                modules = self._pending.pop(app_name, [])
+            for module_path, required in modules:
+                try:
+                    import_module(module_path)
+                except ImportError:
+                    if required:
+                        raise
+
+    def lookup(self, app_name, chart_name):
+        """
+        Look up a chart entry. Charts in an app's ``charts`` module can be
+        found with either the app or the module name. Raises KeyError when no
+        match is found.
+
+        :param app_name: The app name
+        :param chart_name: The chart class or function (or name='' kwarg) name
+        :return: The matching entry
+        """
+        entry = self._by_name.get((app_name, chart_name))
+        if entry is None:
+            # another thread may be importing the module right now, its
+            # charts are registered once it releases the lock
+            with self._lock:
+                self.load_pending(app_name)
+                if app_name.endswith('.charts'):
+                    self.load_pending(app_name[:-len('.charts')])
+                entry = self._by_name.get((app_name, chart_name))
+        if entry is None:
+            raise KeyError('No chart named %s.%s' % (app_name, chart_name))
+        return entry
+
+    def find(self, chart_name):
+        """
+        Get all the entries registered with a chart name, in any app.
+
+        :param chart_name: The chart name
+        :return: list
+        """
+        self.load_pending()
+        return list(self._by_short_name.get(chart_name, []))
+
+    def get_app_entries(self, app_name):
+        """
+        Get all the entries registered for an app module.
+
+        :param app_name: The app or module name
+        :return: list
+        """
+        self.load_pending(app_name)
+        return list(self._by_app.get(app_name, {}).values())
+
+    def get_entries(self):
+        """
+        Get every entry, importing all the lazy modules first.
+
+        :return: list
+        """
+        self.load_pending()
+        return list(self.charts.values())
 
 
 charts_registry = ChartRegistry()
@@ -46,12 +154,7 @@ def _get_chart_import(app_name, chart_name):
     :param chart_name: The chart class or function (or name='' kwarg) name
     :return: The matching key
     """
-    key = '%s.%s' % (app_name, chart_name)
-    if key not in charts_registry.charts.keys():
-        key = '%s.charts.%s' % (app_name, chart_name)
-        if key not in charts_registry.charts.keys():
-            raise KeyError('No chart named %s.%s' % (app_name, chart_name))
-    return key
+    return charts_registry.lookup(app_name, chart_name).key
 
 
 def get_chart_classes():
@@ -60,7 +163,7 @@ def get_chart_classes():
 
     :return: list(chartforge.charts.DynamicChart)
     """
-    return [entry.chart_class for entry in charts_registry.charts.values()]
+    return [entry.chart_class for entry in charts_registry.get_entries()]
 
 
 def get_chart_class(app_name, chart_name):
@@ -71,8 +174,7 @@ def get_chart_class(app_name, chart_name):
     :param chart_name: Chart, like 'MyChart'
     :return: chartforge.charts.DynamicChart
     """
-    key = _get_chart_import(app_name, chart_name)
-    return charts_registry.charts[key].chart_class
+    return charts_registry.lookup(app_name, chart_name).chart_class
 
 
 def is_chart_class(app_name, chart_name):
@@ -84,7 +186,7 @@ def is_chart_class(app_name, chart_name):
     :return: bool
     """
     try:
-        _get_chart_import(app_name, chart_name)
+        charts_registry.lookup(app_name, chart_name)
         return True
     except KeyError:
         return False
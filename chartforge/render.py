@@ -0,0 +1,593 @@
+"""
+Local chart renderer and render worker pool.
+
+The renderer understands a subset of the Highcharts options (title, axes,
+categories, legend and line, spline, area, column, bar, scatter and pie
+series) which is enough for report images. Charts are laid out once into
+simple drawing primitives that are then painted as SVG, in pure Python, or
+with Pillow for PNG, JPEG and PDF.
+
+Rendering is CPU bound, so ``RenderPool`` can run it in a pool of long lived
+worker processes with bounded concurrency.
+"""
+import io
+import logging
+import math
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError
+from xml.sax.saxutils import escape, quoteattr
+
+try:
+    from PIL import Image, ImageDraw, ImageFont
+except ImportError:
+    Image = None
+
+from chartforge.arrays import ColumnarSeries, is_array, to_list
+from chartforge.base import RenderType
+from chartforge.settings import ChartForgeSettings
+
+
+PALETTE = [
+    '#7cb5ec', '#434348', '#90ed7d', '#f7a35c', '#8085e9',
+    '#f15c80', '#e4d354', '#2b908f', '#f45b5b', '#91e8e1'
+]
+GRID_COLOR = '#e6e6e6'
+TEXT_COLOR = '#333333'
+LABEL_COLOR = '#666666'
+FONT_SIZE = 11
+TITLE_SIZE = 16
+
+logger = logging.getLogger('chartforge')
+
+
+class RenderQueueFull(Exception):
+    """
+    Raised when the render pool has too many jobs waiting.
+    """
+
+
+# Layout
+
+def _number(value):
+    """
+    Get a value as a float, or None for anything that can't be drawn:
+    non-numbers and, like the codecs write them, NaN and infinities.
+    """
+    if isinstance(value, bool) or value is None:
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
+
+
+def _series_points(series):
+    """
+    Get a list of ``(x, y)`` tuples for a series, None marks a gap.
+    """
+    data = series.get('data') or []
+    if isinstance(data, ColumnarSeries):
+        data = data.tolist()
+    elif is_array(data):
+        data = to_list(data)
+
+    points = []
+    for i, point in enumerate(data):
+        if isinstance(point, dict):
+            x, y = point.get('x', i), point.get('y')
+        elif isinstance(point, (list, tuple)):
+            if len(point) == 1:
+                x, y = i, point[0]
+            else:
+                # [x, y] or [x, open, high, low, close], use the close
+                x, y = point[0], point[-1]
+        else:
+            x, y = i, point
+        x = _number(x)
+        y = _number(y)
+        points.append(None if y is None else (i if x is None else x, y))
+    return points
+
+
+def _nice_ticks(lo, hi, count=5):
+    span = hi - lo
+    raw = span / count
+    magnitude = 10 ** math.floor(math.log10(raw))
+    for m in (1, 2, 2.5, 5, 10):
+        step = m * magnitude
+        if step >= raw:
+            break
+    tick = math.floor(lo / step) * step
+    ticks = []
+    while tick <= hi + step * 1e-9:
+        ticks.append(tick)
+        tick += step
+    return ticks
+
+
+def _format_tick(value):
+    return '%g' % round(value, 10)
+
+
+def _text(options, key):
+    value = options.get(key)
+    return value.get('text') if isinstance(value, dict) else None
+
+
+def _first(value):
+    # axes can be a dict or a list of dicts
+    if isinstance(value, list):
+        return value[0] if value else {}
+    return value or {}
+
+
+def layout(config, width, height):
+    """
+    Lay out a chart config into drawing primitives:
+
+        ('rect', x, y, w, h, color, opacity)
+        ('line', [(x, y), ...], color, width)
+        ('polygon', [(x, y), ...], color, opacity)
+        ('circle', x, y, r, color)
+        ('wedge', cx, cy, r, start, end, color)
+        ('text', x, y, text, size, anchor, color)
+
+    Angles are in degrees, clockwise from 3 o'clock.
+
+    :param dict config: The Highcharts config
+    :param int width: Image width
+    :param int height: Image height
+    :return: list of primitives
+    """
+    prims = [('rect', 0, 0, width, height, '#ffffff', 1)]
+    chart_options = config.get('chart') or {}
+    default_type = chart_options.get('type', 'line')
+    series_list = [s for s in config.get('series') or [] if isinstance(s, dict)]
+    x_axis, y_axis = _first(config.get('xAxis')), _first(config.get('yAxis'))
+    categories = x_axis.get('categories')
+
+    top = 15
+    title = _text(config, 'title')
+    if title:
+        prims.append(('text', width / 2, 28, title, TITLE_SIZE, 'middle', TEXT_COLOR))
+        top = 45
+    legend = config.get('legend') or {}
+    show_legend = legend.get('enabled', True) and len(series_list) > 0
+    bottom = 35 + (25 if show_legend else 0)
+    left, right = 60, 20
+    plot_w = max(width - left - right, 1)
+    plot_h = max(height - top - bottom, 1)
+
+    colors = config.get('colors') or PALETTE
+    series_points = []
+    for i, series in enumerate(series_list):
+        color = series.get('color') or colors[i % len(colors)]
+        kind = series.get('type', default_type)
+        series_points.append((series, kind, color, _series_points(series)))
+
+    if any(kind == 'pie' for _, kind, _, _ in series_points):
+        _layout_pie(prims, series_points, colors, left, top, plot_w, plot_h)
+    else:
+        _layout_cartesian(prims, series_points, categories, x_axis, y_axis,
+                          left, top, plot_w, plot_h)
+
+    if show_legend:
+        _layout_legend(prims, series_points, width, height - 20)
+    return prims
+
+
+def _layout_cartesian(prims, series_points, categories, x_axis, y_axis,
+                      left, top, plot_w, plot_h):
+    xs = [p[0] for _, _, _, points in series_points for p in points if p]
+    ys = [p[1] for _, _, _, points in series_points for p in points if p]
+    has_columns = any(k in ('column', 'bar') for _, k, _, _ in series_points)
+    if categories:
+        xs += [0, len(categories) - 1]
+    if not xs:
+        xs, ys = [0, 1], [0, 1]
+    if has_columns or any(k.startswith('area') for _, k, _, _ in series_points):
+        ys.append(0)
+
+    y_lo, y_hi = _number(y_axis.get('min')), _number(y_axis.get('max'))
+    y_lo = min(ys) if y_lo is None else y_lo
+    y_hi = max(ys) if y_hi is None else y_hi
+    if y_lo == y_hi:
+        y_lo, y_hi = y_lo - 1, y_hi + 1
+    y_ticks = _nice_ticks(y_lo, y_hi)
+    y_lo, y_hi = y_ticks[0], y_ticks[-1]
+
+    x_lo, x_hi = min(xs), max(xs)
+    # columns and categories sit in the middle of their slot
+    pad = 0.5 if (has_columns or categories) else 0
+    x_lo, x_hi = x_lo - pad, x_hi + pad
+    if x_lo == x_hi:
+        x_lo, x_hi = x_lo - 1, x_hi + 1
+
+    def px(x):
+        return left + (x - x_lo) / (x_hi - x_lo) * plot_w
+
+    def py(y):
+        return top + plot_h - (y - y_lo) / (y_hi - y_lo) * plot_h
+
+    for tick in y_ticks:
+        y = py(tick)
+        prims.append(('line', [(left, y), (left + plot_w, y)], GRID_COLOR, 1))
+        prims.append(('text', left - 8, y + 4, _format_tick(tick), FONT_SIZE, 'end', LABEL_COLOR))
+    y_title = _text(y_axis, 'title')
+    if y_title:
+        prims.append(('text', 12, top - 6, y_title, FONT_SIZE, 'start', LABEL_COLOR))
+
+    base_y = top + plot_h
+    prims.append(('line', [(left, base_y), (left + plot_w, base_y)], '#ccd6eb', 1))
+    if categories:
+        step = max(1, int(math.ceil(len(categories) * 40.0 / plot_w)))
+        for i in range(0, len(categories), step):
+            prims.append(('text', px(i), base_y + 16, str(categories[i]), FONT_SIZE, 'middle', LABEL_COLOR))
+    else:
+        for tick in _nice_ticks(x_lo, x_hi, max(2, int(plot_w / 100))):
+            if x_lo <= tick <= x_hi:
+                prims.append(('text', px(tick), base_y + 16, _format_tick(tick), FONT_SIZE, 'middle', LABEL_COLOR))
+
+    column_series = [s for s in series_points if s[1] in ('column', 'bar')]
+    offsets = dict((id(s[0]), i) for i, s in enumerate(column_series))
+    slot = plot_w / max(x_hi - x_lo, 1)
+    group_w = slot * 0.8
+    bar_w = group_w / max(len(column_series), 1)
+    zero = py(max(min(0, y_hi), y_lo))
+
+    for series, kind, color, points in series_points:
+        if kind in ('column', 'bar'):
+            offset = offsets[id(series)]
+            for point in points:
+                if point is None:
+                    continue
+                x = px(point[0]) - group_w / 2 + offset * bar_w
+                y = py(point[1])
+                prims.append(('rect', x + 1, min(y, zero), max(bar_w - 2, 1), abs(zero - y), color, 1))
+        elif kind == 'scatter':
+            for point in points:
+                if point is not None:
+                    prims.append(('circle', px(point[0]), py(point[1]), 3, color))
+        else:
+            segments = [[]]
+            for point in points:
+                if point is None:
+                    segments.append([])
+                else:
+                    segments[-1].append((px(point[0]), py(point[1])))
+            for segment in segments:
+                if not segment:
+                    continue
+                if kind.startswith('area') and len(segment) > 1:
+                    polygon = [(segment[0][0], zero)] + segment + [(segment[-1][0], zero)]
+                    prims.append(('polygon', polygon, color, 0.75))
+                if len(segment) > 1:
+                    prims.append(('line', segment, color, 2))
+                else:
+                    prims.append(('circle', segment[0][0], segment[0][1], 2, color))
+
+
+def _layout_pie(prims, series_points, colors, left, top, plot_w, plot_h):
+    series, kind, color, points = next(s for s in series_points if s[1] == 'pie')
+    data = series.get('data') or []
+    values = [p[1] if p else 0 for p in points]
+    total = sum(v for v in values if v > 0) or 1
+    cx, cy = left + plot_w / 2, top + plot_h / 2
+    r = min(plot_w, plot_h) / 2 * 0.8
+    angle = -90.0
+    for i, value in enumerate(values):
+        if value <= 0:
+            continue
+        sweep = value / total * 360
+        point = data[i] if i < len(data) and isinstance(data[i], dict) else {}
+        slice_color = point.get('color') or colors[i % len(colors)]
+        prims.append(('wedge', cx, cy, r, angle, angle + sweep, slice_color))
+        name = point.get('name')
+        if name is None and i < len(data) and isinstance(data[i], (list, tuple)):
+            name = data[i][0]
+        if name is not None:
+            mid = math.radians(angle + sweep / 2)
+            prims.append(('text', cx + math.cos(mid) * (r + 14), cy + math.sin(mid) * (r + 14),
+                          str(name), FONT_SIZE, 'middle', LABEL_COLOR))
+        angle += sweep
+
+
+def _layout_legend(prims, series_points, width, y):
+    items = [(str(s.get('name', 'Series %d' % (i + 1))), color)
+             for i, (s, _, color, _) in enumerate(series_points)]
+    item_widths = [len(name) * FONT_SIZE * 0.6 + 26 for name, _ in items]
+    x = max((width - sum(item_widths)) / 2, 5)
+    for (name, color), item_w in zip(items, item_widths):
+        prims.append(('rect', x, y - 9, 12, 12, color, 1))
+        prims.append(('text', x + 16, y + 1, name, FONT_SIZE, 'start', TEXT_COLOR))
+        x += item_w
+
+
+# Painters
+
+def paint_svg(prims, width, height):
+    """
+    Paint primitives as an SVG document.
+
+    :rtype: bytes
+    """
+    out = ['<svg xmlns="http://www.w3.org/2000/svg" width="%d" height="%d" '
+           'viewBox="0 0 %d %d" font-family="Helvetica, Arial, sans-serif">' % (
+               width, height, width, height)]
+    anchors = {'start': 'start', 'middle': 'middle', 'end': 'end'}
+    for prim in prims:
+        kind = prim[0]
+        if kind == 'rect':
+            _, x, y, w, h, color, opacity = prim
+            out.append('<rect x="%.1f" y="%.1f" width="%.1f" height="%.1f" fill=%s%s/>' % (
+                x, y, w, h, quoteattr(color),
+                '' if opacity == 1 else ' fill-opacity="%.2f"' % opacity))
+        elif kind == 'line':
+            _, points, color, w = prim
+            out.append('<polyline points="%s" fill="none" stroke=%s stroke-width="%s" '
+                       'stroke-linejoin="round"/>' % (
+                           ' '.join('%.1f,%.1f' % p for p in points), quoteattr(color), w))
+        elif kind == 'polygon':
+            _, points, color, opacity = prim
+            out.append('<polygon points="%s" fill=%s fill-opacity="%.2f"/>' % (
+                ' '.join('%.1f,%.1f' % p for p in points), quoteattr(color), opacity))
+        elif kind == 'circle':
+            _, x, y, r, color = prim
+            out.append('<circle cx="%.1f" cy="%.1f" r="%s" fill=%s/>' % (x, y, r, quoteattr(color)))
+        elif kind == 'wedge':
+            _, cx, cy, r, start, end, color = prim
+            if end - start >= 360:
+                out.append('<circle cx="%.1f" cy="%.1f" r="%.1f" fill=%s/>' % (cx, cy, r, quoteattr(color)))
+                continue
+            a0, a1 = math.radians(start), math.radians(end)
+            out.append('<path d="M%.1f,%.1f L%.1f,%.1f A%.1f,%.1f 0 %d 1 %.1f,%.1f Z" fill=%s '
+                       'stroke="#ffffff"/>' % (
+                           cx, cy, cx + r * math.cos(a0), cy + r * math.sin(a0), r, r,
+                           1 if end - start > 180 else 0,
+                           cx + r * math.cos(a1), cy + r * math.sin(a1), quoteattr(color)))
+        elif kind == 'text':
+            _, x, y, text, size, anchor, color = prim
+            out.append('<text x="%.1f" y="%.1f" font-size="%d" text-anchor="%s" fill=%s>%s</text>' % (
+                x, y, size, anchors[anchor], quoteattr(color), escape(text)))
+    out.append('</svg>')
+    return ''.join(out).encode('utf-8')
+
+
+def _rgb(color, opacity=1):
+    color = color.lstrip('#')
+    if len(color) == 3:
+        color = ''.join(c * 2 for c in color)
+    try:
+        r, g, b = int(color[0:2], 16), int(color[2:4], 16), int(color[4:6], 16)
+    except ValueError:
+        r, g, b = 0, 0, 0
+    return r, g, b, int(255 * opacity)
+
+
+def _font(size):
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        return ImageFont.load_default()
+
+
+def _text_size(draw, text, font):
+    if hasattr(draw, 'textbbox'):
+        left, top, right, bottom = draw.textbbox((0, 0), text, font=font)
+        return right - left, bottom - top
+    return draw.textsize(text, font=font)
+
+
+def paint_image(prims, width, height, render_type):
+    """
+    Paint primitives with Pillow as PNG, JPEG or PDF.
+
+    :rtype: bytes
+    """
+    assert Image is not None, 'Pillow is required to render %s' % render_type
+    image = Image.new('RGBA', (width, height), (255, 255, 255, 255))
+    draw = ImageDraw.Draw(image, 'RGBA')
+    fonts = {}
+    for prim in prims:
+        kind = prim[0]
+        if kind == 'rect':
+            _, x, y, w, h, color, opacity = prim
+            draw.rectangle([x, y, x + w, y + h], fill=_rgb(color, opacity))
+        elif kind == 'line':
+            _, points, color, w = prim
+            draw.line(points, fill=_rgb(color), width=w)
+        elif kind == 'polygon':
+            _, points, color, opacity = prim
+            draw.polygon(points, fill=_rgb(color, opacity))
+        elif kind == 'circle':
+            _, x, y, r, color = prim
+            draw.ellipse([x - r, y - r, x + r, y + r], fill=_rgb(color))
+        elif kind == 'wedge':
+            _, cx, cy, r, start, end, color = prim
+            draw.pieslice([cx - r, cy - r, cx + r, cy + r], start, end,
+                          fill=_rgb(color), outline=(255, 255, 255, 255))
+        elif kind == 'text':
+            _, x, y, text, size, anchor, color = prim
+            font = fonts.get(size) or fonts.setdefault(size, _font(size))
+            w, h = _text_size(draw, text, font)
+            if anchor == 'middle':
+                x -= w / 2
+            elif anchor == 'end':
+                x -= w
+            draw.text((x, y - h), text, fill=_rgb(color), font=font)
+
+    image = image.convert('RGB')
+    fmt = {RenderType.PNG: 'PNG', RenderType.JPEG: 'JPEG', RenderType.PDF: 'PDF'}[render_type]
+    buf = io.BytesIO()
+    image.save(buf, fmt)
+    return buf.getvalue()
+
+
+def render_config(config, render_type=None, width=None, height=None):
+    """
+    Render a chart config in this process.
+
+    :param dict config: The Highcharts config
+    :param RenderType render_type: The render type, defaults to PNG
+    :param int width: Image width, defaults to the chart's width or 800
+    :param int height: Image height, defaults to the chart's height or 400
+    :rtype: bytes
+    """
+    render_type = render_type or RenderType.PNG
+    chart_options = config.get('chart') or {}
+    width = int(width or chart_options.get('width') or 800)
+    height = int(height or chart_options.get('height') or 400)
+    prims = layout(config, width, height)
+    if render_type == RenderType.SVG:
+        return paint_svg(prims, width, height)
+    return paint_image(prims, width, height, render_type)
+
+
+def _render_batch(jobs):
+    """
+    Render several jobs in one worker call. Errors are returned instead of
+    raised so one bad chart doesn't fail the whole batch.
+    """
+    results = []
+    for job in jobs:
+        try:
+            results.append(render_config(*job))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+def _completed(func, *args):
+    future = Future()
+    try:
+        future.set_result(func(*args))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+class RenderPool:
+    """
+    Runs render jobs in a pool of long lived worker processes, one per cpu
+    by default.
+
+    At most ``queue_size`` jobs (or batches) can be queued or running at
+    once. ``submit()`` waits up to ``timeout`` seconds for a free slot, then
+    raises ``RenderQueueFull`` so callers get backpressure instead of an
+    unbounded queue. With zero workers jobs are rendered in the calling
+    process, still bounded by the queue size, but they can't be timed out
+    and they hold the calling thread while they run.
+    """
+    def __init__(self, workers=None, queue_size=64, timeout=30, batch_size=16):
+        if workers is None:
+            workers = os.cpu_count() or 1
+        self.workers = workers
+        self.timeout = timeout
+        self.batch_size = batch_size
+        self.executor = ProcessPoolExecutor(workers) if workers else None
+        self._slots = threading.BoundedSemaphore(queue_size)
+        if self.executor is None:
+            logger.warning('Render pool has no workers, charts are rendered in process')
+
+    def _submit(self, func, *args):
+        if not self._slots.acquire(True, self.timeout):
+            raise RenderQueueFull('Render queue is full')
+        if self.executor is None:
+            try:
+                return _completed(func, *args)
+            finally:
+                self._slots.release()
+        try:
+            future = self.executor.submit(func, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._slots.release())
+        return future
+
+    def submit(self, config, render_type=None, width=None, height=None):
+        """
+        Queue a render job.
+
+        :return: Future with the rendered bytes
+        """
+        return self._submit(render_config, config, render_type, width, height)
+
+    def render(self, config, render_type=None, width=None, height=None):
+        """
+        Render a config and wait up to ``timeout`` seconds for the result.
+        Raises ``concurrent.futures.TimeoutError`` when the job takes too
+        long.
+
+        :rtype: bytes
+        """
+        return self.submit(config, render_type, width, height).result(self.timeout)
+
+    def render_many(self, jobs):
+        """
+        Render many jobs, sent to the workers in batches of ``batch_size`` to
+        cut down on inter-process overhead. Each job is a tuple of
+        ``(config, render_type, width, height)``. Failed jobs are returned as
+        exceptions in place of their bytes.
+
+        Each batch has ``timeout`` seconds per job in it, counted from when it
+        was queued. Jobs in a batch that runs past that are returned as
+        ``concurrent.futures.TimeoutError``.
+
+        :param jobs: iterable of job tuples
+        :rtype: list
+        """
+        jobs = [tuple(job) + (None,) * (4 - len(job)) for job in jobs]
+        batches = []
+        for i in range(0, len(jobs), self.batch_size):
+            batch = jobs[i:i + self.batch_size]
+            deadline = time.time() + self.timeout * len(batch)
+            batches.append((len(batch), deadline, self._submit(_render_batch, batch)))
+
+        results = []
+        for size, deadline, future in batches:
+            try:
+                results.extend(future.result(max(deadline - time.time(), 0)))
+            except TimeoutError:
+                future.cancel()
+                results.extend(TimeoutError('Render timed out') for _ in range(size))
+        return results
+
+    def shutdown(self, wait=True):
+        if self.executor is not None:
+            self.executor.shutdown(wait)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_render_pool():
+    """
+    Get the render pool configured by the render settings.
+
+    :rtype: RenderPool
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            settings = ChartForgeSettings()
+            _pool = RenderPool(
+                settings.render_workers,
+                settings.render_queue_size,
+                settings.render_timeout)
+        return _pool
+
+
+def render_chart(chart, render_type=None, width=None, height=None):
+    """
+    Render a ``Chart`` with the shared render pool.
+
+    :param Chart chart: The chart to render
+    :param RenderType render_type: The render type, defaults to PNG
+    :rtype: bytes
+    """
+    return get_render_pool().render(chart.config, render_type, width, height)
@@ -0,0 +1,260 @@
+"""
+Precomputes chart data on a schedule.
+
+Charts registered with ``dynamic_chart(refresh=...)`` have their data
+computed every ``refresh`` seconds, once for each of their
+``refresh_kwargs``, by the ``chartforge_scheduler`` command. The data is
+stored as a snapshot in the django cache set by the ``cache_alias`` setting.
+``get_data()`` returns a snapshot while it's at most ``max_staleness``
+seconds old. It only computes the data itself when there's no snapshot for
+the kwargs or the snapshot is too old.
+
+Jobs run in a process pool, so heavy queries run side by side without
+blocking the scheduler. A lock key in the cache makes sure only one scheduler
+runs a job at a time, so the command can run on several hosts, or from cron
+with ``--once``. Nothing but the database and the django cache is needed. The
+cache must be shared with the web processes, for example the database or
+file based cache backends.
+"""
+import hashlib
+import logging
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.core.cache import caches
+
+from chartforge.registry import charts_registry
+from chartforge.settings import ChartForgeSettings
+
+
+logger = logging.getLogger('chartforge')
+
+_local = threading.local()
+
+
+def get_cache():
+    return caches[ChartForgeSettings().cache_alias]
+
+
+def snapshot_key(chart_class, kwargs):
+    """
+    Get the cache key of a chart's snapshot for ``kwargs``.
+
+    :param chart_class: A DynamicChart subclass
+    :param dict kwargs: The chart kwargs
+    :rtype: str
+    """
+    digest = hashlib.md5(repr(sorted(kwargs.items())).encode('utf-8')).hexdigest()
+    return 'chartforge:snapshot:%s.%s:%s' % (chart_class.__module__, chart_class.name, digest)
+
+
+def get_snapshot(chart_class, kwargs, default=None):
+    """
+    Get the snapshot of a chart's data for ``kwargs``, when it's no older
+    than the chart's ``max_staleness``.
+
+    :param chart_class: A DynamicChart subclass
+    :param dict kwargs: The chart kwargs
+    :param default: Returned when there's no fresh enough snapshot
+    """
+    snapshot = get_cache().get(snapshot_key(chart_class, kwargs))
+    if snapshot is None or time.time() - snapshot['created'] > chart_class.max_staleness:
+        return default
+    return snapshot['data']
+
+
+def get_snapshot_time(chart_class, kwargs):
+    """
+    Get when a chart's snapshot for ``kwargs`` was made, without loading the
+    data.
+
+    :return: Timestamp, or None when there's no snapshot
+    """
+    return get_cache().get('%s:created' % snapshot_key(chart_class, kwargs))
+
+
+def store_snapshot(chart_class, kwargs, data):
+    """
+    Store a snapshot of a chart's data. It's kept for ``max_staleness``
+    seconds.
+    """
+    key = snapshot_key(chart_class, kwargs)
+    created = time.time()
+    get_cache().set_many({
+        key: {'created': created, 'data': data},
+        '%s:created' % key: created
+    }, chart_class.max_staleness)
+
+
+def is_computing(chart_class):
+    """
+    Check if ``compute_snapshot()`` is computing a chart's data in this
+    thread, the chart's own snapshot is skipped while it is.
+
+    :param chart_class: A DynamicChart subclass
+    :rtype: bool
+    """
+    return getattr(_local, 'computing', None) is chart_class
+
+
+def compute_snapshot(chart_class, kwargs):
+    """
+    Compute a chart's data and store it as a snapshot. Only the chart's
+    snapshot is skipped, the data goes through its ``cache_timeout`` cache
+    and instrumentation like any other ``get_data()`` call.
+
+    :param chart_class: A DynamicChart subclass
+    :param dict kwargs: The chart kwargs
+    :return: The data
+    """
+    previous = getattr(_local, 'computing', None)
+    _local.computing = chart_class
+    try:
+        data = chart_class().get_data(**kwargs)
+    finally:
+        _local.computing = previous
+    store_snapshot(chart_class, kwargs, data)
+    return data
+
+
+def _init_worker():
+    import django
+    from django.apps import apps
+    from django.db import connections
+    if not apps.ready:
+        django.setup()
+    # forked workers inherit the scheduler's connections, sharing a socket
+    # between processes corrupts it
+    connections.close_all()
+
+
+def _run_job(chart_key, kwargs):
+    app_name, _, chart_name = chart_key.rpartition('.')
+    chart_class = charts_registry.lookup(app_name, chart_name).chart_class
+    start = time.time()
+    compute_snapshot(chart_class, kwargs)
+    return time.time() - start
+
+
+class Job:
+    """
+    Refreshes the snapshot of one chart and kwargs combination.
+    """
+    def __init__(self, chart_key, chart_class, kwargs):
+        self.chart_key = chart_key
+        self.chart_class = chart_class
+        self.kwargs = kwargs
+        self.retry_at = 0
+
+    @property
+    def refresh(self):
+        return self.chart_class.refresh
+
+    def _lock_key(self):
+        return '%s:lock' % snapshot_key(self.chart_class, self.kwargs)
+
+    def due_in(self, now):
+        """
+        Get the seconds until the job is due, 0 or less when it's due now.
+        """
+        created = get_snapshot_time(self.chart_class, self.kwargs)
+        due = 0 if created is None else created + self.refresh
+        return max(due, self.retry_at) - now
+
+    def acquire(self):
+        """
+        Take the job's lock, so other schedulers skip it.
+
+        :return: False when another scheduler is running it
+        """
+        return get_cache().add(self._lock_key(), 1, self.refresh)
+
+    def release(self):
+        get_cache().delete(self._lock_key())
+
+    def __str__(self):
+        return '%s(%s)' % (self.chart_key, ', '.join(
+            '%s=%r' % item for item in sorted(self.kwargs.items())))
+
+
+class Scheduler:
+    """
+    Runs the refresh jobs of every registered chart with a ``refresh``
+    interval.
+
+    :param int workers: Worker processes, defaults to the
+        ``scheduler_workers`` setting
+    :param list charts: Only refresh these chart keys, like 'app.MyChart'.
+        Raises KeyError for unknown charts.
+    """
+    def __init__(self, workers=None, charts=None):
+        self.settings = ChartForgeSettings()
+        self.workers = self.settings.scheduler_workers if workers is None else workers
+        self.charts = None
+        if charts:
+            self.charts = set(
+                charts_registry.lookup(*key.rpartition('.')[::2]).key for key in charts)
+
+    def get_jobs(self):
+        """
+        :rtype: list[Job]
+        """
+        jobs = []
+        for entry in charts_registry.get_entries():
+            chart_class = entry.chart_class
+            if chart_class.refresh is None or (self.charts and entry.key not in self.charts):
+                continue
+            for kwargs in chart_class.refresh_kwargs or [{}]:
+                jobs.append(Job(entry.key, chart_class, kwargs))
+        return jobs
+
+    def _finish(self, job, future):
+        try:
+            duration = future.result()
+        except Exception:
+            logger.exception('Refreshing %s failed', job)
+            job.retry_at = time.time() + job.refresh
+        else:
+            logger.info('Refreshed %s in %.2fs', job, duration)
+        finally:
+            job.release()
+
+    def run(self, once=False):
+        """
+        Run due jobs until interrupted.
+
+        :param bool once: Run the due jobs, wait for them and return
+        """
+        jobs = self.get_jobs()
+        if not jobs:
+            logger.warning('No charts with a refresh interval')
+            return
+
+        with ProcessPoolExecutor(self.workers, initializer=_init_worker) as executor:
+            running = {}
+            while True:
+                now = time.time()
+                timeout = self.settings.scheduler_poll_interval
+                for job in jobs:
+                    if job in running:
+                        continue
+                    due_in = job.due_in(now)
+                    if due_in > 0:
+                        timeout = min(timeout, due_in)
+                    elif job.acquire():
+                        running[job] = executor.submit(_run_job, job.chart_key, job.kwargs)
+
+                if once:
+                    for job, future in running.items():
+                        self._finish(job, future)
+                    return
+
+                if running:
+                    wait(list(running.values()), timeout, return_when=FIRST_COMPLETED)
+                else:
+                    time.sleep(timeout)
+                for job, future in list(running.items()):
+                    if future.done():
+                        self._finish(job, future)
+                        del running[job]
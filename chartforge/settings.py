@@ -7,7 +7,79 @@ DEFAULTS = {
         'chartforge.backends.DynamicChartBackend',
         'chartforge.backends.ChartModelBackend',
         'chartforge.backends.StaticChartBackend'
-    ]
+    ],
+    # django cache alias used for chart data caching
+    'cache_alias': 'default',
+    # max entries and timeout (in seconds) for the in-process cache tier
+    'local_cache_size': 256,
+    'local_cache_timeout': 5,
+    # default decimation method and max points per series, None disables it
+    'decimation': 'lttb',
+    'max_points': None,
+    # import chart modules on first lookup instead of in ready()
+    'lazy_load': False,
+    # path to a manifest written by the chartforge_manifest command
+    'manifest': None,
+    # seconds to wait for each backend, and threads used to call them
+    'backend_timeout': 10,
+    'backend_workers': 4,
+    # render worker processes (None for one per cpu, 0 renders in the
+    # calling process), max queued jobs and seconds to wait for a job
+    'render_workers': None,
+    'render_queue_size': 64,
+    'render_timeout': 30,
+    # rendered images are stored in this directory when set, otherwise in
+    # the django cache for render_cache_timeout seconds
+    'render_cache_dir': None,
+    'render_cache_max_size': 512 * 1024 * 1024,
+    'render_cache_timeout': 24 * 60 * 60,
+    # how configs are stored: 'json' text, or 'zlib', 'zstd' or 'msgpack'
+    # encoded binary
+    'config_storage': 'json',
+    # seconds between server sent event updates, and before the stream is
+    # closed so clients reconnect. Each stream holds a worker thread that long
+    'sse_interval': 1,
+    'sse_max_duration': 30,
+    # directories of static chart template files, a file to keep their
+    # index in, seconds between checks for added or removed files, and
+    # seconds between checks for files edited in place (None to never check)
+    'chart_templates': [],
+    'static_index': None,
+    'static_poll_interval': 2,
+    'static_file_poll_interval': 60,
+    # script loaded by iframe exports
+    'highcharts_url': 'https://code.highcharts.com/highcharts.js',
+    # time chart stages and backend calls, see chartforge.instrumentation,
+    # and send them to statsd when set to {'host': ..., 'port': ..., 'prefix': ...}
+    'instrumentation': False,
+    'statsd': None,
+    # serve the chartforge_metrics view to anyone, not just staff users, e.g.
+    # for a Prometheus scraper on a private network
+    'metrics_public': False,
+    # chart names (or '*') to profile with cProfile, and the fraction of
+    # their calls that are profiled
+    'profile_charts': [],
+    'profile_rate': 0.01,
+    # threads used to fetch dashboard chart data, seconds to wait for it, and
+    # the most charts one dashboard request can ask for
+    'dashboard_workers': 8,
+    'dashboard_timeout': 30,
+    'dashboard_max_charts': 100,
+    # threads aget_data() runs sync get_data() calls in
+    'data_workers': 8,
+    # worker processes for the chartforge_scheduler command, and the most
+    # seconds it sleeps between checking for due jobs
+    'scheduler_workers': 2,
+    'scheduler_poll_interval': 30,
+    # json library used for chart configs: 'orjson', 'ujson', 'json' or
+    # 'auto' for the fastest one installed
+    'json_codec': 'auto',
+    # Cache-Control of the chart data views, responses smaller than this
+    # many bytes aren't compressed, and seconds compressed responses are
+    # kept in the cache
+    'data_cache_control': 'public, max-age=0, s-maxage=10, stale-while-revalidate=60',
+    'data_compress_min_size': 1024,
+    'data_response_timeout': 300
 }
 
 
@@ -26,3 +98,41 @@ class ChartForgeSettings:
 
         self.chart_apps = _load('chart_apps')
         self.backends = _load('backends')
+        self.cache_alias = _load('cache_alias')
+        self.local_cache_size = _load('local_cache_size')
+        self.local_cache_timeout = _load('local_cache_timeout')
+        self.decimation = _load('decimation')
+        self.max_points = _load('max_points')
+        self.lazy_load = _load('lazy_load')
+        self.manifest = _load('manifest')
+        self.backend_timeout = _load('backend_timeout')
+        self.backend_workers = _load('backend_workers')
+        self.render_workers = _load('render_workers')
+        self.render_queue_size = _load('render_queue_size')
+        self.render_timeout = _load('render_timeout')
+        self.render_cache_dir = _load('render_cache_dir')
+        self.render_cache_max_size = _load('render_cache_max_size')
+        self.render_cache_timeout = _load('render_cache_timeout')
+        self.config_storage = _load('config_storage')
+        self.sse_interval = _load('sse_interval')
+        self.sse_max_duration = _load('sse_max_duration')
+        self.chart_templates = _load('chart_templates')
+        self.static_index = _load('static_index')
+        self.static_poll_interval = _load('static_poll_interval')
+        self.static_file_poll_interval = _load('static_file_poll_interval')
+        self.highcharts_url = _load('highcharts_url')
+        self.instrumentation = _load('instrumentation')
+        self.statsd = _load('statsd')
+        self.metrics_public = _load('metrics_public')
+        self.profile_charts = _load('profile_charts')
+        self.profile_rate = _load('profile_rate')
+        self.dashboard_workers = _load('dashboard_workers')
+        self.dashboard_timeout = _load('dashboard_timeout')
+        self.dashboard_max_charts = _load('dashboard_max_charts')
+        self.data_workers = _load('data_workers')
+        self.scheduler_workers = _load('scheduler_workers')
+        self.scheduler_poll_interval = _load('scheduler_poll_interval')
+        self.json_codec = _load('json_codec')
+        self.data_cache_control = _load('data_cache_control')
+        self.data_compress_min_size = _load('data_compress_min_size')
+        self.data_response_timeout = _load('data_response_timeout')
@@ -0,0 +1,23 @@
+"""
+Signals sent by ``chartforge.instrumentation`` when the ``instrumentation``
+setting is on. Receivers are called in the thread doing the work, so keep
+them fast. Every signal is sent with ``sender=None``.
+"""
+from django.dispatch import Signal
+
+
+# A chart stage or backend call finished.
+# Sent with stage, name and duration (seconds).
+stage_finished = Signal()
+
+# A ResultCache lookup was made.
+# Sent with cache (the cache prefix) and hit (bool).
+cache_accessed = Signal()
+
+# A chart was serialized.
+# Sent with stage, name and size (bytes).
+payload_serialized = Signal()
+
+# A sampled chart call was profiled.
+# Sent with name and stats (a pstats.Stats for just that call).
+chart_profiled = Signal()
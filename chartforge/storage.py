@@ -0,0 +1,110 @@
+"""
+Compact binary storage for chart configs.
+
+Encoded configs start with a four byte header: the ``CF`` magic, a format
+version and the codec id. zlib compressed JSON is always available, zstd and
+MessagePack are used when ``zstandard`` and ``msgpack`` are installed.
+"""
+import threading
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from chartforge.codec import dumpb, json_default, loads
+from chartforge.settings import ChartForgeSettings
+
+
+MAGIC = b'CF'
+FORMAT_VERSION = 1
+
+ZLIB = 'zlib'
+ZSTD = 'zstd'
+MSGPACK = 'msgpack'
+
+CODEC_IDS = {ZLIB: 1, ZSTD: 2, MSGPACK: 3}
+CODEC_NAMES = dict((v, k) for k, v in CODEC_IDS.items())
+
+_UNSET = object()
+_default_codec = _UNSET
+_default_codec_lock = threading.Lock()
+
+
+def _encode(codec, obj):
+    if codec == ZLIB:
+        return zlib.compress(dumpb(obj), 6)
+    if codec == ZSTD:
+        assert zstandard is not None, 'zstandard is required for the zstd codec'
+        return zstandard.ZstdCompressor(level=3).compress(dumpb(obj))
+    if codec == MSGPACK:
+        assert msgpack is not None, 'msgpack is required for the msgpack codec'
+        return zlib.compress(msgpack.packb(obj, use_bin_type=True, default=json_default), 6)
+    raise ValueError('Unknown config codec: %s' % codec)
+
+
+def _decode(codec, payload):
+    if codec == ZLIB:
+        return loads(zlib.decompress(payload))
+    if codec == ZSTD:
+        assert zstandard is not None, 'zstandard is required to read zstd configs'
+        return loads(zstandard.ZstdDecompressor().decompress(payload))
+    if codec == MSGPACK:
+        assert msgpack is not None, 'msgpack is required to read msgpack configs'
+        return msgpack.unpackb(zlib.decompress(payload), raw=False)
+    raise ValueError('Unknown config codec: %s' % codec)
+
+
+def default_codec():
+    """
+    Get the codec from the ``config_storage`` setting, or None when configs
+    are stored as JSON text. The setting is read once per process.
+
+    :rtype: str
+    """
+    global _default_codec
+    if _default_codec is _UNSET:
+        with _default_codec_lock:
+            if _default_codec is _UNSET:
+                codec = ChartForgeSettings().config_storage
+                _default_codec = None if codec == 'json' else codec
+    return _default_codec
+
+
+def encode_config(obj, codec=None):
+    """
+    Encode a config to bytes with a version header.
+
+    :param obj: The config
+    :param str codec: One of 'zlib', 'zstd' or 'msgpack', defaults to the
+        ``config_storage`` setting
+    :rtype: bytes
+    """
+    codec = codec or default_codec() or ZLIB
+    header = MAGIC + bytes([FORMAT_VERSION, CODEC_IDS[codec]])
+    return header + _encode(codec, obj)
+
+
+def decode_config(data):
+    """
+    Decode bytes written by ``encode_config()``.
+
+    :param bytes data: The encoded config
+    :return: The config
+    """
+    data = bytes(data)
+    if data[:2] != MAGIC:
+        raise ValueError('Not an encoded chart config')
+    if data[2] != FORMAT_VERSION:
+        raise ValueError('Unsupported config format version: %d' % data[2])
+    try:
+        codec = CODEC_NAMES[data[3]]
+    except KeyError:
+        raise ValueError('Unknown config codec id: %d' % data[3])
+    return _decode(codec, data[4:])
@@ -0,0 +1,17 @@
+from django.conf.urls import url
+
+from chartforge import views
+
+
+urlpatterns = [
+    url(r'^(?P<slug>[-\w]+)\.(?P<fmt>png|jpeg|pdf|svg)$', views.chart_image, name='chartforge_image'),
+    url(r'^(?P<slug>[-\w]+)\.json$', views.chart_config, name='chartforge_config'),
+    url(r'^dynamic/(?P<app_name>[\w.]+)/(?P<chart_name>\w+)/data$',
+        views.chart_data, name='chartforge_data'),
+    url(r'^dynamic/(?P<app_name>[\w.]+)/(?P<chart_name>\w+)/delta$',
+        views.chart_delta, name='chartforge_delta'),
+    url(r'^dynamic/(?P<app_name>[\w.]+)/(?P<chart_name>\w+)/events$',
+        views.chart_events, name='chartforge_events'),
+    url(r'^dashboard$', views.chart_dashboard, name='chartforge_dashboard'),
+    url(r'^metrics$', views.chart_metrics, name='chartforge_metrics'),
+]
@@ -0,0 +1,80 @@
+import asyncio
+import calendar
+import datetime
+
+from django.db import close_old_connections
+
+
+def _running_loop():
+    try:
+        return asyncio.get_running_loop()
+    except (AttributeError, RuntimeError):
+        return None
+
+
+def run_sync(awaitable):
+    """
+    Run an awaitable to completion from sync code, on a new event loop.
+    Can't be used from a thread that is already running an event loop, use
+    the async api there instead.
+
+    :param awaitable: The coroutine or future to run
+    :return: The result
+    """
+    if _running_loop() is not None:
+        raise RuntimeError('run_sync() called from a running event loop, use the async api')
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(awaitable)
+    finally:
+        loop.close()
+
+
+def call_in_thread(func, *args, **kwargs):
+    """
+    Call ``func`` from a pool thread. Database connections that are broken
+    or older than ``CONN_MAX_AGE`` are closed before and after the call, like
+    django does around each request, so long lived pool threads don't keep
+    stale connections.
+
+    :param func: The function to call
+    :return: The result
+    """
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+def freeze(obj):
+    """
+    Turn dicts and lists into something hashable, or raise TypeError when
+    they contain values that can't be hashed.
+
+    :param obj: A JSON like object
+    :return: A hashable version of obj
+    """
+    if isinstance(obj, dict):
+        # tagged so a dict never equals a list of pairs
+        return dict, tuple(sorted((k, freeze(v)) for k, v in obj.items()))
+    if isinstance(obj, (list, tuple)):
+        return tuple(freeze(v) for v in obj)
+    if isinstance(obj, (bool, float)):
+        # True == 1 == 1.0, but they're different values in a config
+        return type(obj), obj
+    hash(obj)
+    return obj
+
+
+def to_timestamp(value):
+    """
+    Convert dates and datetimes to milliseconds since the epoch, as used by
+    Highcharts. Naive datetimes are taken to be UTC, other values are returned
+    unchanged.
+    """
+    if isinstance(value, datetime.datetime):
+        return calendar.timegm(value.utctimetuple()) * 1000 + value.microsecond // 1000
+    if isinstance(value, datetime.date):
+        return calendar.timegm(value.timetuple()) * 1000
+    return value
@@ -0,0 +1,479 @@
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from django.core.cache import caches
+from django.core.exceptions import PermissionDenied
+from django.http import (
+    Http404, HttpResponse, HttpResponseBadRequest, HttpResponseNotModified, StreamingHttpResponse)
+from django.utils.http import http_date, parse_http_date_safe
+
+from chartforge.backends import get_backend_manager
+from chartforge.base import Chart, RenderType
+from chartforge.cache import RenderCache, config_digest
+from chartforge.codec import dumpb, dumps, loads
+from chartforge.dashboard import Dashboard, parse_charts
+from chartforge.dynamic import InvalidChartKwargs
+from chartforge.export import _gzip, brotli
+from chartforge.incremental import InvalidCursor, parse_cursor
+from chartforge.instrumentation import enabled as instrumentation_enabled, metrics
+from chartforge.models import Chart as ChartModel
+from chartforge.registry import get_chart_class
+from chartforge.render import RenderQueueFull
+from chartforge.settings import ChartForgeSettings
+from chartforge.utils import to_timestamp
+
+
+RENDER_FORMATS = {
+    'png': RenderType.PNG,
+    'jpeg': RenderType.JPEG,
+    'pdf': RenderType.PDF,
+    'svg': RenderType.SVG
+}
+
+# seconds clients are asked to wait when the render pool is busy
+RENDER_RETRY_AFTER = 5
+
+# content codings for chart data, best first. Brotli uses a lower quality
+# than exports because data is compressed when it's requested
+DATA_ENCODINGS = [('gzip', _gzip)]
+if brotli is not None:
+    DATA_ENCODINGS.insert(0, ('br', lambda data: brotli.compress(data, quality=5)))
+
+
+def chart_stream_response(chart, filename=None, chunk_size=65536):
+    """
+    Create a response that streams a serialized chart, for exporting charts
+    with large series without holding the whole document in memory.
+
+    :param Chart chart: The chart to stream
+    :param str filename: When set, the response is sent as an attachment
+    :param int chunk_size: Approximate size of each chunk
+    :rtype: StreamingHttpResponse
+    """
+    response = StreamingHttpResponse(
+        chart.iter_serialize(chunk_size),
+        content_type='application/json')
+    if filename is not None:
+        response['Content-Disposition'] = 'attachment; filename="%s"' % filename
+    return response
+
+
+def _etag_matches(request, etag):
+    header = request.META.get('HTTP_IF_NONE_MATCH')
+    if not header:
+        return False
+    tags = [t.strip() for t in header.split(',')]
+    return '*' in tags or etag in tags or ('W/%s' % etag) in tags
+
+
+def _int_param(request, name):
+    try:
+        value = int(request.GET[name])
+    except (KeyError, ValueError):
+        return None
+    return min(max(value, 16), 4096)
+
+
+def _sized_chart(chart, width, height):
+    """
+    Apply a requested size to a chart's ``chart.width`` and ``chart.height``
+    options, the same options the Highcharts exporter uses.
+    """
+    if width is None and height is None:
+        return chart
+    options = dict(chart.config.get('chart') or {})
+    if width is not None:
+        options['width'] = width
+    if height is not None:
+        options['height'] = height
+    return Chart(chart.slug, dict(chart.config, chart=options))
+
+
+# for drafts served to staff users, shared caches mustn't keep them
+DRAFT_CACHE_CONTROL = 'private, no-store'
+
+
+def _check_draft(request, slug):
+    """
+    Check if a saved chart is a draft, saved unpublished in the ``Chart``
+    model, and raise Http404 for drafts unless the user is staff. Charts from
+    other backends have no publish flag. The user is only read for drafts,
+    since reading it adds ``Vary: Cookie`` and would split shared caches of
+    published charts per session.
+
+    :return: True for a draft served to a staff user
+    """
+    if not ChartModel.objects.filter(publish=False, slug=slug).exists():
+        return False
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_staff:
+        raise Http404('No chart with slug: %s' % slug)
+    return True
+
+
+def chart_image(request, slug, fmt):
+    """
+    Serve a rendered chart image. Images are cached by content, the cache
+    key doubles as a strong ETag so clients that already have the image get
+    a 304 without anything being rendered or even read from the cache.
+    Unpublished charts are not found unless the user is staff, and a busy
+    render pool gives a 503 with ``Retry-After``.
+    """
+    render_type = RENDER_FORMATS.get(fmt)
+    if render_type is None:
+        raise Http404('Unknown image format: %s' % fmt)
+    draft = _check_draft(request, slug)
+
+    manager = get_backend_manager()
+    chart = manager.get_chart(slug)
+    if chart is None:
+        raise Http404('No chart with slug: %s' % slug)
+
+    chart = _sized_chart(chart, _int_param(request, 'width'), _int_param(request, 'height'))
+    cache = RenderCache()
+    key = cache.key(chart, render_type)
+    etag = '"%s"' % key
+    if _etag_matches(request, etag):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        if draft:
+            response['Cache-Control'] = DRAFT_CACHE_CONTROL
+        return response
+
+    try:
+        data, last_modified = cache.get_or_render(
+            key, lambda: manager.render_chart(chart, render_type))
+    except (RenderQueueFull, FutureTimeoutError):
+        response = HttpResponse('Chart rendering is busy, try again later', status=503)
+        response['Retry-After'] = str(RENDER_RETRY_AFTER)
+        return response
+
+    since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    if since is not None and 'HTTP_IF_NONE_MATCH' not in request.META and int(last_modified) <= since:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(data, content_type=render_type)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = DRAFT_CACHE_CONTROL if draft else 'public, max-age=3600'
+    return response
+
+
+def _get_chart(request, app_name, chart_name):
+    try:
+        chart = get_chart_class(app_name, chart_name)()
+    except KeyError:
+        raise Http404('No chart named %s.%s' % (app_name, chart_name))
+    if not chart.has_permission(request):
+        raise PermissionDenied
+    return chart
+
+
+def _chart_kwargs(request, exclude=()):
+    return dict((k, v) for k, v in request.GET.items() if k not in exclude)
+
+
+def _clean_kwargs(chart, request, exclude=()):
+    """
+    Get the query parameters as kwargs for ``chart``, checked with its
+    ``clean_kwargs()``. Raises ``InvalidChartKwargs``.
+    """
+    return chart.clean_kwargs(_chart_kwargs(request, exclude))
+
+
+def _json_response(data):
+    return HttpResponse(dumpb(data), content_type='application/json')
+
+
+def _accepted_encoding(request):
+    """
+    Get the first of ``DATA_ENCODINGS`` the client accepts, or None for the
+    uncompressed body.
+    """
+    accepted = {}
+    for part in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, _, params = part.partition(';')
+        name, _, value = params.partition('=')
+        quality = 1.0
+        if name.strip() == 'q':
+            try:
+                quality = float(value)
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    for coding, _ in DATA_ENCODINGS:
+        if accepted.get(coding, accepted.get('*', 0)) > 0:
+            return coding
+    return None
+
+
+def _byte_range(request, etag, length):
+    """
+    Parse a single ``Range: bytes=`` header. Ranges are only served for
+    bodies with a strong ETag, and ignored when ``If-Range`` doesn't match it.
+
+    :return: (start, end) inclusive, None for the whole body, or False when
+        the range can't be satisfied
+    """
+    header = request.META.get('HTTP_RANGE', '')
+    if etag is None or not header.startswith('bytes=') or ',' in header:
+        return None
+    if request.META.get('HTTP_IF_RANGE', etag) != etag:
+        return None
+    start, _, end = header[6:].strip().partition('-')
+    try:
+        if not start:
+            suffix = int(end)
+            return (max(0, length - suffix), length - 1) if suffix > 0 and length else False
+        start = int(start)
+        end = length - 1 if not end else min(int(end), length - 1)
+    except ValueError:
+        return None
+    if start >= length or start > end:
+        return False
+    return start, end
+
+
+def _data_headers(response, etag, settings):
+    if etag is not None:
+        response['ETag'] = etag
+    response['Cache-Control'] = settings.data_cache_control
+    response['Vary'] = 'Accept-Encoding'
+    return response
+
+
+def _conditional_json(request, tag, build):
+    """
+    Serve the JSON of ``build()``, compressed with the best encoding the
+    client accepts.
+
+    When ``tag`` is set it becomes a strong ETag, with the encoding added
+    since each encoding is a different body. Clients with a matching
+    ``If-None-Match`` get a 304 without ``build()`` being called. The
+    compressed body is cached under the ETag, so other clients and CDN edges
+    revalidating skip building and compressing it, and single byte ranges of
+    it are served for resumed downloads.
+
+    :param str tag: Changes whenever the data does, None when unknown
+    :param build: Function returning the data
+    :rtype: HttpResponse
+    """
+    settings = ChartForgeSettings()
+    encoding = _accepted_encoding(request)
+    etag = None
+    if tag is not None:
+        etag = '"%s"' % (tag if encoding is None else '%s-%s' % (tag, encoding))
+        if _etag_matches(request, etag):
+            return _data_headers(HttpResponseNotModified(), etag, settings)
+
+    cache = caches[settings.cache_alias]
+    key = None if etag is None else 'chartforge:data:%s' % etag.strip('"')
+    cached = None if key is None else cache.get(key)
+    if cached is not None:
+        encoding, body = cached
+    else:
+        body = dumpb(build())
+        if encoding is not None and len(body) >= settings.data_compress_min_size:
+            body = dict(DATA_ENCODINGS)[encoding](body)
+        else:
+            encoding = None
+        if key is not None:
+            cache.set(key, (encoding, body), settings.data_response_timeout)
+
+    byte_range = _byte_range(request, etag, len(body))
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = 'bytes */%d' % len(body)
+        return response
+    if byte_range is None:
+        response = HttpResponse(body, content_type='application/json')
+    else:
+        start, end = byte_range
+        response = HttpResponse(body[start:end + 1], content_type='application/json', status=206)
+        response['Content-Range'] = 'bytes %d-%d/%d' % (start, end, len(body))
+    if encoding is not None:
+        response['Content-Encoding'] = encoding
+    if etag is not None:
+        response['Accept-Ranges'] = 'bytes'
+    return _data_headers(response, etag, settings)
+
+
+def chart_config(request, slug):
+    """
+    Serve a saved chart's config, decimated like rendered charts. The ETag
+    comes from the chart's version, so unchanged charts get a 304 without
+    their config being loaded. Unpublished charts are not found unless the
+    user is staff, and aren't stored by shared caches when they are.
+    """
+    draft = _check_draft(request, slug)
+    manager = get_backend_manager()
+    version = manager.get_chart_version(slug)
+    tag = None
+    if version is not None:
+        tag = config_digest(
+            slug, version, manager.settings.max_points, manager.settings.decimation)
+
+    def build():
+        chart = manager.get_chart(slug)
+        if chart is None:
+            raise Http404('No chart with slug: %s' % slug)
+        return manager.prepare_chart(chart).config
+    response = _conditional_json(request, tag, build)
+    if draft:
+        response['Cache-Control'] = DRAFT_CACHE_CONTROL
+    return response
+
+
+def chart_data(request, app_name, chart_name):
+    """
+    Serve the data of a dynamic chart, decimated to its ``max_points``. Query
+    parameters are passed to the chart as kwargs. The ETag comes from
+    ``get_version()``, so unchanged data gets a 304 before ``get_data()``
+    runs.
+    """
+    chart = _get_chart(request, app_name, chart_name)
+    try:
+        kwargs = _clean_kwargs(chart, request)
+    except InvalidChartKwargs as e:
+        return HttpResponseBadRequest(str(e))
+    version = chart.get_version(**kwargs)
+    tag = None
+    if version is not None:
+        tag = config_digest(
+            kwargs, type(chart).__module__, chart.name, version,
+            chart.max_points, chart.decimation)
+    return _conditional_json(request, tag, lambda: chart.get_decimated_data(**kwargs))
+
+
+def chart_delta(request, app_name, chart_name):
+    """
+    Return the points of a dynamic chart added after the ``since`` cursor.
+    Every other query parameter is passed to the chart as a kwarg.
+    """
+    chart = _get_chart(request, app_name, chart_name)
+    cursor = parse_cursor(request.GET.get('since'))
+    try:
+        delta = chart.get_delta(cursor, **_clean_kwargs(chart, request, ('since',)))
+    except (InvalidChartKwargs, InvalidCursor) as e:
+        return HttpResponseBadRequest(str(e))
+    return _json_response(delta)
+
+
+def _events(chart, delta, kwargs, interval, max_duration):
+    yield 'retry: %d\n\n' % (interval * 1000)
+    deadline = time.time() + max_duration
+    while True:
+        if delta['series']:
+            # the same epoch milliseconds as the cursor in the data
+            yield 'id: %s\nevent: delta\ndata: %s\n\n' % (
+                to_timestamp(delta['cursor']), dumps(delta))
+        else:
+            # comments keep proxies from closing idle connections
+            yield ': keepalive\n\n'
+        time.sleep(interval)
+        if time.time() >= deadline:
+            return
+        delta = chart.get_delta(delta['cursor'], **kwargs)
+
+
+def chart_events(request, app_name, chart_name):
+    """
+    Server sent events stream of deltas for a dynamic chart. Clients resume
+    from the ``Last-Event-ID`` header or the ``since`` parameter.
+
+    Each stream holds a worker thread for its whole length, so on sync
+    servers it ends after the ``sse_max_duration`` setting, 30 seconds by
+    default, and the browser reconnects from its last cursor. Raise it only
+    with a threaded or async server that has threads to spare.
+    """
+    settings = ChartForgeSettings()
+    chart = _get_chart(request, app_name, chart_name)
+    cursor = parse_cursor(request.META.get('HTTP_LAST_EVENT_ID') or request.GET.get('since'))
+    # the first delta is made before streaming so bad requests get a 400
+    try:
+        kwargs = _clean_kwargs(chart, request, ('since',))
+        delta = chart.get_delta(cursor, **kwargs)
+    except (InvalidChartKwargs, InvalidCursor) as e:
+        return HttpResponseBadRequest(str(e))
+    response = StreamingHttpResponse(
+        _events(chart, delta, kwargs, settings.sse_interval, settings.sse_max_duration),
+        content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def _dashboard_request(request):
+    """
+    Get the requested charts, shared kwargs and stream flag of a dashboard
+    request. Raises ValueError for malformed requests.
+    """
+    if request.method == 'POST':
+        body = loads(request.body)
+        if not isinstance(body, dict) or not isinstance(body.get('charts'), list):
+            raise ValueError('Expected an object with a charts list')
+        kwargs = body.get('kwargs') or {}
+        if not isinstance(kwargs, dict):
+            raise ValueError('Kwargs must be an object')
+        return parse_charts(body['charts']), kwargs, bool(body.get('stream'))
+    return (
+        parse_charts(request.GET.getlist('chart')),
+        _chart_kwargs(request, ('chart', 'stream')),
+        request.GET.get('stream') in ('1', 'true'))
+
+
+def chart_dashboard(request):
+    """
+    Load many dynamic charts in one request. Takes chart keys, like
+    'app.MyChart', either as repeated ``chart`` query parameters with the
+    other parameters as kwargs for every chart, or as a POSTed JSON object::
+
+        {
+            "charts": ["app.MyChart", {"chart": "app.Other", "id": "b", "kwargs": {"year": 2017}}],
+            "kwargs": {"region": "eu"},
+            "stream": true
+        }
+
+    Shared kwargs are overridden by a chart's own kwargs. The response is
+    ``{"charts": [{"id", "chart", "config", "data"}, ...]}`` in request order,
+    with an ``error`` instead of config and data for charts that failed or
+    that the user may not load. Kwargs a chart doesn't accept are a 400. When
+    streamed, charts are written out in the order they finish.
+    """
+    try:
+        charts, kwargs, stream = _dashboard_request(request)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    if not charts:
+        return HttpResponseBadRequest('No charts requested')
+    if len(charts) > ChartForgeSettings().dashboard_max_charts:
+        return HttpResponseBadRequest('Too many charts requested')
+
+    for chart in charts:
+        chart.kwargs = dict(kwargs, **chart.kwargs)
+    dashboard = Dashboard(charts, request=request)
+    try:
+        dashboard.resolve()
+    except InvalidChartKwargs as e:
+        return HttpResponseBadRequest(str(e))
+    if stream:
+        response = StreamingHttpResponse(dashboard.iter_serialize(), content_type='application/json')
+        response['X-Accel-Buffering'] = 'no'
+        return response
+    return _json_response({'charts': dashboard.results()})
+
+
+def chart_metrics(request):
+    """
+    The instrumentation metrics in the Prometheus text format. Not found
+    unless the ``instrumentation`` setting is on, and forbidden for users that
+    aren't staff unless the ``metrics_public`` setting is on.
+    """
+    if not instrumentation_enabled():
+        raise Http404('Instrumentation is disabled')
+    if not ChartForgeSettings().metrics_public:
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_staff:
+            raise PermissionDenied
+    return HttpResponse(
+        metrics.prometheus_text(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,6 @@
+from chartforge import dynamic_chart
+
+
+@dynamic_chart()
+def lazy_chart(chart):
+    return {'series': []}
@@ -0,0 +1,88 @@
+import json
+from unittest import mock, skipUnless
+
+from django.test import SimpleTestCase
+
+from chartforge import arrays
+from chartforge.arrays import ColumnarSeries, encode_array, to_list
+from chartforge.base import Chart
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def strict_loads(data):
+    def reject(value):
+        raise ValueError('Invalid JSON constant %s' % value)
+    return json.loads(data, parse_constant=reject)
+
+
+class ColumnarSeriesTests(SimpleTestCase):
+    def test_lists(self):
+        self.assertEqual(ColumnarSeries([1, 2, 3]).tolist(), [1, 2, 3])
+        self.assertEqual(ColumnarSeries([1, 2], [3, 4]).tolist(), [[1, 3], [2, 4]])
+        self.assertEqual(strict_loads(ColumnarSeries([1, 2], [3, 4]).encode()), [[1, 3], [2, 4]])
+
+    def test_category_x(self):
+        # y values used to become strings next to string x values
+        series = ColumnarSeries(['a', 'b'], [1, 2.5])
+        self.assertEqual(series.tolist(), [['a', 1], ['b', 2.5]])
+        self.assertEqual(strict_loads(series.encode()), [['a', 1], ['b', 2.5]])
+        self.assertEqual(strict_loads(ColumnarSeries(['a'], [float('nan')]).encode()), [['a', None]])
+
+    def test_columns_must_match(self):
+        with self.assertRaises(AssertionError):
+            ColumnarSeries([1, 2], [3])
+
+
+@skipUnless(numpy, 'NumPy is not installed')
+class NumpyTests(SimpleTestCase):
+    def encodings(self, arr):
+        """
+        The array encoded with and without orjson.
+        """
+        results = [strict_loads(encode_array(arr))]
+        with mock.patch.object(arrays, 'orjson', None):
+            results.append(strict_loads(encode_array(arr)))
+        return results
+
+    def test_nan_becomes_null(self):
+        arr = numpy.array([1.5, numpy.nan, 3.0])
+        self.assertEqual(to_list(arr), [1.5, None, 3.0])
+        for result in self.encodings(arr):
+            self.assertEqual(result, [1.5, None, 3.0])
+
+    def test_datetimes(self):
+        arr = numpy.array(['2017-01-01', 'NaT'], dtype='datetime64[D]')
+        self.assertEqual(to_list(arr), [1483228800000, None])
+
+    def test_dtypes(self):
+        for dtype in ('float16', '>f8', '<f8', '>i4', 'int8', 'uint64', 'bool'):
+            arr = numpy.arange(4).astype(dtype)
+            for result in self.encodings(arr):
+                self.assertEqual(result, arr.tolist(), dtype)
+
+    def test_mixed_columns(self):
+        times = numpy.array(['2017-01-01', 'NaT', '2017-01-03'], dtype='datetime64[D]')
+        values = numpy.array([1.0, 2.0, numpy.nan])
+        series = ColumnarSeries(times, values)
+        expected = [[1483228800000, 1.0], [None, 2.0], [1483401600000, None]]
+        self.assertEqual(series.tolist(), expected)
+        self.assertEqual(strict_loads(series.encode()), expected)
+
+    def test_serialize(self):
+        config = {'series': [
+            {'data': numpy.array([[1, 2], [3, 4]])},
+            {'data': ColumnarSeries(numpy.arange(3), numpy.array([0.5, numpy.nan, 1.5]))},
+            {'y': numpy.float64(2.5)}
+        ]}
+        expected = {'series': [
+            {'data': [[1, 2], [3, 4]]},
+            {'data': [[0, 0.5], [1, None], [2, 1.5]]},
+            {'y': 2.5}
+        ]}
+        chart = Chart('arrays', config)
+        self.assertEqual(strict_loads(chart.serialize())['config'], expected)
+        self.assertEqual(strict_loads(''.join(chart.iter_serialize()))['config'], expected)
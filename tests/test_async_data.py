@@ -0,0 +1,71 @@
+import asyncio
+import threading
+
+from django.core.cache import caches
+from django.test import SimpleTestCase
+
+from chartforge import dynamic_chart
+from chartforge.dynamic import get_data_executor
+from chartforge.registry import get_chart_class
+from chartforge.utils import run_sync
+
+
+calls = []
+
+
+@dynamic_chart(cache_timeout=60)
+async def async_chart(chart, region='all'):
+    calls.append(region)
+    await asyncio.sleep(0.05)
+    return {'series': [{'name': region, 'data': [1, 2, 3]}]}
+
+
+@dynamic_chart()
+class AsyncClassChart:
+    async def get_data(self, region='all'):
+        calls.append(region)
+        return {'region': region}
+
+
+@dynamic_chart()
+def sync_chart(chart):
+    return {'thread': threading.current_thread().name}
+
+
+class AsyncDataTests(SimpleTestCase):
+    def setUp(self):
+        caches['default'].clear()
+        del calls[:]
+        get_chart_class(__name__, 'async_chart').invalidate_all_data()
+
+    def test_concurrent_calls_compute_once(self):
+        chart = get_chart_class(__name__, 'async_chart')()
+
+        async def fetch():
+            return await asyncio.gather(*[chart.aget_data(region='eu') for _ in range(5)])
+
+        results = run_sync(fetch())
+        self.assertEqual(calls, ['eu'])
+        self.assertEqual(len(results), 5)
+        self.assertTrue(all(r == results[0] for r in results))
+        # every caller gets its own copy
+        results[0]['series'].append(None)
+        self.assertEqual(len(results[1]['series']), 1)
+
+    def test_sync_and_async_share_cache(self):
+        chart = get_chart_class(__name__, 'async_chart')()
+        self.assertEqual(chart.get_data(region='us')['series'][0]['name'], 'us')
+        run_sync(chart.aget_data(region='us'))
+        self.assertEqual(calls, ['us'])
+
+    def test_class_coroutine_called_sync(self):
+        chart = get_chart_class(__name__, 'AsyncClassChart')()
+        self.assertTrue(chart.has_async_data())
+        self.assertEqual(chart.get_data(region='eu'), {'region': 'eu'})
+        self.assertEqual(run_sync(chart.aget_data(region='us')), {'region': 'us'})
+
+    def test_sync_data_uses_own_executor(self):
+        chart = get_chart_class(__name__, 'sync_chart')()
+        result = run_sync(chart.aget_data())
+        workers = {t.name for t in get_data_executor()._threads}
+        self.assertIn(result['thread'], workers)
@@ -0,0 +1,186 @@
+import asyncio
+import threading
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from chartforge.backends.base import AsyncBackendBase, BackendBase, BackendManager, is_enabled
+from chartforge.base import Chart
+from chartforge.utils import run_sync
+
+
+class MemoryBackend(BackendBase):
+    def __init__(self, *slugs, delay=0):
+        super().__init__()
+        self.charts = dict((slug, Chart(slug, {'title': slug})) for slug in slugs)
+        self.delay = delay
+
+    def get_charts(self):
+        time.sleep(self.delay)
+        return list(self.charts.values())
+
+    def get_chart(self, slug=None):
+        time.sleep(self.delay)
+        return self.charts.get(slug)
+
+
+class FailingBackend(BackendBase):
+    def get_charts(self):
+        raise RuntimeError('down')
+
+
+class BlockingBackend(BackendBase):
+    timeout = 0.05
+
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+        self.calls = 0
+
+    def get_charts(self):
+        self.calls += 1
+        self.release.wait(5)
+        return [Chart('blocked', {})]
+
+
+class AsyncMemoryBackend(AsyncBackendBase):
+    def __init__(self, *slugs):
+        super().__init__()
+        self.charts = dict((slug, Chart(slug, {})) for slug in slugs)
+
+    async def aget_charts(self):
+        await asyncio.sleep(0)
+        return list(self.charts.values())
+
+    async def aget_chart(self, slug=None):
+        return self.charts.get(slug)
+
+
+def slugs(charts):
+    return [chart.slug for chart in charts]
+
+
+class BackendManagerTests(SimpleTestCase):
+    def test_merged_in_settings_order(self):
+        manager = BackendManager([MemoryBackend('a', 'b', delay=0.02), MemoryBackend('c')])
+        self.assertEqual(slugs(manager.get_charts()), ['a', 'b', 'c'])
+        self.assertEqual(manager.get_chart('c').slug, 'c')
+        self.assertIsNone(manager.get_chart('missing'))
+
+    def test_calls_run_concurrently(self):
+        manager = BackendManager([MemoryBackend('a', delay=0.1) for _ in range(4)])
+        start = time.time()
+        self.assertEqual(len(manager.get_charts()), 4)
+        self.assertLess(time.time() - start, 0.35)
+
+    def test_failures_are_left_out(self):
+        manager = BackendManager([FailingBackend(), MemoryBackend('a')])
+        with self.assertLogs('chartforge', 'ERROR'):
+            self.assertEqual(slugs(manager.get_charts()), ['a'])
+
+    def test_timeout_with_one_backend(self):
+        backend = BlockingBackend()
+        manager = BackendManager([backend])
+        self.addCleanup(backend.release.set)
+        start = time.time()
+        with self.assertLogs('chartforge', 'WARNING'):
+            self.assertEqual(manager.get_charts(), [])
+        self.assertLess(time.time() - start, 1)
+
+    def test_stuck_backends_are_skipped(self):
+        blocking = BlockingBackend()
+        manager = BackendManager([blocking, MemoryBackend('a')])
+        self.addCleanup(blocking.release.set)
+        with self.assertLogs('chartforge', 'WARNING'):
+            self.assertEqual(slugs(manager.get_charts()), ['a'])
+        time.sleep(0.1)
+        with self.assertLogs('chartforge', 'WARNING') as logs:
+            self.assertEqual(slugs(manager.get_charts()), ['a'])
+        self.assertIn('skipped', logs.output[0])
+        self.assertEqual(blocking.calls, 1)
+
+        blocking.release.set()
+        time.sleep(0.1)
+        self.assertEqual(slugs(manager.get_charts()), ['blocked', 'a'])
+
+    def test_closes_old_connections(self):
+        manager = BackendManager([MemoryBackend('a')])
+        with mock.patch('chartforge.utils.close_old_connections') as close:
+            manager.get_charts()
+        self.assertEqual(close.call_count, 2)
+
+    def test_disabled_methods(self):
+        manager = BackendManager([FailingBackend(), MemoryBackend('a')])
+        self.assertEqual(manager.get_backends('get_chart')[0].__class__, MemoryBackend)
+        self.assertEqual(manager.get_chart_templates(), [])
+
+
+class AsyncBackendManagerTests(SimpleTestCase):
+    def test_mixed_backends(self):
+        manager = BackendManager([AsyncMemoryBackend('a'), MemoryBackend('b')])
+        self.assertEqual(slugs(run_sync(manager.aget_charts())), ['a', 'b'])
+        self.assertEqual(slugs(manager.get_charts()), ['a', 'b'])
+        self.assertEqual(run_sync(manager.aget_chart('b')).slug, 'b')
+
+    def test_timeouts(self):
+        blocking = BlockingBackend()
+        manager = BackendManager([blocking, AsyncMemoryBackend('a')])
+        self.addCleanup(blocking.release.set)
+        with self.assertLogs('chartforge', 'WARNING'):
+            self.assertEqual(slugs(run_sync(manager.aget_charts())), ['a'])
+
+    def test_async_backends_from_sync_code(self):
+        backend = AsyncMemoryBackend('a')
+        self.assertEqual(slugs(backend.get_charts()), ['a'])
+
+
+class BatchBackend(MemoryBackend):
+    def __init__(self, *slugs):
+        super().__init__(*slugs)
+        self.batches = []
+
+    def get_charts_by_slugs(self, slugs):
+        self.batches.append(list(slugs))
+        return dict((s, self.charts[s]) for s in slugs if s in self.charts)
+
+    def save_chart(self, chart):
+        self.charts[chart.slug] = chart
+
+
+class BatchMethodTests(SimpleTestCase):
+    def test_enabled_by_single_item_method(self):
+        self.assertTrue(is_enabled(MemoryBackend(), 'get_charts_by_slugs'))
+        self.assertFalse(is_enabled(MemoryBackend(), 'save_charts'))
+        self.assertTrue(is_enabled(BatchBackend(), 'save_charts'))
+        self.assertFalse(is_enabled(FailingBackend(), 'get_charts_by_slugs'))
+
+    def test_get_charts_by_slugs(self):
+        batch = BatchBackend('a', 'b')
+        manager = BackendManager([batch, MemoryBackend('b', 'c')])
+        charts = manager.get_charts_by_slugs(['c', 'missing', 'b', 'a'])
+        self.assertEqual(list(charts), ['c', 'b', 'a'])
+        # earlier backends take precedence
+        self.assertIs(charts['b'], batch.charts['b'])
+        self.assertEqual(batch.batches, [['c', 'missing', 'b', 'a']])
+
+    def test_save_charts_falls_back(self):
+        backend = BatchBackend()
+        BackendManager([MemoryBackend(), backend]).save_charts(
+            [Chart('a', {}), Chart('b', {})])
+        self.assertEqual(sorted(backend.charts), ['a', 'b'])
+
+    def test_render_charts_uses_pool(self):
+        pool = mock.Mock()
+        pool.render_many.return_value = [b'a', b'b']
+        manager = BackendManager([MemoryBackend()])
+        with mock.patch('chartforge.backends.base.get_render_pool', return_value=pool):
+            result = manager.render_charts([Chart('a', {'x': 1}), Chart('b', {'x': 2})], 'image/svg')
+        self.assertEqual(result, [b'a', b'b'])
+        pool.render_many.assert_called_once_with([({'x': 1}, 'image/svg'), ({'x': 2}, 'image/svg')])
+
+    def test_async_batch(self):
+        backend = AsyncMemoryBackend('a', 'b')
+        self.assertEqual(list(backend.get_charts_by_slugs(['b', 'x'])), ['b'])
+        manager = BackendManager([backend])
+        self.assertEqual(list(run_sync(manager.aget_charts_by_slugs(['a']))), ['a'])
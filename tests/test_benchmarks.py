@@ -0,0 +1,51 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from chartforge import benchmarks
+from chartforge.benchmarks import SIZES, compare, load_results, run_benchmarks, save_results
+from chartforge.render import RenderPool
+
+
+class BenchmarkTests(SimpleTestCase):
+    def setUp(self):
+        with self.assertLogs('chartforge', 'WARNING'):
+            pool = RenderPool(workers=0)
+        patcher = mock.patch('chartforge.render._pool', pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_run_and_compare(self):
+        results = run_benchmarks(['small'], repeat=2, min_time=0)
+        names = [r['name'] for r in results['results']]
+        self.assertIn('dynamic_chart.render_template', names)
+        self.assertIn('backend.render_svg', names)
+        self.assertTrue(results['created'].endswith('+00:00'))
+
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        path = os.path.join(location, 'baseline.json')
+        save_results(results, path)
+        rows = compare(results, load_results(path))
+        self.assertEqual(len(rows), len(results['results']))
+        self.assertTrue(all(row[4] == 1 for row in rows))
+
+    def test_names(self):
+        results = run_benchmarks(['small'], ['chart.'], repeat=1, min_time=0)
+        self.assertTrue(all(r['name'].startswith('chart.') for r in results['results']))
+
+    def test_render_template_uses_size(self):
+        small, medium = SIZES['small'], SIZES['medium']
+        benchmarks.bench_render_template(small)()
+        with mock.patch.object(benchmarks, 'make_config', wraps=benchmarks.make_config) as make:
+            benchmarks.bench_render_template(medium)
+        make.assert_called_once_with(medium[0], medium[1])
+
+    def test_merge_size_is_bounded(self):
+        with mock.patch.object(benchmarks, 'make_config', return_value={'series': []}) as make:
+            benchmarks.bench_merge(SIZES['huge'])
+        for call in make.call_args_list:
+            self.assertLessEqual(call[0][1], 10)
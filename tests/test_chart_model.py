@@ -0,0 +1,81 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from chartforge.backends.chart_model import ChartModelBackend
+from chartforge.base import Chart
+from chartforge.codec import dumps
+from chartforge.models import Chart as ChartModel, ChartTemplate
+
+
+class ChartModelBackendTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(username='ann')
+        template = ChartTemplate.objects.create(name='Line', chart_class='tests.ExampleChart')
+        ChartTemplate.objects.create(name='Bar', chart_class='tests.CustomChartName')
+        for i in range(5):
+            ChartModel.objects.create(
+                name='Chart %d' % i, slug='chart-%d' % i, config=dumps({'n': i}),
+                chart_type=template, author=author, publish=i % 2 == 0)
+
+    def setUp(self):
+        self.backend = ChartModelBackend()
+        self.backend.batch_size = 2
+
+    def test_get_chart(self):
+        with self.assertNumQueries(1):
+            chart = self.backend.get_chart('chart-1')
+        self.assertEqual(chart.config, {'n': 1})
+        self.assertIsNone(self.backend.get_chart('missing'))
+
+    def test_list_charts_pages(self):
+        with self.assertNumQueries(1):
+            rows, cursor = self.backend.list_charts(limit=2)
+        self.assertEqual([r['slug'] for r in rows], ['chart-0', 'chart-1'])
+        self.assertEqual(rows[0]['author'], 'ann')
+        self.assertEqual(rows[0]['chart_type'], 'Line')
+        self.assertNotIn('config', rows[0])
+
+        slugs = [r['slug'] for r in rows]
+        while cursor is not None:
+            rows, cursor = self.backend.list_charts(after=cursor, limit=2)
+            slugs += [r['slug'] for r in rows]
+        self.assertEqual(slugs, ['chart-%d' % i for i in range(5)])
+
+    def test_list_published(self):
+        rows, cursor = self.backend.list_charts(published=True)
+        self.assertEqual([r['slug'] for r in rows], ['chart-0', 'chart-2', 'chart-4'])
+        self.assertIsNone(cursor)
+
+    def test_list_chart_templates(self):
+        rows, cursor = self.backend.list_chart_templates(limit=1)
+        self.assertEqual(rows[0]['name'], 'Line')
+        rows, cursor = self.backend.list_chart_templates(after=cursor, limit=1)
+        self.assertEqual(rows[0]['name'], 'Bar')
+        self.assertIsNone(cursor)
+
+    def test_get_charts_by_slugs(self):
+        # one query per batch of two slugs
+        with self.assertNumQueries(2) as queries:
+            charts = self.backend.get_charts_by_slugs(['chart-3', 'missing', 'chart-0'])
+        # only the columns a Chart needs are loaded
+        for query in queries.captured_queries:
+            self.assertNotIn('thumbnail', query['sql'])
+            self.assertNotIn('author_id', query['sql'])
+        self.assertEqual(list(charts), ['chart-3', 'chart-0'])
+        self.assertEqual(charts['chart-3'].config, {'n': 3})
+
+    def test_save_charts(self):
+        version = ChartModel.objects.get(slug='chart-0').version
+        self.backend.save_charts([
+            Chart('chart-0', {'n': 'updated'}),
+            Chart('new-chart', {'n': 'new'}),
+        ])
+        self.assertEqual(self.backend.get_chart('chart-0').config, {'n': 'updated'})
+        self.assertEqual(self.backend.get_chart('new-chart').config, {'n': 'new'})
+        self.assertEqual(ChartModel.objects.get(slug='chart-0').version, version + 1)
+        self.assertEqual(ChartModel.objects.get(slug='new-chart').version, 1)
+
+    def test_save_chart(self):
+        self.backend.save_chart(Chart('chart-1', {'n': 'saved'}))
+        self.assertEqual(self.backend.get_chart('chart-1').config, {'n': 'saved'})
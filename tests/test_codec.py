@@ -0,0 +1,49 @@
+import decimal
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from chartforge import codec
+from chartforge.arrays import numpy
+from chartforge.base import iterencode
+from chartforge.codec import CODECS, _INSTALLED, get_codec
+from chartforge.registry import get_chart_class
+
+
+INSTALLED = [name for name in CODECS if _INSTALLED[name]]
+
+
+class CodecTests(SimpleTestCase):
+    def test_same_output(self):
+        data = {'a': [1, 2.5, None, True], 'b': 'x</y', 'c': decimal.Decimal('1.5'), 'd': (1, 2)}
+        outputs = set(get_codec(name).dumps(data) for name in INSTALLED)
+        self.assertEqual(len(outputs), 1, outputs)
+        for name in INSTALLED:
+            self.assertEqual(get_codec(name).loads(get_codec(name).dumpb(data))['c'], 1.5)
+
+    def test_non_finite_floats_are_null(self):
+        data = {'a': [1.5, float('nan'), float('inf'), -float('inf')], 'b': decimal.Decimal('NaN')}
+        for name in INSTALLED:
+            self.assertEqual(
+                get_codec(name).dumps(data), '{"a":[1.5,null,null,null],"b":null}', name)
+        self.assertEqual(''.join(iterencode({'a': float('nan'), 'b': [float('inf'), {}]})),
+                         '{"a":null,"b":[null,{}]}')
+        if numpy is not None:
+            array = numpy.array([1.0, numpy.nan])
+            for name in INSTALLED:
+                self.assertEqual(get_codec(name).dumps({'a': array}), '{"a":[1.0,null]}', name)
+
+    def test_loads_str_subclass(self):
+        text = type('SafeText', (str,), {})('{"a": 1}')
+        for name in INSTALLED:
+            self.assertEqual(get_codec(name).loads(text), {'a': 1}, name)
+
+    def test_template_chart_under_each_codec(self):
+        # render_to_string() returns SafeText, which orjson used to reject
+        chart_class = get_chart_class('tests', 'ExampleChart')
+        for name in INSTALLED:
+            with mock.patch.object(codec, '_codec', get_codec(name)):
+                for cache_template in (False, True):
+                    with mock.patch.object(chart_class, 'cache_template', cache_template):
+                        config = chart_class()()
+                    self.assertIsInstance(config, dict, name)
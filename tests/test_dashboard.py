@@ -0,0 +1,111 @@
+import threading
+from unittest import mock
+
+from django.core.exceptions import PermissionDenied
+from django.test import RequestFactory, SimpleTestCase
+
+from chartforge import dynamic_chart
+from chartforge.codec import loads
+from chartforge.dashboard import Dashboard, DashboardChart
+from chartforge.views import chart_dashboard, chart_data
+
+
+calls = []
+
+
+@dynamic_chart(template={'title': {'text': 'Regional'}})
+def regional_chart(chart, region='all'):
+    calls.append(region)
+    return {'series': [{'name': region, 'data': [1, 2, 3]}]}
+
+
+@dynamic_chart()
+class PrivateChart:
+    template = {'title': {'text': 'Private'}}
+
+    def has_permission(self, request):
+        return request.user.is_staff
+
+    def get_data(self):
+        return {'series': []}
+
+
+@dynamic_chart()
+class ThreadChart:
+    def __call__(self, **kwargs):
+        return {'thread': threading.current_thread().name}
+
+    def get_data(self):
+        return {'series': []}
+
+
+KEY = __name__ + '.regional_chart'
+
+
+class DashboardTests(SimpleTestCase):
+    def setUp(self):
+        del calls[:]
+
+    def test_shared_data_calls(self):
+        charts = [
+            DashboardChart(KEY, {'region': 'eu'}, 'a'),
+            DashboardChart(KEY, {'region': 'eu'}, 'b'),
+            DashboardChart(KEY, {'region': 'us'}, 'c'),
+            DashboardChart('tests.missing'),
+        ]
+        results = Dashboard(charts).results()
+        self.assertEqual(sorted(calls), ['eu', 'us'])
+        self.assertEqual([r['id'] for r in results], ['a', 'b', 'c', 'tests.missing'])
+        self.assertEqual(results[2]['data']['series'][0]['name'], 'us')
+        self.assertEqual(results[3]['error'], 'No chart named tests.missing')
+
+    def test_calls_run_in_pool_threads(self):
+        with mock.patch('chartforge.utils.close_old_connections') as close:
+            result, = Dashboard([DashboardChart(__name__ + '.ThreadChart')]).results()
+        self.assertNotEqual(result['config']['thread'], threading.current_thread().name)
+        # before and after the data and the config call
+        self.assertEqual(close.call_count, 4)
+
+    def test_permission(self):
+        request = RequestFactory().get('/')
+        request.user = mock.Mock(is_staff=False)
+        key = __name__ + '.PrivateChart'
+        result, = Dashboard([DashboardChart(key)], request=request).results()
+        self.assertEqual(result['error'], 'Permission denied')
+        request.user.is_staff = True
+        result, = Dashboard([DashboardChart(key)], request=request).results()
+        self.assertEqual(result['data'], {'series': []})
+
+
+class DashboardViewTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def test_get(self):
+        request = self.factory.get('/dashboard', {'chart': [KEY], 'region': 'eu'})
+        response = chart_dashboard(request)
+        self.assertEqual(response.status_code, 200)
+        result, = loads(response.content)['charts']
+        self.assertEqual(result['data']['series'][0]['name'], 'eu')
+
+    def test_stream(self):
+        request = self.factory.get('/dashboard', {'chart': [KEY, KEY], 'stream': '1'})
+        response = chart_dashboard(request)
+        charts = loads(b''.join(response.streaming_content))['charts']
+        self.assertEqual(len(charts), 2)
+
+    def test_invalid_kwargs(self):
+        request = self.factory.get('/dashboard', {'chart': [KEY], 'foo': '1'})
+        response = chart_dashboard(request)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(KEY, response.content.decode())
+
+        body = '{"charts": [{"chart": "%s", "kwargs": {"year": 1}}]}' % KEY
+        request = self.factory.post('/dashboard', body, content_type='application/json')
+        self.assertEqual(chart_dashboard(request).status_code, 400)
+
+    def test_chart_permission(self):
+        request = self.factory.get('/data')
+        request.user = mock.Mock(is_staff=False)
+        with self.assertRaises(PermissionDenied):
+            chart_data(request, __name__, 'PrivateChart')
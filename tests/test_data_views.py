@@ -0,0 +1,112 @@
+import gzip
+from unittest import mock
+
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.http import Http404
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils.functional import SimpleLazyObject
+
+from chartforge import dynamic_chart
+from chartforge.codec import dumps, loads
+from chartforge.models import Chart as ChartModel
+from chartforge.views import chart_config, chart_data
+
+
+CONFIG = {'title': {'text': 'Sales'}, 'series': [{'data': list(range(100))}]}
+
+data_calls = []
+
+
+@dynamic_chart()
+class VersionedChart:
+    def get_version(self, **kwargs):
+        return 1
+
+    def get_data(self):
+        data_calls.append(1)
+        return {'series': [{'data': [1, 2]}]}
+
+
+class ChartConfigViewTests(TransactionTestCase):
+    # backend calls run in pool threads, which can't see rows in the test's
+    # transaction
+    def setUp(self):
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+        self.factory = RequestFactory()
+        ChartModel.objects.create(name='Sales', slug='sales', config=dumps(CONFIG), publish=True)
+        ChartModel.objects.create(name='Draft', slug='draft', config=dumps(CONFIG))
+
+    def get(self, slug, is_staff=False, **headers):
+        request = self.factory.get('/%s.json' % slug, **headers)
+        self.user_loads = []
+
+        def load_user():
+            # reading the user is what adds Vary: Cookie
+            self.user_loads.append(slug)
+            return mock.Mock(is_staff=is_staff)
+        request.user = SimpleLazyObject(load_user)
+        return chart_config(request, slug)
+
+    def test_published(self):
+        response = self.get('sales')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(loads(response.content), CONFIG)
+        self.assertTrue(response['Cache-Control'].startswith('public'))
+        self.assertEqual(self.user_loads, [])
+        response = self.get('sales', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_unpublished_is_staff_only(self):
+        with self.assertRaises(Http404):
+            self.get('draft')
+        response = self.get('draft', is_staff=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'private, no-store')
+        response = self.get('draft', is_staff=True, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['Cache-Control'], 'private, no-store')
+
+    @override_settings(CHART_FORGE={'data_compress_min_size': 0})
+    def test_compressed(self):
+        response = self.get('sales', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(loads(gzip.decompress(response.content)), CONFIG)
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+    def test_etag_changes_on_save(self):
+        etag = self.get('sales')['ETag']
+        obj = ChartModel.objects.get(slug='sales')
+        obj.name = 'Renamed'
+        obj.save()
+        self.assertNotEqual(self.get('sales')['ETag'], etag)
+
+
+class ChartVersionTests(TestCase):
+    def test_failed_save_keeps_version(self):
+        ChartModel.objects.create(name='a', slug='a')
+        obj = ChartModel(name='b', slug='a')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            obj.save()
+        self.assertEqual(obj.version, 0)
+        obj.slug = 'b'
+        obj.save()
+        self.assertEqual(obj.version, 1)
+
+
+class ChartDataViewTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+        del data_calls[:]
+
+    def test_not_modified_skips_get_data(self):
+        factory = RequestFactory()
+        response = chart_data(factory.get('/data'), __name__, 'VersionedChart')
+        self.assertEqual(loads(response.content), {'series': [{'data': [1, 2]}]})
+        request = factory.get('/data', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(chart_data(request, __name__, 'VersionedChart').status_code, 304)
+        # other clients get the cached body
+        chart_data(factory.get('/data'), __name__, 'VersionedChart')
+        self.assertEqual(len(data_calls), 1)
@@ -0,0 +1,61 @@
+from django.test import SimpleTestCase, TestCase
+
+from chartforge.arrays import ColumnarSeries
+from chartforge.datasource import QuerySetSource
+from chartforge.decimation import decimate_config
+from chartforge.models import Chart, ChartTemplate
+
+
+class QuerySetSourceTests(TestCase):
+    def setUp(self):
+        line = ChartTemplate.objects.create(name='Line', chart_class='tests.ExampleChart')
+        bar = ChartTemplate.objects.create(name='Bar', chart_class='tests.ExampleChart')
+        for slug, template, version in [
+                ('a', line, 1), ('b', line, 2), ('c', bar, 2), ('d', None, 3), ('e', None, 3)]:
+            chart = Chart.objects.create(name=slug, slug=slug, chart_type=template)
+            # save() bumps the version
+            Chart.objects.filter(pk=chart.pk).update(version=version)
+
+    def test_numeric(self):
+        data = QuerySetSource(Chart, x='version', name='Charts').get_data()
+        series, = data['series']
+        self.assertEqual(series['name'], 'Charts')
+        self.assertIsInstance(series['data'], ColumnarSeries)
+        self.assertEqual(series['data'].tolist(), [[1, 1], [2, 2], [3, 2]])
+        self.assertNotIn('xAxis', data)
+
+    def test_null_x_is_skipped_on_numeric_axes(self):
+        series, = QuerySetSource(Chart, x='chart_type_id').get_data()['series']
+        points = series['data'].tolist()
+        self.assertEqual([y for _, y in points], [2, 1])
+        self.assertNotIn(None, [x for x, _ in points])
+
+    def test_categories(self):
+        data = QuerySetSource(Chart, x='chart_type__name', y='version').get_data()
+        self.assertEqual(data['xAxis'], {'categories': ['Bar', 'Line', '(none)']})
+        self.assertEqual(data['series'][0]['data'], [2, 3, 6])
+
+    def test_grouped_categories(self):
+        source = QuerySetSource(Chart, x='version', group_by='chart_type__name')
+        self.assertEqual(source.get_data()['series'][0]['name'], '(none)')
+        source = QuerySetSource(
+            Chart, x='slug', group_by='chart_type__name', null_label='Other')
+        data = source.get_data()
+        self.assertEqual(data['xAxis']['categories'], ['a', 'b', 'c', 'd', 'e'])
+        series = dict((s['name'], s['data']) for s in data['series'])
+        self.assertEqual(series, {
+            'Other': [None, None, None, 1, 1],
+            'Bar': [None, None, 1, None, None],
+            'Line': [1, 1, None, None, None],
+        })
+
+
+class CategoryDecimationTests(SimpleTestCase):
+    def test_categories_are_not_decimated(self):
+        config = {
+            'xAxis': {'categories': [str(i) for i in range(100)]},
+            'series': [{'data': list(range(100))}]
+        }
+        self.assertIs(decimate_config(config, 10), config)
+        config['xAxis'] = [{}, {'categories': None}]
+        self.assertIsNot(decimate_config(config, 10), config)
@@ -0,0 +1,164 @@
+import math
+import random
+from unittest import mock, skipUnless
+
+from django.test import SimpleTestCase, override_settings
+
+from chartforge import decimation
+from chartforge.arrays import ColumnarSeries, numpy
+from chartforge.base import Chart
+from chartforge.decimation import (
+    decimate_chart, decimate_config, decimate_series, lttb, prepare_chart)
+
+
+def points(n, seed=0):
+    rng = random.Random(seed)
+    return [[i, rng.uniform(-100, 100)] for i in range(n)]
+
+
+class DecimateSeriesTests(SimpleTestCase):
+    methods = ('lttb', 'minmax', 'average')
+
+    def test_short_series_are_unchanged(self):
+        data = points(10)
+        for method in self.methods:
+            self.assertIs(decimate_series(data, 10, method), data)
+
+    def test_point_lists(self):
+        data = points(1000)
+        for method in self.methods:
+            result = decimate_series(data, 100, method)
+            self.assertLessEqual(len(result), 100, method)
+            self.assertGreater(len(result), 10, method)
+            xs = [p[0] for p in result]
+            self.assertEqual(xs, sorted(xs), method)
+
+    def test_lttb_keeps_end_points(self):
+        data = points(1000)
+        result = decimate_series(data, 50)
+        self.assertEqual(len(result), 50)
+        self.assertEqual(result[0], data[0])
+        self.assertEqual(result[-1], data[-1])
+
+    def test_minmax_keeps_spikes(self):
+        data = [[i, 0] for i in range(1000)]
+        data[500][1] = 1000
+        data[700][1] = -1000
+        result = decimate_series(data, 20, 'minmax')
+        self.assertIn([500, 1000], result)
+        self.assertIn([700, -1000], result)
+
+    def test_y_values(self):
+        result = decimate_series([float(i) for i in range(1000)], 100)
+        self.assertEqual(result[0], [0, 0])
+        self.assertEqual(result[-1], [999, 999])
+
+    def test_categories_are_unchanged(self):
+        data = [['cat %d' % i, i] for i in range(1000)]
+        self.assertIs(decimate_series(data, 100), data)
+        data = ['a'] * 1000
+        self.assertIs(decimate_series(data, 100), data)
+        data = [[i, 'high'] for i in range(1000)]
+        self.assertIs(decimate_series(data, 100), data)
+        data = ColumnarSeries(['cat %d' % i for i in range(1000)], list(range(1000)))
+        self.assertIs(decimate_series(data, 100), data)
+
+    def test_point_dicts_are_unchanged(self):
+        data = [{'x': i, 'y': i} for i in range(1000)]
+        self.assertIs(decimate_series(data, 100), data)
+
+    def test_gaps(self):
+        data = points(1000)
+        for i in range(0, 1000, 7):
+            data[i][1] = None
+        for method in self.methods:
+            result = decimate_series(data, 100, method)
+            self.assertLessEqual(len(result), 100, method)
+            for x, y in result:
+                self.assertFalse(isinstance(y, float) and math.isnan(y), method)
+
+    def test_unknown_method(self):
+        with self.assertRaises(ValueError):
+            decimate_series(points(100), 10, 'nope')
+
+    def test_custom_method(self):
+        result = decimate_series(points(100), 10, lambda x, y, threshold: (x[:2], y[:2]))
+        self.assertEqual(len(result), 2)
+
+
+@skipUnless(numpy, 'NumPy is not installed')
+class NumpyDecimationTests(SimpleTestCase):
+    def python_lttb(self, data, threshold):
+        with mock.patch.object(decimation, 'numpy', None):
+            return decimate_series(data, threshold, 'lttb')
+
+    def test_same_as_python(self):
+        data = points(5000, seed=1)
+        self.assertEqual(decimate_series(data, 200), self.python_lttb(data, 200))
+
+    def test_gaps_are_left_out_of_bucket_averages(self):
+        rng = random.Random(2)
+        data = [[i, 100 + rng.uniform(-10, 10)] for i in range(2000)]
+        # gaps at the start of every bucket used to pull the averages to 0
+        for i in range(0, 2000, 3):
+            data[i][1] = None
+        result = decimate_series(data, 100)
+        self.assertEqual(result, self.python_lttb(data, 100))
+
+    def test_arrays(self):
+        x = numpy.arange(1000, dtype=float)
+        y = numpy.sin(x / 50)
+        result = decimate_series(numpy.column_stack((x, y)), 100)
+        self.assertEqual(result.shape, (100, 2))
+        series = decimate_series(ColumnarSeries(x, y), 100)
+        self.assertEqual(len(series), 100)
+        self.assertEqual(lttb(x, y, 100)[0][-1], 999)
+
+    def test_string_arrays_are_unchanged(self):
+        data = numpy.array([['a', 'b']] * 1000)
+        self.assertIs(decimate_series(data, 100), data)
+
+
+class DecimateConfigTests(SimpleTestCase):
+    def test_only_changed_series_are_copied(self):
+        small = {'name': 'small', 'data': [1, 2, 3]}
+        big = {'name': 'big', 'data': points(1000)}
+        config = {'title': {'text': 'x'}, 'series': [small, big]}
+        result = decimate_config(config, 100)
+        self.assertIs(result['title'], config['title'])
+        self.assertIs(result['series'][0], small)
+        self.assertEqual(len(result['series'][1]['data']), 100)
+        self.assertEqual(len(big['data']), 1000)
+
+    def test_point_start(self):
+        y = [float(i) for i in range(1000)]
+        series = {'data': y, 'pointStart': 1000, 'pointInterval': 10}
+        result, = decimate_config({'series': [series]}, 100)['series']
+        self.assertNotIn('pointStart', result)
+        self.assertNotIn('pointInterval', result)
+        self.assertEqual(result['data'][0], [1000, 0])
+        self.assertEqual(result['data'][-1], [10990, 999])
+        self.assertTrue(all(x == 1000 + y * 10 for x, y in result['data']))
+        # from plotOptions
+        config = {'plotOptions': {'line': {'pointStart': 5}}, 'series': [{'type': 'line', 'data': y}]}
+        self.assertEqual(decimate_config(config, 100)['series'][0]['data'][0], [5, 0])
+        if numpy is not None:
+            result, = decimate_config([dict(series, data=numpy.array(y))], 100)
+            self.assertEqual(result['data'][-1].tolist(), [10990, 999])
+
+    def test_point_interval_unit_is_unchanged(self):
+        series = {'data': list(range(1000)), 'pointStart': 0, 'pointIntervalUnit': 'month'}
+        config = {'series': [series]}
+        self.assertIs(decimate_config(config, 100), config)
+
+    def test_decimate_chart(self):
+        chart = Chart('c', {'series': [{'data': [1, 2]}]})
+        self.assertIs(decimate_chart(chart, 100), chart)
+
+    def test_prepare_chart_uses_settings(self):
+        chart = Chart('c', {'series': [{'data': points(1000)}]})
+        self.assertIs(prepare_chart(chart), chart)
+        with override_settings(CHART_FORGE={'max_points': 50, 'decimation': 'minmax'}):
+            prepared = prepare_chart(chart)
+        self.assertLessEqual(len(prepared.config['series'][0]['data']), 50)
+        self.assertEqual(prepared.slug, 'c')
@@ -0,0 +1,84 @@
+import gzip
+import shutil
+import tempfile
+from unittest import mock, skipUnless
+
+from django.core.files.storage import FileSystemStorage
+from django.test import SimpleTestCase
+
+from chartforge.backends.base import BackendManager
+from chartforge.base import Chart, ExportType
+from chartforge.codec import loads
+from chartforge.export import WRAPPERS, brotli, export_chart, write_exports
+
+
+CHART = Chart('sales-2017', {'title': {'text': 'Sales <b>'}, 'series': [{'name': '</script>', 'data': [1]}]})
+
+
+class ExportChartTests(SimpleTestCase):
+    def test_plain_js(self):
+        bundle = export_chart(CHART)
+        self.assertEqual(bundle.export_type, ExportType.PLAIN_JS)
+        self.assertIn(b'Highcharts.chart("chartforge-sales-2017", config)', bundle.content)
+        # the config can't close the script tag it's embedded in
+        self.assertNotIn(b'</script>', bundle.content)
+        start = bundle.content.index(b'var config = ') + len(b'var config = ')
+        end = bundle.content.index(b';\n', start)
+        config = loads(bundle.content[start:end].replace(b'<\\/', b'</'))
+        self.assertEqual(config, CHART.config)
+
+    def test_iframe(self):
+        bundle = export_chart(CHART, ExportType.IFRAME)
+        self.assertTrue(bundle.content.startswith(b'<!DOCTYPE html>'))
+        self.assertIn(b'<title>Sales &lt;b></title>', bundle.content)
+        self.assertEqual(bundle.content_type, 'text/html; charset=utf-8')
+        self.assertTrue(bundle.filename.endswith('.html'))
+
+    def test_umd(self):
+        bundle = export_chart(CHART, ExportType.UMD_JS)
+        self.assertIn(b'root["chartforge_sales_2017"]', bundle.content)
+
+    def test_hashed_filenames(self):
+        bundle = export_chart(CHART, ExportType.REQUIRE_JS)
+        self.assertEqual(bundle.filename, 'sales-2017.require.%s.js' % bundle.digest[:12])
+        changed = export_chart(Chart('sales-2017', {'title': {'text': 'New'}}), ExportType.REQUIRE_JS)
+        self.assertNotEqual(changed.filename, bundle.filename)
+        self.assertEqual(export_chart(CHART, ExportType.REQUIRE_JS).filename, bundle.filename)
+
+    def test_variants(self):
+        bundle = export_chart(CHART)
+        variants = dict(bundle.variants())
+        self.assertEqual(gzip.decompress(variants[bundle.filename + '.gz']), bundle.content)
+        # gzip output only depends on the content
+        self.assertEqual(export_chart(CHART).gzip, bundle.gzip)
+        if brotli is not None:
+            self.assertEqual(brotli.decompress(variants[bundle.filename + '.br']), bundle.content)
+
+    @skipUnless(brotli, 'brotli is not installed')
+    def test_brotli(self):
+        self.assertEqual(brotli.decompress(export_chart(CHART).brotli), export_chart(CHART).content)
+
+    def test_backend_fallback(self):
+        manager = BackendManager([])
+        content = manager.export_chart(CHART, ExportType.UMD_JS)
+        self.assertEqual(content, export_chart(CHART, ExportType.UMD_JS).content)
+
+
+class WriteExportsTests(SimpleTestCase):
+    def setUp(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location)
+        self.storage = FileSystemStorage(location)
+
+    def test_write_exports(self):
+        paths = write_exports([CHART], storage=self.storage, prefix='exports')
+        self.assertEqual(sorted(t for _, t in paths), sorted(WRAPPERS))
+        path = paths[('sales-2017', ExportType.PLAIN_JS)]
+        with self.storage.open(path) as f:
+            self.assertEqual(f.read(), export_chart(CHART).content)
+        self.assertTrue(self.storage.exists(path + '.gz'))
+
+        # existing files are skipped, their names can't have changed
+        with mock.patch.object(self.storage, 'save') as save:
+            write_exports([CHART], storage=self.storage, prefix='exports')
+        save.assert_not_called()
@@ -0,0 +1,165 @@
+import datetime
+from unittest import mock
+
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from chartforge import dynamic_chart
+from chartforge.codec import dumps, loads
+from chartforge.dynamic import InvalidChartKwargs
+from chartforge.incremental import InvalidCursor, coerce_cursor, make_delta, parse_cursor
+from chartforge.registry import get_chart_class
+from chartforge.settings import ChartForgeSettings
+from chartforge.views import chart_data, chart_delta, chart_events
+
+
+@dynamic_chart()
+def live_chart(chart, region='all'):
+    return {'series': [
+        {'id': region, 'data': [[1, 10], [2, 20], [3, 30]]},
+        {'data': [{'x': 2, 'y': 5}, {'x': 4, 'y': 6}]},
+    ]}
+
+
+@dynamic_chart()
+def time_chart(chart):
+    start = datetime.datetime(2020, 1, 1)
+    return {'series': [
+        {'data': [[start + datetime.timedelta(seconds=s), s] for s in range(5)]},
+    ]}
+
+
+@dynamic_chart()
+class OpenChart:
+    allowed_kwargs = ['year']
+
+    def get_data(self, **kwargs):
+        return kwargs
+
+
+class MakeDeltaTests(SimpleTestCase):
+    def test_parse_cursor(self):
+        self.assertEqual(parse_cursor('5'), 5)
+        self.assertEqual(parse_cursor('2.5'), 2.5)
+        self.assertEqual(parse_cursor('2017-01-01'), '2017-01-01')
+        self.assertIsNone(parse_cursor(''))
+
+    def test_delta(self):
+        data = get_chart_class(__name__, 'live_chart')().get_data()
+        delta = make_delta(data, 2)
+        self.assertEqual(delta['cursor'], 4)
+        self.assertEqual(delta['series'], [
+            {'index': 0, 'id': 'all', 'data': [[3, 30]]},
+            {'index': 1, 'data': [{'x': 4, 'y': 6}]},
+        ])
+        self.assertEqual(make_delta(data, 4), {'cursor': 4, 'series': []})
+        self.assertEqual(make_delta(data)['cursor'], 4)
+
+    def test_plain_values_use_index(self):
+        delta = make_delta({'series': [{'data': [5, 6, 7]}]}, 0)
+        self.assertEqual(delta, {'cursor': 2, 'series': [{'index': 0, 'data': [6, 7]}]})
+
+    def test_coerce_cursor(self):
+        day = datetime.date(2017, 1, 2)
+        moment = datetime.datetime(2017, 1, 2, 3, 4, 5)
+        self.assertEqual(coerce_cursor('2017-01-02', day), day)
+        self.assertEqual(coerce_cursor('2017-01-02T03:04:05', moment), moment)
+        self.assertEqual(coerce_cursor(5, 'a'), '5')
+        self.assertEqual(coerce_cursor(2.5, 3), 2.5)
+        for cursor, value in [('2017-01-02', 3), ('x', day), ('2017-01-02T03:04:05Z', moment)]:
+            with self.assertRaises(InvalidCursor):
+                coerce_cursor(cursor, value)
+
+    def test_date_cursor(self):
+        data = {'series': [{'data': [[datetime.date(2017, 1, d), d] for d in (1, 2, 3)]}]}
+        delta = make_delta(data, '2017-01-02')
+        self.assertEqual(delta['series'][0]['data'], [[datetime.date(2017, 1, 3), 3]])
+
+    def test_date_cursor_round_trip(self):
+        start = datetime.datetime(2020, 1, 1)
+        data = {'series': [{'data': [[start + datetime.timedelta(seconds=s), s] for s in range(5)]}]}
+        delta = make_delta(data, '2020-01-01T00:00:02')
+        cursor = loads(dumps(delta))['cursor']
+        self.assertEqual(cursor, 1577836804000)
+        # the encoded cursor is accepted as it is
+        self.assertEqual(make_delta(data, parse_cursor(str(cursor))), {'cursor': cursor, 'series': []})
+        delta = make_delta(data, parse_cursor(str(cursor - 2000)))
+        self.assertEqual([p[1] for p in delta['series'][0]['data']], [3, 4])
+        days = {'series': [{'data': [[datetime.date(2017, 1, d), d] for d in (1, 2, 3)]}]}
+        cursor = loads(dumps(make_delta(days, '2017-01-02')))['cursor']
+        self.assertEqual(make_delta(days, cursor)['series'], [])
+
+    def test_mismatched_cursor(self):
+        # used to compare as "after" and resend every point
+        with self.assertRaises(InvalidCursor):
+            make_delta({'series': [{'data': [[1, 1]]}]}, 'yesterday')
+
+
+class CleanKwargsTests(SimpleTestCase):
+    def test_signature(self):
+        chart = get_chart_class(__name__, 'live_chart')()
+        self.assertEqual(chart.clean_kwargs({'region': 'eu'}), {'region': 'eu'})
+        with self.assertRaises(InvalidChartKwargs):
+            chart.clean_kwargs({'foo': '1'})
+
+    def test_no_kwargs(self):
+        chart = get_chart_class('tests', 'ExampleChart')()
+        self.assertEqual(chart.clean_kwargs({}), {})
+        with self.assertRaises(InvalidChartKwargs):
+            chart.clean_kwargs({'utm_source': 'mail'})
+
+    def test_allowed_kwargs(self):
+        chart = get_chart_class(__name__, 'OpenChart')()
+        self.assertEqual(chart.clean_kwargs({'year': '2017'}), {'year': '2017'})
+        with self.assertRaises(InvalidChartKwargs):
+            chart.clean_kwargs({'month': '1'})
+
+
+class DeltaViewTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def test_delta(self):
+        request = self.factory.get('/delta', {'since': '2', 'region': 'eu'})
+        response = chart_delta(request, __name__, 'live_chart')
+        self.assertEqual(response.status_code, 200)
+        delta = loads(response.content)
+        self.assertEqual(delta['cursor'], 4)
+        self.assertEqual(delta['series'][0]['id'], 'eu')
+
+    def test_bad_requests(self):
+        for params in [{'foo': '1'}, {'since': 'yesterday'}]:
+            response = chart_delta(self.factory.get('/delta', params), __name__, 'live_chart')
+            self.assertEqual(response.status_code, 400)
+            response = chart_events(self.factory.get('/events', params), __name__, 'live_chart')
+            self.assertEqual(response.status_code, 400)
+        response = chart_data(self.factory.get('/data', {'foo': '1'}), 'tests', 'ExampleChart')
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(CHART_FORGE={'sse_interval': 0, 'sse_max_duration': 0})
+    def test_events(self):
+        request = self.factory.get('/events', HTTP_LAST_EVENT_ID='2')
+        with mock.patch('chartforge.views.time.sleep'):
+            response = chart_events(request, __name__, 'live_chart')
+            body = b''.join(response.streaming_content).decode()
+        self.assertTrue(body.startswith('retry: 0\n\n'))
+        self.assertIn('id: 4\nevent: delta\n', body)
+
+    def test_time_cursor_round_trip(self):
+        response = chart_delta(self.factory.get('/delta', {'since': '2020-01-01T00:00:02'}),
+                               __name__, 'time_chart')
+        cursor = loads(response.content)['cursor']
+        response = chart_delta(self.factory.get('/delta', {'since': cursor}), __name__, 'time_chart')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(loads(response.content), {'cursor': cursor, 'series': []})
+
+    @override_settings(CHART_FORGE={'sse_interval': 0, 'sse_max_duration': 0})
+    def test_event_id_is_the_cursor(self):
+        request = self.factory.get('/events', HTTP_LAST_EVENT_ID='2020-01-01T00:00:02')
+        with mock.patch('chartforge.views.time.sleep'):
+            body = b''.join(chart_events(request, __name__, 'time_chart').streaming_content)
+        self.assertIn('id: 1577836804000\n', body.decode())
+        request = self.factory.get('/events', HTTP_LAST_EVENT_ID='1577836804000')
+        self.assertEqual(chart_events(request, __name__, 'time_chart').status_code, 200)
+
+    def test_default_max_duration(self):
+        self.assertLessEqual(ChartForgeSettings().sse_max_duration, 30)
@@ -0,0 +1,83 @@
+from unittest import mock
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import PermissionDenied
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from chartforge import dynamic_chart
+from chartforge.base import Chart
+from chartforge.instrumentation import chart_type, metrics
+from chartforge.registry import get_chart_class
+from chartforge.views import chart_metrics
+
+
+@dynamic_chart()
+def timed_chart(chart):
+    return {'series': [{'data': [1, 2]}]}
+
+
+@dynamic_chart(name='timed_subchart')
+class TimedSubchart(get_chart_class(__name__, 'timed_chart')):
+    pass
+
+
+ON = {'instrumentation': True}
+
+
+class InstrumentationTests(SimpleTestCase):
+    def setUp(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+    def test_wrappers_follow_settings(self):
+        chart = get_chart_class(__name__, 'timed_chart')()
+        chart.get_data()
+        self.assertEqual(metrics.timings, {})
+        with override_settings(CHART_FORGE=ON):
+            chart.get_data()
+        self.assertIn(('data', __name__ + '.timed_chart'), metrics.timings)
+        chart.get_data()
+        self.assertEqual(metrics.timings[('data', __name__ + '.timed_chart')].count, 1)
+
+    @override_settings(CHART_FORGE=ON)
+    def test_registered_subclass_is_timed_once(self):
+        get_chart_class(__name__, 'timed_subchart')().get_data()
+        self.assertEqual(metrics.timings[('data', __name__ + '.timed_subchart')].count, 1)
+        self.assertNotIn(('data', __name__ + '.timed_chart'), metrics.timings)
+        get_chart_class(__name__, 'timed_chart')().get_data()
+        self.assertEqual(metrics.timings[('data', __name__ + '.timed_chart')].count, 1)
+
+    @override_settings(CHART_FORGE=ON)
+    def test_serialize_is_labelled_by_type(self):
+        for slug in ('sales-1', 'sales-2'):
+            Chart(slug, {'chart': {'type': 'column'}}).serialize()
+        Chart('sales-3', {}).serialize()
+        self.assertEqual(metrics.payloads[('serialize', 'column')][0], 2)
+        self.assertEqual(metrics.payloads[('serialize', 'line')][0], 1)
+        self.assertNotIn('sales', metrics.prometheus_text())
+
+    def test_chart_type(self):
+        self.assertEqual(chart_type({'chart': {'type': 'pie'}}), 'pie')
+        self.assertEqual(chart_type({'chart': {'type': 'x' * 100}}), 'other')
+        self.assertEqual(chart_type({'chart': None}), 'line')
+
+
+class MetricsViewTests(SimpleTestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def get(self, is_staff):
+        request = self.factory.get('/metrics')
+        request.user = mock.Mock(is_staff=is_staff) if is_staff is not None else AnonymousUser()
+        return chart_metrics(request)
+
+    @override_settings(CHART_FORGE=ON)
+    def test_staff_only(self):
+        self.assertEqual(self.get(True).status_code, 200)
+        for is_staff in (False, None):
+            with self.assertRaises(PermissionDenied):
+                self.get(is_staff)
+
+    @override_settings(CHART_FORGE=dict(ON, metrics_public=True))
+    def test_public(self):
+        self.assertEqual(self.get(None).status_code, 200)
@@ -0,0 +1,69 @@
+import json
+import os
+import shutil
+import sys
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, override_settings
+
+from chartforge.manifest import (
+    MANIFEST_VERSION, build_manifest, load_manifest, read_manifest, write_manifest)
+from chartforge.registry import ChartRegistry
+
+
+class ManifestTests(SimpleTestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'manifest.json')
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def test_build(self):
+        manifest = build_manifest()
+        self.assertEqual(manifest['version'], MANIFEST_VERSION)
+        self.assertIn('tests.charts', manifest['modules'])
+        chart = next(c for c in manifest['charts'] if c['key'] == 'tests.charts.ExampleChart')
+        self.assertEqual(chart['module'], 'tests.charts')
+        self.assertEqual(chart['template_name'], 'example_line_chart.json')
+        self.assertTrue(chart['template_path'].endswith('example_line_chart.json'))
+
+    def test_write_and_read(self):
+        written = write_manifest(self.path)
+        self.assertEqual(read_manifest(self.path), written)
+        self.assertFalse(os.path.exists(self.path + '.tmp'))
+
+    def test_unreadable(self):
+        self.assertIsNone(read_manifest(self.path))
+        with open(self.path, 'w') as f:
+            f.write('{not json')
+        self.assertIsNone(read_manifest(self.path))
+        with open(self.path, 'w') as f:
+            json.dump({'version': MANIFEST_VERSION + 1, 'charts': []}, f)
+        self.assertIsNone(read_manifest(self.path))
+
+    def test_load(self):
+        manifest = {'version': MANIFEST_VERSION, 'modules': ['tests.lazy.charts'], 'charts': [{
+            'key': 'tests.lazy.charts.lazy_chart', 'app': 'tests.lazy.charts',
+            'name': 'lazy_chart', 'module': 'tests.lazy.charts'
+        }]}
+        registry = ChartRegistry()
+        sys.modules.pop('tests.lazy.charts', None)
+        self.addCleanup(sys.modules.pop, 'tests.lazy.charts', None)
+        with mock.patch('chartforge.manifest.charts_registry', registry), \
+                mock.patch('chartforge.dynamic.charts_registry', registry):
+            load_manifest(manifest, lazy=True)
+            self.assertNotIn('tests.lazy.charts', sys.modules)
+            self.assertEqual(
+                registry.lookup('tests.lazy', 'lazy_chart').key, 'tests.lazy.charts.lazy_chart')
+
+    def test_command(self):
+        out = StringIO()
+        call_command('chartforge_manifest', output=self.path, stdout=out)
+        self.assertIn('Wrote', out.getvalue())
+        self.assertIsNotNone(read_manifest(self.path))
+
+        with override_settings(CHART_FORGE={}):
+            with self.assertRaises(CommandError):
+                call_command('chartforge_manifest')
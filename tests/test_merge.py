@@ -0,0 +1,78 @@
+from django.test import SimpleTestCase
+
+from chartforge.base import ChartTemplate
+from chartforge.merge import merge, merge_items
+from chartforge.utils import freeze
+
+
+TEMPLATE = {
+    'chart': {'type': 'line', 'height': 300},
+    'title': {'text': 'Template'},
+    'series': [
+        {'id': 'target', 'name': 'Target', 'dashStyle': 'dash'},
+        {'name': 'Actual', 'color': '#000'},
+    ]
+}
+
+
+class MergeTests(SimpleTestCase):
+    def test_dicts(self):
+        result = merge(TEMPLATE, {'chart': {'type': 'column'}, 'subtitle': {'text': 's'}})
+        self.assertEqual(result['chart'], {'type': 'column', 'height': 300})
+        self.assertEqual(result['subtitle'], {'text': 's'})
+        # inputs aren't changed and untouched subtrees are shared
+        self.assertEqual(TEMPLATE['chart']['type'], 'line')
+        self.assertIs(result['title'], TEMPLATE['title'])
+
+    def test_series_by_id_and_position(self):
+        result = merge(TEMPLATE, {'series': [
+            {'id': 'target', 'data': [3, 4]},
+            {'data': [1, 2]},
+        ]})
+        self.assertEqual(result['series'], [
+            {'id': 'target', 'name': 'Target', 'dashStyle': 'dash', 'data': [3, 4]},
+            {'name': 'Actual', 'color': '#000', 'data': [1, 2]},
+        ])
+
+    def test_unmatched_items_are_kept(self):
+        # like Highcharts' update(), template series without data stay
+        result = merge_items([{'id': 'a'}, {'id': 'b'}], [{'id': 'b', 'data': [1]}, {'name': 'new'}])
+        self.assertEqual(result, [{'id': 'b', 'data': [1]}, {'name': 'new'}, {'id': 'a'}])
+        result = merge_items([{'id': 'a'}, {'id': 'b'}], [{'id': 'b'}], one_to_one=True)
+        self.assertEqual(result, [{'id': 'b'}])
+
+    def test_non_dicts_replace(self):
+        self.assertEqual(merge({'a': {'b': 1}}, {'a': [1]}), {'a': [1]})
+        self.assertEqual(merge({'a': 1}, {}), {'a': 1})
+
+
+class ChartTemplateTests(SimpleTestCase):
+    def test_render_to_chart(self):
+        template = ChartTemplate('line', TEMPLATE)
+        chart = template.render_to_chart({'series': [{'id': 'target', 'data': [1]}]}, 'sales')
+        self.assertEqual(chart.slug, 'sales')
+        self.assertEqual([s.get('name') for s in chart.config['series']], ['Target', 'Actual'])
+        self.assertEqual(len(template.merge({'series': []}, one_to_one=True)['series']), 0)
+
+    def test_not_memoized(self):
+        template = ChartTemplate('line', TEMPLATE)
+        first = template.merge({'title': {'text': 'a'}})
+        second = template.merge({'title': {'text': 'a'}})
+        self.assertEqual(first, second)
+        self.assertIsNot(first, second)
+        # True and 1 used to share a memo entry
+        self.assertIs(template.merge({'legend': {'enabled': True}})['legend']['enabled'], True)
+        self.assertEqual(template.merge({'legend': {'enabled': 1}})['legend']['enabled'], 1)
+
+    def test_parse(self):
+        template = ChartTemplate('line', TEMPLATE, 'Line', {'data': [1]})
+        parsed = ChartTemplate.parse(template.serialize())
+        self.assertEqual(parsed.config, TEMPLATE)
+        self.assertEqual(parsed.verbose_name, 'Line')
+        self.assertEqual(parsed.editing_data, {'data': [1]})
+
+    def test_freeze(self):
+        self.assertNotEqual(freeze({'a': True}), freeze({'a': 1}))
+        self.assertNotEqual(freeze([1.0]), freeze([1]))
+        self.assertNotEqual(freeze({'a': 1}), freeze([('a', 1)]))
+        self.assertEqual(freeze({'a': 1, 'b': [2]}), freeze({'b': [2], 'a': 1}))
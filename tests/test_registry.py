@@ -0,0 +1,126 @@
+import sys
+import threading
+import time
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from chartforge import dynamic_chart
+from chartforge.dynamic import DynamicChart
+from chartforge.registry import ChartRegistry, charts_registry, get_chart_class, is_chart_class
+
+
+def make_chart(name):
+    return type(name, (DynamicChart,), {'name': name})
+
+
+class ChartRegistryTests(SimpleTestCase):
+    def setUp(self):
+        self.registry = ChartRegistry()
+
+    def test_lookup(self):
+        chart = make_chart('Sales')
+        self.registry.register('shop', 'Sales', chart)
+        entry = self.registry.lookup('shop', 'Sales')
+        self.assertIs(entry.chart_class, chart)
+        self.assertEqual(entry.key, 'shop.Sales')
+        with self.assertRaises(KeyError):
+            self.registry.lookup('shop', 'Costs')
+
+    def test_charts_module_alias(self):
+        in_module = make_chart('Sales')
+        self.registry.register('shop.charts', 'Sales', in_module)
+        self.assertIs(self.registry.lookup('shop', 'Sales').chart_class, in_module)
+
+        # a chart registered on the app itself takes precedence
+        other = ChartRegistry()
+        on_app = make_chart('Sales')
+        other.register('shop', 'Sales', on_app)
+        other.register('shop.charts', 'Sales', in_module)
+        self.assertIs(other.lookup('shop', 'Sales').chart_class, on_app)
+
+    def test_duplicates(self):
+        self.registry.register('shop', 'Sales', make_chart('Sales'))
+        with self.assertRaises(ValueError):
+            self.registry.register('shop', 'Sales', make_chart('Sales'))
+
+    def test_only_chart_classes(self):
+        with self.assertRaises(AssertionError):
+            self.registry.register('shop', 'Sales', object)
+
+    def test_find_and_app_entries(self):
+        self.registry.register('shop', 'Sales', make_chart('Sales'))
+        self.registry.register('crm', 'Sales', make_chart('Sales'))
+        self.registry.register('crm', 'Leads', make_chart('Leads'))
+        self.assertEqual([e.key for e in self.registry.find('Sales')], ['shop.Sales', 'crm.Sales'])
+        self.assertEqual(
+            [e.key for e in self.registry.get_app_entries('crm')], ['crm.Sales', 'crm.Leads'])
+        self.assertEqual(len(self.registry.get_entries()), 3)
+
+
+class LazyLoadTests(SimpleTestCase):
+    def setUp(self):
+        self.registry = ChartRegistry()
+        sys.modules.pop('tests.lazy.charts', None)
+        patcher = mock.patch('chartforge.dynamic.charts_registry', self.registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(sys.modules.pop, 'tests.lazy.charts', None)
+
+    def test_imported_on_first_lookup(self):
+        self.registry.add_lazy('tests.lazy', 'tests.lazy.charts')
+        self.assertNotIn('tests.lazy.charts', sys.modules)
+        entry = self.registry.lookup('tests.lazy', 'lazy_chart')
+        self.assertEqual(entry.key, 'tests.lazy.charts.lazy_chart')
+        self.assertIn('tests.lazy.charts', sys.modules)
+
+    def test_get_entries_loads_everything(self):
+        self.registry.add_lazy('tests.lazy', 'tests.lazy.charts')
+        self.assertEqual(
+            [e.key for e in self.registry.get_entries()], ['tests.lazy.charts.lazy_chart'])
+
+    def test_optional_modules(self):
+        self.registry.add_lazy('tests.lazy', 'tests.lazy.missing', required=False)
+        self.registry.add_lazy('tests.other', 'tests.other.missing')
+        with self.assertRaises(KeyError):
+            self.registry.lookup('tests.lazy', 'lazy_chart')
+        with self.assertRaises(ImportError):
+            self.registry.lookup('tests.other', 'chart')
+
+
+    def test_concurrent_first_lookups(self):
+        importing = threading.Event()
+
+        def slow_import(path):
+            importing.set()
+            time.sleep(0.1)
+            self.registry.register('tests.slow', 'Sales', make_chart('Sales'))
+
+        self.registry.add_lazy('tests.slow', 'tests.slow.charts')
+        results = []
+        with mock.patch('chartforge.registry.import_module', slow_import):
+            thread = threading.Thread(
+                target=lambda: results.append(self.registry.lookup('tests.slow', 'Sales')))
+            thread.start()
+            importing.wait()
+            # the module is no longer pending but its charts aren't registered yet
+            entry = self.registry.lookup('tests.slow', 'Sales')
+            thread.join()
+        self.assertIs(results[0], entry)
+
+
+class RegistryFunctionTests(SimpleTestCase):
+    def test_installed_charts(self):
+        self.assertTrue(is_chart_class('tests.charts', 'ExampleChart'))
+        self.assertTrue(is_chart_class('tests', 'CustomChartName'))
+        self.assertFalse(is_chart_class('tests', 'Missing'))
+        self.assertEqual(get_chart_class('tests', 'ExampleChart').name, 'ExampleChart')
+
+    def test_dynamic_chart_registers(self):
+        registry = ChartRegistry()
+        with mock.patch('chartforge.dynamic.charts_registry', registry):
+            @dynamic_chart(name='Renamed')
+            def some_chart(chart):
+                return {}
+        self.assertEqual(registry.lookup(__name__, 'Renamed').chart_class().get_data(), {})
+        self.assertNotIn('%s.Renamed' % __name__, charts_registry.charts)
@@ -0,0 +1,133 @@
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+from unittest import mock, skipUnless
+
+from django.test import SimpleTestCase
+
+from chartforge.base import RenderType
+from chartforge.render import Image, RenderPool, RenderQueueFull, layout, render_config
+
+
+LINE_CONFIG = {
+    'title': {'text': 'Sales <2017>'},
+    'xAxis': {'categories': ['Jan', 'Feb', 'Mar']},
+    'series': [
+        {'name': 'A', 'data': [1, 3, 2]},
+        {'name': 'B', 'type': 'column', 'data': [2, None, 4]},
+    ]
+}
+
+PIE_CONFIG = {
+    'series': [{'type': 'pie', 'data': [['a', 1], ['b', 3], {'name': 'c', 'y': 0}]}]
+}
+
+
+class LayoutTests(SimpleTestCase):
+    def test_cartesian(self):
+        prims = layout(LINE_CONFIG, 400, 300)
+        kinds = [p[0] for p in prims]
+        self.assertEqual(kinds[0], 'rect')
+        texts = [p[3] for p in prims if p[0] == 'text']
+        self.assertIn('Sales <2017>', texts)
+        self.assertIn('Feb', texts)
+        # the column series skips its null point
+        columns = [p for p in prims if p[0] == 'rect' and p[5] == '#434348' and p[3] != 12]
+        self.assertEqual(len(columns), 2)
+
+    def test_pie(self):
+        wedges = [p for p in layout(PIE_CONFIG, 400, 300) if p[0] == 'wedge']
+        self.assertEqual(len(wedges), 2)
+        self.assertAlmostEqual(wedges[1][5] - wedges[1][4], 270)
+
+    def test_svg(self):
+        svg = render_config(LINE_CONFIG, RenderType.SVG, 400, 300)
+        self.assertTrue(svg.startswith(b'<svg'))
+        self.assertIn(b'width="400"', svg)
+        self.assertIn(b'Sales &lt;2017&gt;', svg)
+
+    def test_empty_chart(self):
+        self.assertTrue(render_config({}, RenderType.SVG).startswith(b'<svg'))
+
+    def test_non_finite_values_are_gaps(self):
+        nan, inf = float('nan'), float('inf')
+        # used to raise ValueError and OverflowError
+        layout({'series': [{'data': [nan, nan, nan]}]}, 400, 300)
+        layout({'series': [{'data': [1, inf, -inf]}], 'yAxis': {'max': nan}}, 400, 300)
+        layout({'series': [{'type': 'pie', 'data': [1, nan, inf]}]}, 400, 300)
+        svg = render_config({'series': [{'data': [[nan, 1], [1, 2], [2, inf]]}]}, RenderType.SVG)
+        self.assertTrue(svg.startswith(b'<svg'))
+        self.assertNotIn(b'nan', svg.lower())
+
+    @skipUnless(Image, 'Pillow is not installed')
+    def test_png(self):
+        png = render_config(LINE_CONFIG, RenderType.PNG, 200, 100)
+        self.assertTrue(png.startswith(b'\x89PNG'))
+
+
+class RenderPoolTests(SimpleTestCase):
+    def test_process_pool(self):
+        pool = RenderPool(workers=1, batch_size=2)
+        try:
+            self.assertTrue(pool.render(LINE_CONFIG, RenderType.SVG).startswith(b'<svg'))
+            results = pool.render_many([
+                (LINE_CONFIG, RenderType.SVG),
+                ({'series': 'bad'}, RenderType.SVG, 'wide'),
+                (PIE_CONFIG, RenderType.SVG),
+            ])
+        finally:
+            pool.shutdown()
+        self.assertEqual(len(results), 3)
+        self.assertTrue(results[0].startswith(b'<svg'))
+        self.assertIsInstance(results[1], Exception)
+        self.assertTrue(results[2].startswith(b'<svg'))
+
+    def test_default_workers(self):
+        with mock.patch('chartforge.render.os.cpu_count', return_value=3), \
+                mock.patch('chartforge.render.ProcessPoolExecutor') as executor:
+            pool = RenderPool()
+        self.assertEqual(pool.workers, 3)
+        executor.assert_called_once_with(3)
+
+    def test_in_process(self):
+        with self.assertLogs('chartforge', 'WARNING'):
+            pool = RenderPool(workers=0)
+        self.assertIsNone(pool.executor)
+        self.assertTrue(pool.render(LINE_CONFIG, RenderType.SVG).startswith(b'<svg'))
+
+    def test_in_process_is_bounded(self):
+        with self.assertLogs('chartforge', 'WARNING'):
+            pool = RenderPool(workers=0, queue_size=1, timeout=0.05)
+        started, release = threading.Event(), threading.Event()
+
+        def slow():
+            started.set()
+            release.wait(5)
+
+        thread = threading.Thread(target=pool._submit, args=(slow,))
+        thread.start()
+        started.wait(5)
+        try:
+            with self.assertRaises(RenderQueueFull):
+                pool.render(LINE_CONFIG, RenderType.SVG)
+        finally:
+            release.set()
+            thread.join()
+
+    def test_render_many_deadline_per_batch(self):
+        with self.assertLogs('chartforge', 'WARNING'):
+            pool = RenderPool(workers=0, timeout=0.05, batch_size=2)
+        done = Future()
+        done.set_result([b'a', b'b'])
+        futures = [Future(), done, Future()]
+        start = time.time()
+        with mock.patch.object(pool, '_submit', side_effect=futures):
+            results = pool.render_many([({},)] * 5)
+        # three batches of 2, 2 and 1 jobs, the slow ones time out on their
+        # own deadlines instead of timeout * batch_size each
+        self.assertLess(time.time() - start, 0.5)
+        self.assertEqual(len(results), 5)
+        self.assertIsInstance(results[0], TimeoutError)
+        self.assertIsInstance(results[1], TimeoutError)
+        self.assertEqual(results[2:4], [b'a', b'b'])
+        self.assertIsInstance(results[4], TimeoutError)
@@ -0,0 +1,141 @@
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from unittest import mock
+
+from django.core.cache import caches
+from django.http import Http404
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.utils.http import http_date
+
+from chartforge.base import Chart, RenderType
+from chartforge.cache import RenderCache, config_digest
+from chartforge.models import Chart as ChartModel
+from chartforge.render import RenderQueueFull
+from chartforge.views import chart_image
+
+
+class RenderCacheTests(SimpleTestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.location)
+
+    def test_key_ignores_order(self):
+        cache = RenderCache()
+        a = Chart('a', {'title': {'text': 'x'}, 'series': [1]})
+        b = Chart('b', {'series': [1], 'title': {'text': 'x'}})
+        self.assertEqual(cache.key(a, RenderType.PNG), cache.key(b, RenderType.PNG))
+        self.assertNotEqual(cache.key(a, RenderType.PNG), cache.key(a, RenderType.SVG))
+        self.assertNotEqual(config_digest({'a': 1}), config_digest({'a': 2}))
+
+    def test_django_cache(self):
+        cache = RenderCache()
+        render = mock.Mock(return_value=b'image')
+        data, last_modified = cache.get_or_render('key', render)
+        self.assertEqual(data, b'image')
+        self.assertEqual(cache.get_or_render('key', render), (b'image', last_modified))
+        self.assertEqual(render.call_count, 1)
+
+    def test_directory(self):
+        cache = RenderCache(self.location)
+        cache.set('abcdef', b'image')
+        self.assertTrue(os.path.exists(os.path.join(self.location, 'ab', 'abcdef')))
+        self.assertEqual(cache.get('abcdef')[0], b'image')
+        self.assertIsNone(cache.get('missing'))
+
+    def test_temp_files_are_unique(self):
+        cache = RenderCache(self.location)
+        replace = mock.Mock(side_effect=os.replace)
+        # another process can have the same thread id
+        with mock.patch('chartforge.cache.os.replace', replace), \
+                mock.patch('threading.get_ident', return_value=1):
+            cache.set('abc', b'one')
+            cache.set('abc', b'two')
+        (first, _), _ = replace.call_args_list[0]
+        (second, _), _ = replace.call_args_list[1]
+        self.assertNotEqual(first, second)
+        self.assertEqual(cache.get('abc')[0], b'two')
+
+        with mock.patch('chartforge.cache.os.replace', side_effect=OSError), \
+                self.assertRaises(OSError):
+            cache.set('abc', b'three')
+        self.assertEqual(os.listdir(os.path.join(self.location, 'ab')), ['abc'])
+
+    def test_evicts_least_recently_used(self):
+        cache = RenderCache(self.location, max_size=25)
+        cache.set('aa1', b'x' * 10)
+        cache.set('bb2', b'x' * 10)
+        old = time.time() - 100
+        os.utime(cache._path('aa1'), (old, old))
+        cache.set('cc3', b'x' * 10)
+        self.assertIsNone(cache.get('aa1'))
+        self.assertIsNotNone(cache.get('bb2'))
+        self.assertIsNotNone(cache.get('cc3'))
+
+
+class ChartImageViewTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.factory = RequestFactory()
+        self.manager = mock.Mock()
+        self.manager.get_chart.return_value = Chart('sales', {'series': [{'data': [1, 2]}]})
+        self.manager.render_chart.return_value = b'<svg/>'
+        patcher = mock.patch('chartforge.views.get_backend_manager', return_value=self.manager)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get(self, fmt='svg', **headers):
+        return chart_image(self.factory.get('/sales.%s' % fmt, **headers), 'sales', fmt)
+
+    def test_render_and_etag(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'<svg/>')
+        self.assertEqual(response['Content-Type'], RenderType.SVG)
+        etag = response['ETag']
+
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.manager.render_chart.call_count, 1)
+
+    def test_if_modified_since(self):
+        self.get()
+        response = self.get(HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 60))
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.manager.render_chart.call_count, 1)
+
+    def test_size_changes_key(self):
+        etag = self.get()['ETag']
+        request = self.factory.get('/sales.svg', {'width': 300})
+        response = chart_image(request, 'sales', 'svg')
+        self.assertNotEqual(response['ETag'], etag)
+        chart = self.manager.render_chart.call_args[0][0]
+        self.assertEqual(chart.config['chart'], {'width': 300})
+
+    def test_not_found(self):
+        self.manager.get_chart.return_value = None
+        with self.assertRaises(Http404):
+            self.get()
+        with self.assertRaises(Http404):
+            self.get('gif')
+
+    def test_unpublished(self):
+        ChartModel.objects.create(name='Sales', slug='sales')
+        with self.assertRaises(Http404):
+            self.get()
+        self.manager.get_chart.assert_not_called()
+        request = self.factory.get('/sales.svg')
+        request.user = mock.Mock(is_staff=True)
+        response = chart_image(request, 'sales', 'svg')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'private, no-store')
+
+    def test_busy(self):
+        for error in (RenderQueueFull('full'), FutureTimeoutError()):
+            self.manager.render_chart.side_effect = error
+            response = self.get('png')
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response['Retry-After'], '5')
@@ -0,0 +1,125 @@
+import threading
+import time
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import SimpleTestCase
+
+from chartforge import dynamic_chart
+from chartforge.cache import ResultCache
+from chartforge.registry import get_chart_class
+
+
+calls = []
+
+
+@dynamic_chart(cache_timeout=60)
+def cached_chart(chart, region='all'):
+    calls.append(region)
+    return {'series': [{'name': region, 'data': [1, 2, 3]}]}
+
+
+class ResultCacheTests(SimpleTestCase):
+    def setUp(self):
+        caches['default'].clear()
+        del calls[:]
+
+    def make_cache(self, prefix='tests.chart', **kwargs):
+        return ResultCache(prefix, 60, **kwargs)
+
+    def test_get_or_compute(self):
+        cache = self.make_cache()
+        compute = mock.Mock(return_value={'data': [1]})
+        self.assertEqual(cache.get_or_compute({'a': 1}, compute), {'data': [1]})
+        self.assertEqual(cache.get_or_compute({'a': 1}, compute), {'data': [1]})
+        self.assertEqual(cache.get_or_compute({'a': 2}, compute), {'data': [1]})
+        self.assertEqual(compute.call_count, 2)
+
+    def test_results_are_copies(self):
+        cache = self.make_cache()
+        result = cache.get_or_compute({}, lambda: {'data': [1]})
+        result['data'].append(2)
+        self.assertEqual(cache.get({}), {'data': [1]})
+
+    def test_shared_between_processes(self):
+        self.make_cache().set({'a': 1}, 'value')
+        # a new instance has an empty local cache, like another process
+        self.assertEqual(self.make_cache().get({'a': 1}), 'value')
+
+    def test_key_func(self):
+        cache = self.make_cache(key_func='{region}')
+        cache.set({'region': 'eu', 'ignored': 1}, 'eu data')
+        self.assertEqual(cache.get({'region': 'eu', 'ignored': 2}), 'eu data')
+        self.assertIsNone(cache.get({'region': 'us'}))
+
+    def test_invalidate(self):
+        cache = self.make_cache()
+        cache.set({'a': 1}, 'one')
+        cache.set({'a': 2}, 'two')
+        cache.invalidate({'a': 1})
+        self.assertIsNone(cache.get({'a': 1}))
+        self.assertEqual(cache.get({'a': 2}), 'two')
+
+    def test_invalidate_all(self):
+        cache = self.make_cache()
+        other = self.make_cache()
+        cache.set({'a': 1}, 'one')
+        self.assertEqual(other.get({'a': 1}), 'one')
+        cache.invalidate_all()
+        self.assertIsNone(cache.get({'a': 1}))
+        # other processes see the new generation once their copy expires
+        other.local.clear()
+        other._generation_expires = 0
+        self.assertIsNone(other.get({'a': 1}))
+
+    def test_hit_is_one_round_trip(self):
+        cache = self.make_cache()
+        cache.set({'a': 1}, 'one')
+        cache.local.clear()
+        with mock.patch.object(cache.backend, 'get', wraps=cache.backend.get) as get:
+            self.assertEqual(cache.get({'a': 1}), 'one')
+        self.assertEqual(get.call_count, 1)
+
+    def test_computes_once_per_key(self):
+        cache = self.make_cache()
+        computed = []
+
+        def compute():
+            computed.append(1)
+            time.sleep(0.05)
+            return 'value'
+
+        threads = [
+            threading.Thread(target=cache.get_or_compute, args=({}, compute)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(computed), 1)
+
+    def test_waits_for_other_process(self):
+        cache = self.make_cache()
+        key = cache._key(cache._digest({}))
+        cache.backend.add('%s:lock' % key, 1, 60)
+        threading.Timer(0.1, lambda: caches['default'].set(key, 'theirs', 60)).start()
+        compute = mock.Mock(return_value='ours')
+        self.assertEqual(cache.get_or_compute({}, compute), 'theirs')
+        compute.assert_not_called()
+
+
+class CachedChartTests(SimpleTestCase):
+    def setUp(self):
+        caches['default'].clear()
+        del calls[:]
+
+    def test_get_data_is_cached(self):
+        chart_class = get_chart_class(__name__, 'cached_chart')
+        chart_class.invalidate_all_data()
+        chart = chart_class()
+        self.assertEqual(chart.get_data(region='eu'), chart.get_data(region='eu'))
+        chart.get_data(region='us')
+        self.assertEqual(calls, ['eu', 'us'])
+
+        chart_class.invalidate_data(region='eu')
+        chart.get_data(region='eu')
+        self.assertEqual(calls, ['eu', 'us', 'eu'])
@@ -0,0 +1,78 @@
+import time
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+
+from chartforge import dynamic_chart
+from chartforge.instrumentation import metrics
+from chartforge.registry import get_chart_class
+from chartforge.scheduler import (
+    Scheduler, _init_worker, compute_snapshot, get_snapshot, store_snapshot)
+
+
+calls = []
+
+
+@dynamic_chart(refresh=60)
+def refreshed_chart(chart, region='all'):
+    calls.append(region)
+    return {'series': [{'data': [len(calls)]}]}
+
+
+@dynamic_chart(refresh=60, refresh_kwargs=[{'region': 'eu'}, {'region': 'us'}], cache_timeout=60)
+def cached_refreshed_chart(chart, region='all'):
+    calls.append(region)
+    return {'series': [{'data': [len(calls)]}]}
+
+
+class SchedulerTests(SimpleTestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+        del calls[:]
+        self.chart_class = get_chart_class(__name__, 'refreshed_chart')
+
+    def test_serves_snapshot(self):
+        store_snapshot(self.chart_class, {}, {'series': []})
+        self.assertEqual(self.chart_class().get_data(), {'series': []})
+        self.assertEqual(calls, [])
+        with mock.patch('chartforge.scheduler.time.time', return_value=time.time() + 121):
+            self.chart_class().get_data()
+        self.assertEqual(calls, ['all'])
+
+    def test_compute_skips_own_snapshot(self):
+        store_snapshot(self.chart_class, {}, {'series': []})
+        data = compute_snapshot(self.chart_class, {})
+        self.assertEqual(data, {'series': [{'data': [1]}]})
+        self.assertEqual(get_snapshot(self.chart_class, {}), data)
+
+    @override_settings(CHART_FORGE={'instrumentation': True})
+    def test_compute_goes_through_wrappers(self):
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+        chart_class = get_chart_class(__name__, 'cached_refreshed_chart')
+        chart_class.invalidate_all_data()
+        compute_snapshot(chart_class, {'region': 'eu'})
+        compute_snapshot(chart_class, {'region': 'eu'})
+        # the second one is a cache hit
+        self.assertEqual(calls, ['eu'])
+        self.assertEqual(metrics.hit_ratio('%s.cached_refreshed_chart' % __name__), 0.5)
+        self.assertIn(('data', '%s.cached_refreshed_chart' % __name__), metrics.timings)
+
+    def test_worker_closes_inherited_connections(self):
+        with mock.patch('django.db.connections.close_all') as close_all:
+            _init_worker()
+        close_all.assert_called_once_with()
+
+    def test_jobs(self):
+        scheduler = Scheduler(charts=['%s.cached_refreshed_chart' % __name__])
+        jobs = scheduler.get_jobs()
+        self.assertEqual([j.kwargs for j in jobs], [{'region': 'eu'}, {'region': 'us'}])
+        now = time.time()
+        self.assertLessEqual(jobs[0].due_in(now), 0)
+        store_snapshot(jobs[0].chart_class, jobs[0].kwargs, {})
+        self.assertGreater(jobs[0].due_in(now), 50)
+        self.assertTrue(jobs[0].acquire())
+        self.assertFalse(jobs[0].acquire())
+        jobs[0].release()
@@ -0,0 +1,61 @@
+import json
+
+from django.test import SimpleTestCase, TestCase
+
+from chartforge.base import Chart, iterencode
+from chartforge.models import Chart as ChartModel
+
+
+class IterencodeTests(SimpleTestCase):
+    def test_same_as_serialize(self):
+        config = {
+            'title': {'text': 'Sales "2017"'},
+            'series': [
+                {'name': 'a', 'data': [[1, 2.5], [2, None], [3, True]]},
+                {'name': 'b', 'data': [1, 2, 3], 'marker': {'enabled': False}}
+            ],
+            'empty': [],
+            'unicode': 'café'
+        }
+        chart = Chart('sales', config)
+        streamed = ''.join(chart.iter_serialize())
+        self.assertEqual(json.loads(streamed), json.loads(chart.serialize()))
+        self.assertEqual(json.loads(streamed), {'slug': 'sales', 'config': config})
+
+    def test_generators_are_consumed_lazily(self):
+        consumed = []
+
+        def points():
+            for i in range(10000):
+                consumed.append(i)
+                yield [i, i * 2]
+
+        chunks = iterencode({'series': [{'data': points()}]}, chunk_size=1024, batch_size=100)
+        first = next(chunks)
+        self.assertLess(len(consumed), 10000)
+        data = json.loads(first + ''.join(chunks))
+        self.assertEqual(len(data['series'][0]['data']), 10000)
+        self.assertEqual(data['series'][0]['data'][-1], [9999, 19998])
+
+    def test_chunk_size(self):
+        chunks = list(iterencode({'data': list(range(20000))}, chunk_size=4096))
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks[:-1]:
+            self.assertGreaterEqual(len(chunk), 4096)
+        self.assertEqual(json.loads(''.join(chunks)), {'data': list(range(20000))})
+
+    def test_mixed_items(self):
+        data = [1, {'y': 2, 'name': 'x'}, [3, 4], (5, 6), 'seven']
+        self.assertEqual(
+            json.loads(''.join(iterencode(data, batch_size=2))),
+            [1, {'y': 2, 'name': 'x'}, [3, 4], [5, 6], 'seven'])
+
+
+class QuerySetEncodeTests(TestCase):
+    def test_querysets_use_iterator(self):
+        for i in range(5):
+            ChartModel.objects.create(name='Chart %d' % i, slug='chart-%d' % i)
+        queryset = ChartModel.objects.order_by('slug').values_list('slug', flat=True)
+        encoded = ''.join(iterencode({'slugs': queryset}))
+        self.assertEqual(json.loads(encoded), {'slugs': ['chart-%d' % i for i in range(5)]})
+        self.assertIsNone(queryset._result_cache)
@@ -0,0 +1,116 @@
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from chartforge.backends.static_chart import StaticChartBackend
+
+
+class StaticChartBackendTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.templates = os.path.join(self.root, 'templates')
+        os.makedirs(os.path.join(self.templates, 'sales'))
+        self.write('line.json', {'title': {'text': 'Line'}})
+        self.write('sales/bar.json', {'chart': {'type': 'bar'}})
+        with open(os.path.join(self.templates, 'bundle.jsonl'), 'w') as f:
+            f.write(json.dumps({'name': 'pie', 'config': {'a': 1}, 'verbose_name': 'Pie'}) + '\n')
+            f.write('\n')
+            f.write(json.dumps({'name': 'area', 'config': {'b': 2}, 'editing_data': [1]}) + '\n')
+
+    def write(self, name, config, mtime=None):
+        path = os.path.join(self.templates, name)
+        with open(path, 'w') as f:
+            json.dump(config, f)
+        if mtime is not None:
+            os.utime(path, (mtime, mtime))
+        return path
+
+    def make_backend(self, **settings):
+        config = dict({
+            'chart_templates': [self.templates],
+            'static_index': os.path.join(self.root, 'index.json'),
+            'static_poll_interval': -1,
+            'static_file_poll_interval': -1
+        }, **settings)
+        with override_settings(CHART_FORGE=config):
+            return StaticChartBackend()
+
+    def test_templates(self):
+        backend = self.make_backend()
+        names = [t.name for t in backend.get_chart_templates()]
+        self.assertEqual(names, ['area', 'line', 'pie', 'sales/bar'])
+        line = backend.get_chart_template('line')
+        self.assertEqual(line.verbose_name, 'Line')
+        pie = backend.get_chart_template('pie')
+        self.assertEqual((pie.config, pie.verbose_name), ({'a': 1}, 'Pie'))
+        self.assertEqual(backend.get_chart_template('area').editing_data, [1])
+        self.assertIsNone(backend.get_chart_template('missing'))
+
+    def test_bad_files_are_skipped(self):
+        with open(os.path.join(self.templates, 'django.json'), 'w') as f:
+            f.write('{% load static %}{"title": "{{ title }}"}')
+        with open(os.path.join(self.templates, 'broken.jsonl'), 'w') as f:
+            f.write('{"name": \n')
+        backend = self.make_backend()
+        with self.assertLogs('chartforge', 'WARNING') as logs:
+            names = [t.name for t in backend.get_chart_templates()]
+        self.assertEqual(names, ['area', 'line', 'pie', 'sales/bar'])
+        self.assertEqual(len(logs.output), 2)
+        self.assertIsNone(backend.get_chart_template('django'))
+        self.assertEqual(backend.get_chart_template('line').verbose_name, 'Line')
+
+    def test_repo_templates(self):
+        # tests/templates holds Django templates next to plain JSON ones
+        backend = StaticChartBackend()
+        with self.assertLogs('chartforge', 'WARNING'):
+            names = [t.name for t in backend.get_chart_templates()]
+        self.assertIn('example_line_chart', names)
+
+    def test_index_is_reused(self):
+        self.make_backend().get_chart_templates()
+        backend = self.make_backend()
+        with mock.patch.object(backend, '_scan_dir') as scan:
+            self.assertEqual(backend.get_chart_template('pie').config, {'a': 1})
+        scan.assert_not_called()
+
+    def test_added_and_removed_files(self):
+        backend = self.make_backend()
+        backend.get_chart_templates()
+        self.write('sales/new.json', {'n': 1})
+        os.remove(os.path.join(self.templates, 'line.json'))
+        names = [t.name for t in backend.get_chart_templates()]
+        self.assertEqual(names, ['area', 'pie', 'sales/bar', 'sales/new'])
+
+    def test_edited_in_place(self):
+        backend = self.make_backend(static_file_poll_interval=None)
+        self.assertEqual(backend.get_chart_template('line').config, {'title': {'text': 'Line'}})
+        dir_mtime = os.stat(self.templates).st_mtime
+        self.write('line.json', {'edited': True}, mtime=1)
+        os.utime(self.templates, (dir_mtime, dir_mtime))
+        # only directory mtimes are checked until the file poll is due
+        self.assertEqual(backend.get_chart_template('line').config, {'title': {'text': 'Line'}})
+        backend.file_poll_interval = -1
+        self.assertEqual(backend.get_chart_template('line').config, {'edited': True})
+
+    def test_poll_stats_directories_only(self):
+        backend = self.make_backend(static_file_poll_interval=3600)
+        backend.get_chart_templates()
+        with mock.patch.object(backend, '_mtime', wraps=backend._mtime) as stat:
+            backend.get_chart_templates()
+        checked = sorted(call[0][0] for call in stat.call_args_list)
+        self.assertEqual(checked, [self.templates, os.path.join(self.templates, 'sales')])
+
+    def test_reads_without_keeping_files_open(self):
+        backend = self.make_backend(static_poll_interval=3600)
+        backend.get_chart_template('line')
+        with mock.patch('builtins.open', wraps=open) as opened:
+            backend.get_chart_template('area')
+            backend.get_chart_template('area')
+        # read once, then served from the parsed template
+        reads = [c for c in opened.call_args_list if c[0][0].endswith('bundle.jsonl')]
+        self.assertEqual(len(reads), 1)
@@ -0,0 +1,81 @@
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase
+
+from chartforge import storage
+from chartforge.backends.chart_model import ChartModelBackend
+from chartforge.base import Chart
+from chartforge.codec import dumps
+from chartforge.models import Chart as ChartModel, ChartTemplate
+from chartforge.storage import decode_config, default_codec, encode_config
+
+
+CONFIG = {'title': {'text': 'Sales'}, 'series': [{'data': [1, 2.5, None]}]}
+
+
+class EncodeConfigTests(SimpleTestCase):
+    def test_zlib(self):
+        data = encode_config(CONFIG, 'zlib')
+        self.assertEqual(data[:4], b'CF\x01\x01')
+        self.assertEqual(decode_config(data), CONFIG)
+
+    @skipUnless(storage.zstandard, 'zstandard is not installed')
+    def test_zstd(self):
+        self.assertEqual(decode_config(encode_config(CONFIG, 'zstd')), CONFIG)
+
+    @skipUnless(storage.msgpack, 'msgpack is not installed')
+    def test_msgpack(self):
+        self.assertEqual(decode_config(encode_config(CONFIG, 'msgpack')), CONFIG)
+
+    def test_bad_header(self):
+        with self.assertRaises(ValueError):
+            decode_config(b'{"a": 1}')
+        with self.assertRaises(ValueError):
+            decode_config(b'CF\x09\x01')
+        with self.assertRaises(ValueError):
+            decode_config(b'CF\x01\x09')
+
+    def test_default_codec_is_cached(self):
+        with mock.patch('chartforge.storage._default_codec', storage._UNSET), \
+                mock.patch('chartforge.storage.ChartForgeSettings') as settings:
+            settings.return_value.config_storage = 'zlib'
+            self.assertEqual(default_codec(), 'zlib')
+            self.assertEqual(default_codec(), 'zlib')
+        self.assertEqual(settings.call_count, 1)
+
+
+class ConfigStorageTests(TestCase):
+    def test_blob_storage(self):
+        backend = ChartModelBackend()
+        with mock.patch('chartforge.storage._default_codec', 'zlib'):
+            backend.save_chart(Chart('sales', CONFIG))
+        obj = ChartModel.objects.get(slug='sales')
+        self.assertEqual(obj.config, '')
+        self.assertEqual(obj.config_blob, CONFIG)
+        self.assertEqual(backend.get_chart('sales').config, CONFIG)
+
+    def test_convert_configs(self):
+        ChartModel.objects.create(name='Sales', slug='sales', config=dumps(CONFIG))
+        ChartTemplate.objects.create(
+            name='Line', chart_class='tests.ExampleChart',
+            chart_config=dumps(CONFIG), example_data=dumps({'data': [1]}))
+        backend = ChartModelBackend()
+
+        call_command('chartforge_convert_configs', codec='zlib', stdout=StringIO())
+        template = ChartTemplate.objects.get()
+        self.assertEqual((template.chart_config, template.example_data), ('', ''))
+        self.assertEqual(backend.get_chart('sales').config, CONFIG)
+        # templates are read from the encoded fields
+        template = backend.get_chart_template('Line')
+        self.assertEqual(template.config, CONFIG)
+        self.assertEqual(template.editing_data, {'data': [1]})
+        self.assertEqual([t.name for t in backend.get_chart_templates()], ['Line'])
+
+        call_command('chartforge_convert_configs', to_json=True, stdout=StringIO())
+        obj = ChartModel.objects.get()
+        self.assertIsNone(obj.config_blob)
+        self.assertEqual(backend.get_chart('sales').config, CONFIG)
+        self.assertEqual(backend.get_chart_template('Line').config, CONFIG)
+        self.assertIsNone(backend.get_chart_template('missing'))
@@ -0,0 +1,110 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from django.template.loader import render_to_string
+from django.test import SimpleTestCase, override_settings
+
+from chartforge.cache import TemplateCache
+
+
+CONTEXT = {
+    'title': 'Sales',
+    'year': 2017,
+    'categories': ['Jan', 'Feb'],
+    'min': 0,
+    'extra_line': '{"value": 5, "width": 2}',
+    'legend': True
+}
+
+
+class TemplateCacheTests(SimpleTestCase):
+    def render(self, cache, context):
+        return cache.render(context, json.loads)
+
+    def expected(self, template_name, context):
+        return json.loads(render_to_string(template_name, context))
+
+    def test_static_template(self):
+        cache = TemplateCache('example_line_chart.json')
+        first = self.render(cache, {})
+        self.assertEqual(first, self.expected('example_line_chart.json', {}))
+        tree, nodes = cache._compiled
+        self.assertEqual(nodes, [])
+
+        first['title']['text'] = 'Changed'
+        self.assertEqual(self.render(cache, {})['title']['text'], 'Monthly Average Temperature')
+
+    def test_only_context_nodes_are_rendered(self):
+        cache = TemplateCache('dynamic_line_chart.json')
+        self.assertEqual(
+            self.render(cache, CONTEXT), self.expected('dynamic_line_chart.json', CONTEXT))
+        tree, nodes = cache._compiled
+        # title, year, the for loop, min, extra_line and the if tag
+        self.assertEqual(len(nodes), 6)
+
+    def test_every_context_is_rendered(self):
+        cache = TemplateCache('dynamic_line_chart.json')
+        contexts = [
+            CONTEXT,
+            dict(CONTEXT, title='Costs', categories=[], legend=False),
+            dict(CONTEXT, title='Say "hi"\\n', min=-5.5),
+            dict(CONTEXT, title=True),
+            dict(CONTEXT, title=1),
+        ]
+        for context in contexts:
+            self.assertEqual(
+                self.render(cache, context), self.expected('dynamic_line_chart.json', context))
+
+    def test_results_are_copies(self):
+        cache = TemplateCache('dynamic_line_chart.json')
+        result = self.render(cache, CONTEXT)
+        result['yAxis']['plotLines'].append('junk')
+        result['xAxis']['categories'].clear()
+        self.assertEqual(
+            self.render(cache, CONTEXT), self.expected('dynamic_line_chart.json', CONTEXT))
+
+    def test_nodes_outside_json_values(self):
+        cache = TemplateCache('split_chart.json')
+        for context in ({'subtitle': 'Q1'}, {'subtitle': ''}):
+            self.assertEqual(
+                self.render(cache, context), self.expected('split_chart.json', context))
+        self.assertIsNone(cache._compiled)
+
+    def test_output_that_does_not_fit(self):
+        cache = TemplateCache('dynamic_line_chart.json')
+        context = dict(CONTEXT, extra_line='{"value": 5}, {"value": 6}')
+        self.assertEqual(
+            self.render(cache, context), self.expected('dynamic_line_chart.json', context))
+        context = dict(CONTEXT, title='a", "b": "c')
+        self.assertEqual(
+            self.render(cache, context), self.expected('dynamic_line_chart.json', context))
+
+
+class TemplateReloadTests(SimpleTestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'reload.json')
+        self.write('{"title": {"text": "one"}}')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write(self, text, mtime=None):
+        with open(self.path, 'w') as f:
+            f.write(text)
+        if mtime is not None:
+            os.utime(self.path, (mtime, mtime))
+
+    def test_reloads_changed_file(self):
+        templates = [{
+            'BACKEND': 'django.template.backends.django.DjangoTemplates',
+            'DIRS': [self.dir]
+        }]
+        with override_settings(TEMPLATES=templates):
+            cache = TemplateCache('reload.json')
+            self.assertEqual(cache.render({}, json.loads), {'title': {'text': 'one'}})
+            self.write('{"title": {"text": "{{ name }}"}}', time.time() + 10)
+            self.assertEqual(cache.render({'name': 'two'}, json.loads), {'title': {'text': 'two'}})